@@ -0,0 +1,688 @@
+#!/usr/bin/env python3
+"""Benchmark the fleet dashboards against a simulated Glances fleet.
+
+A local fake Glances server (and a fake ``ssh`` answering coach stats) stands
+in for the fleet, with configurable latency, payload size, error rate and dead
+hosts. Each fleet size runs in its own process: it points the dashboard at a
+generated ``hosts.yaml`` served as one fleet of ``--profile``, drives
+``gather_hosts()`` through forced refresh cycles, then times the read endpoints
+in-process.
+
+    python dashboard_bench.py --profile coaches --hosts 10,100,1000
+    python dashboard_bench.py --hosts 100 --set parse_mode=stream
+    python dashboard_bench.py --hosts 100 --set fetch_mode=plugins
+    python dashboard_bench.py --hosts 100 --clients 1,10,50 --duration 10
+    python dashboard_bench.py --hosts 100 --output bench.json
+    python dashboard_bench.py --hosts 100 --baseline bench.json
+
+``--clients`` switches to a load test: the dashboard runs under uvicorn with its
+background poller while that many concurrent viewers cycle through the pages
+wall tablets and REST sensors request. The fake server counts upstream
+requests, so the report includes how many upstream fetches each viewer request
+caused, net of what the poller fetches on its own (measured over idle windows
+before and after the load).
+
+With ``--baseline`` the run exits non-zero when cycle p99, endpoint p99 or
+peak RSS regress by more than ``--max-regression``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import yaml
+
+REPO_DIR = Path(__file__).resolve().parent
+RESULT_MARKER = "BENCH_RESULT "
+ENDPOINTS = ("/", "/text", "/status", "/status?fields=metrics", "/fleet/summary", "/metrics")
+LOAD_ENDPOINTS = ("/", "/status", "/text", "/config")
+STATS_PATH = "/__bench/stats"
+COACH_STATS_JSON = json.dumps({
+    "coach": {"owner": "Bench", "number": 1, "year": 2024},
+    "updates": {"apt_pending": 3, "docker_pending": 1},
+})
+FAKE_SSH = """#!/bin/sh
+# Fake ssh for dashboard_bench.py: multiplexing no-ops plus canned coach stats.
+control=""
+for arg in "$@"; do
+  case "$arg" in ControlPath=*) control="${{arg#ControlPath=}}";; esac
+done
+case " $* " in
+  *" -O check "*) [ -e "$control" ] && exit 0; exit 255;;
+  *" -O exit "*) rm -f "$control"; exit 0;;
+  *" -N "*) : > "$control"; exit 0;;
+esac
+sleep {latency}
+roll=$(od -An -N2 -tu2 /dev/urandom | tr -d ' ')
+if [ "$roll" -lt {error_threshold} ]; then echo "bench: simulated failure" >&2; exit 1; fi
+printf '%s\\n' '{payload}'
+"""
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def raise_fd_limit() -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard != resource.RLIM_INFINITY else 65536
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def free_port() -> int:
+    """Return a local port with nothing listening on it."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# --- fake Glances server -------------------------------------------------------------
+
+
+def build_static_plugins(processes: int, mounts: int) -> Dict[str, bytes]:
+    """Pre-encode the plugins that do not change between requests."""
+    processlist = [
+        {
+            "pid": 1000 + index,
+            "name": f"worker-{index}",
+            "cmdline": ["/usr/bin/python3", "-m", f"service_{index}", "--verbose"],
+            "cpu_percent": round(random.uniform(0, 5), 2),
+            "memory_percent": round(random.uniform(0, 2), 2),
+            "memory_info": {"rss": random.randint(1 << 20, 1 << 27), "vms": 1 << 28},
+            "status": "S",
+            "username": "root",
+        }
+        for index in range(processes)
+    ]
+    fs = [
+        {"mnt_point": f"/mnt/disk{index}", "device_name": f"/dev/sd{index}", "percent": 30.0 + index}
+        for index in range(mounts)
+    ]
+    return {
+        "processlist": json.dumps(processlist).encode(),
+        "fs": json.dumps(fs).encode(),
+        "ip": json.dumps({"address": "10.0.0.2", "public_address": "198.51.100.7"}).encode(),
+        "wifi": json.dumps([{"ssid": "bench", "signal": -55}]).encode(),
+        "uptime": b'"3 days, 4:05:06"',
+    }
+
+
+def dynamic_plugins() -> Dict[str, bytes]:
+    return {
+        "cpu": json.dumps({"total": round(random.uniform(1, 99), 1)}).encode(),
+        "mem": json.dumps({
+            "percent": round(random.uniform(20, 90), 1), "used": 1 << 30, "total": 4 << 30
+        }).encode(),
+        "load": json.dumps({"min1": round(random.uniform(0, 4), 2)}).encode(),
+    }
+
+
+async def serve(args: argparse.Namespace) -> None:
+    static = build_static_plugins(args.processes, args.mounts)
+    latency = args.latency_ms / 1000
+    upstream = {"requests": 0}
+
+    def route(path: str) -> Tuple[int, bytes]:
+        plugin = path.split("?", 1)[0].rstrip("/").rsplit("/", 1)[-1]
+        if random.random() < args.error_rate:
+            return 500, b'{"error": "simulated"}'
+        if plugin == "status":
+            return 200, b'"Active"'
+        plugins = dynamic_plugins()
+        plugins.update(static)
+        if plugin == "all":
+            return 200, b"{" + b",".join(
+                json.dumps(name).encode() + b":" + value for name, value in plugins.items()
+            ) + b"}"
+        if plugin in plugins:
+            return 200, plugins[plugin]
+        return 404, b'{"error": "unknown plugin"}'
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                parts = request_line.split()
+                path = parts[1].decode() if len(parts) > 1 else "/"
+                if path == STATS_PATH:
+                    status, body = 200, json.dumps(upstream).encode()
+                else:
+                    upstream["requests"] += 1
+                    status, body = route(path)
+                if latency and path != STATS_PATH:
+                    await asyncio.sleep(random.uniform(1 - args.jitter, 1 + args.jitter) * latency)
+                writer.write(
+                    b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                    % (status, b"OK" if status == 200 else b"Error", len(body))
+                )
+                writer.write(body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # One listener per simulated host so every host is its own origin, as in a real fleet.
+    servers = [
+        await asyncio.start_server(handle, "127.0.0.1", args.port + index if args.port else 0)
+        for index in range(args.listeners)
+    ]
+    print(json.dumps([server.sockets[0].getsockname()[1] for server in servers]), flush=True)
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+# --- one fleet size ------------------------------------------------------------------
+
+
+def set_override(config: Dict[str, Any], assignment: str) -> None:
+    """Apply ``dotted.key=yaml`` to the generated hosts.yaml."""
+    key, _, raw = assignment.partition("=")
+    target = config
+    *parents, leaf = key.split(".")
+    for parent in parents:
+        target = target.setdefault(parent, {})
+    target[leaf] = yaml.safe_load(raw)
+
+
+def write_config(args: argparse.Namespace, ports: List[int], scratch: Path) -> Path:
+    # Nothing listens on this port, so dead hosts refuse connections straight away.
+    dead_port = free_port()
+    dead = set(random.Random(7).sample(range(args.hosts), int(args.hosts * args.dead)))
+    config: Dict[str, Any] = {
+        "default_api_version": 4,
+        "refresh_seconds": 60,
+        "timeout_seconds": args.timeout,
+        "scheduler": {"failure_threshold": 1_000_000},
+        "coach_stats": {
+            "enabled": args.coach_stats,
+            "command": "collect",
+            "timeout_seconds": args.timeout,
+            "control_dir": str(scratch / "mux"),
+            "ttl_seconds": {"default": 0},
+        },
+        "hosts": [
+            {
+                "name": f"Bench {index:04d}",
+                "url": f"http://127.0.0.1:{dead_port if index in dead else ports[index]}",
+            }
+            for index in range(args.hosts)
+        ],
+    }
+    for assignment in args.set:
+        set_override(config, assignment)
+    config_path = scratch / "hosts.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False))
+    return config_path
+
+
+def load_app() -> Any:
+    # Imported under its package name so shard workers (spawned processes) can import it too.
+    sys.path.insert(0, str(REPO_DIR))
+    return importlib.import_module("fleet_dashboard.app")
+
+
+async def drive_cycles(app: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    app.warm_templates()
+    cycle_seconds: List[float] = []
+    parse_seconds: List[float] = []
+    peak_buffer = 0
+    failed_polls = 0
+    for _ in range(args.cycles):
+        started = time.perf_counter()
+        snapshot = await app.refresh_snapshot(force=True)
+        cycle_seconds.append(time.perf_counter() - started)
+        failed_polls += sum(1 for _, payload in snapshot.results if "__error" in payload)
+        for _, payload in snapshot.results:
+            if "__parse_seconds" in payload:
+                parse_seconds.append(payload["__parse_seconds"])
+                peak_buffer = max(peak_buffer, payload.get("__peak_buffer_bytes") or 0)
+    pool = app.HTTP_POOL_STATS
+    connections = {"new": pool["new_connections"], "reused": pool["reused_connections"]}
+
+    endpoints: Dict[str, Dict[str, Any]] = {}
+    # ASGITransport skips the lifespan, so the background poller never competes with the timing.
+    transport = httpx.ASGITransport(app=app.APP)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ENDPOINTS:
+            timings: List[float] = []
+            size = 0
+            for _ in range(args.requests):
+                started = time.perf_counter()
+                response = await client.get(path)
+                timings.append(time.perf_counter() - started)
+                size = len(response.content)
+            endpoints[path] = {
+                "status": response.status_code,
+                "bytes": size,
+                "first_ms": round(timings[0] * 1000, 3),
+                "p50_ms": round(percentile(timings, 50) * 1000, 3),
+                "p99_ms": round(percentile(timings, 99) * 1000, 3),
+            }
+    await app.stop_shard_workers()
+    await app.close_http_client()
+    await app.close_ssh_masters()
+
+    total = sum(cycle_seconds)
+    return {
+        "mode": "cycles",
+        "hosts": args.hosts,
+        "cycles": args.cycles,
+        "cycle_p50_ms": round(percentile(cycle_seconds, 50) * 1000, 3),
+        "cycle_p99_ms": round(percentile(cycle_seconds, 99) * 1000, 3),
+        "cycle_max_ms": round(max(cycle_seconds) * 1000, 3),
+        "hosts_per_second": round(args.hosts * args.cycles / total, 1) if total else None,
+        "failed_polls": failed_polls,
+        # Per host fetch: time spent decoding /all and the largest body held for it.
+        "parse_p50_ms": round(percentile(parse_seconds, 50) * 1000, 3) if parse_seconds else None,
+        "parse_p99_ms": round(percentile(parse_seconds, 99) * 1000, 3) if parse_seconds else None,
+        "peak_buffer_kb": round(peak_buffer / 1024, 1),
+        "connections": connections,
+        "endpoints": endpoints,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+async def upstream_requests(stats_url: str) -> int:
+    async with httpx.AsyncClient() as client:
+        return (await client.get(stats_url)).json()["requests"]
+
+
+async def viewer(
+    base_url: str, offset: int, deadline: float, timings: Dict[str, List[float]], failures: List[str]
+) -> None:
+    """One wall tablet: its own connection, cycling through the pages until the deadline."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        index = offset
+        while time.perf_counter() < deadline:
+            path = LOAD_ENDPOINTS[index % len(LOAD_ENDPOINTS)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+            except httpx.HTTPError as exc:
+                failures.append(f"{path}: {type(exc).__name__}")
+                continue
+            timings[path].append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures.append(f"{path}: HTTP {response.status_code}")
+
+
+async def drive_load(
+    base_url: str, stats_url: str, clients: int, args: argparse.Namespace
+) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout * 4 + 60) as client:
+        # /status publishes the first snapshot; the warm-up lets the poller settle into its schedule.
+        await client.get("/status")
+    await asyncio.sleep(args.warmup)
+
+    async def idle_window() -> int:
+        before = await upstream_requests(stats_url)
+        await asyncio.sleep(args.duration)
+        return await upstream_requests(stats_url) - before
+
+    idle_upstream = await idle_window()
+    load_before = await upstream_requests(stats_url)
+
+    timings: Dict[str, List[float]] = {path: [] for path in LOAD_ENDPOINTS}
+    failures: List[str] = []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*(viewer(base_url, index, deadline, timings, failures) for index in range(clients)))
+    elapsed = time.perf_counter() - started
+    load_upstream = await upstream_requests(stats_url) - load_before
+    idle_upstream += await idle_window()
+    # What the poller fetches on its own over the load window, from the idle windows either side.
+    background = idle_upstream / (2 * args.duration) * elapsed
+
+    served = sum(len(values) for values in timings.values())
+    every = [value for values in timings.values() for value in values]
+    return {
+        "mode": "load",
+        "hosts": args.hosts,
+        "clients": clients,
+        "duration_seconds": round(elapsed, 3),
+        "requests": served,
+        "failures": len(failures),
+        "requests_per_second": round(served / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(every, 50) * 1000, 3) if every else None,
+        "p99_ms": round(percentile(every, 99) * 1000, 3) if every else None,
+        "endpoints": {
+            path: {
+                "requests": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 3) if values else None,
+                "p99_ms": round(percentile(values, 99) * 1000, 3) if values else None,
+            }
+            for path, values in timings.items()
+        },
+        "upstream_requests": load_upstream,
+        "background_upstream_requests": round(background, 1),
+        # Upstream fetches caused per viewer request, beyond what the poller does anyway.
+        "fan_out": round(max(0.0, load_upstream - background) / served, 4) if served else None,
+    }
+
+
+def wait_for_dashboard(base_url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"dashboard exited with status {process.returncode}")
+        try:
+            # /metrics never polls the fleet, so it answers as soon as the app is up.
+            if httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("dashboard did not start in time")
+
+
+def process_peak_rss_mb(pid: int) -> Optional[float]:
+    """Peak RSS of another process, where /proc exposes it."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def run_load(stats_url: str, clients: int, args: argparse.Namespace) -> Dict[str, Any]:
+    """Serve a fresh dashboard process under uvicorn and put ``clients`` viewers on it."""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    dashboard = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "fleet_dashboard.app:APP",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=REPO_DIR,
+    )
+    try:
+        wait_for_dashboard(base_url, dashboard)
+        result = asyncio.run(drive_load(base_url, stats_url, clients, args))
+        result["peak_rss_mb"] = process_peak_rss_mb(dashboard.pid)
+    finally:
+        dashboard.terminate()
+        dashboard.wait()
+    return result
+
+
+def run_scenario(args: argparse.Namespace) -> None:
+    raise_fd_limit()
+    with tempfile.TemporaryDirectory(prefix="dashboard-bench-") as tmp:
+        scratch = Path(tmp)
+        server = subprocess.Popen(
+            [
+                sys.executable, __file__, "serve",
+                "--latency-ms", str(args.latency_ms),
+                "--jitter", str(args.jitter),
+                "--error-rate", str(args.error_rate),
+                "--processes", str(args.processes),
+                "--mounts", str(args.mounts),
+                "--listeners", str(args.hosts),
+            ],
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        try:
+            ports = json.loads(server.stdout.readline())
+            # The store and SSH snippets land next to the config and under $HOME.
+            os.environ["FLEET_DASHBOARD_CONFIG"] = str(write_config(args, ports, scratch))
+            os.environ["FLEET_DASHBOARD_PROFILE"] = args.profile
+            fake_bin = scratch / "bin"
+            fake_bin.mkdir()
+            ssh = fake_bin / "ssh"
+            ssh.write_text(FAKE_SSH.format(
+                latency=args.ssh_latency_ms / 1000,
+                error_threshold=int(args.error_rate * 65536),
+                payload=COACH_STATS_JSON,
+            ))
+            ssh.chmod(0o755)
+            os.environ["HOME"] = str(scratch)
+            os.environ["PATH"] = f"{fake_bin}{os.pathsep}{os.environ.get('PATH', '')}"
+            if args.clients:
+                stats_url = f"http://127.0.0.1:{ports[0]}{STATS_PATH}"
+                results = [run_load(stats_url, clients, args) for clients in parse_sizes(args.clients)]
+            else:
+                results = [asyncio.run(drive_cycles(load_app(), args))]
+        finally:
+            server.terminate()
+            server.wait()
+    for result in results:
+        result["profile"] = args.profile
+        print(RESULT_MARKER + json.dumps(result), flush=True)
+
+
+# --- driver --------------------------------------------------------------------------
+
+
+def scenario_argv(args: argparse.Namespace, hosts: int) -> List[str]:
+    argv = [
+        sys.executable, __file__, "scenario",
+        "--profile", args.profile,
+        "--hosts", str(hosts),
+        "--cycles", str(args.cycles),
+        "--requests", str(args.requests),
+        "--latency-ms", str(args.latency_ms),
+        "--jitter", str(args.jitter),
+        "--ssh-latency-ms", str(args.ssh_latency_ms),
+        "--error-rate", str(args.error_rate),
+        "--dead", str(args.dead),
+        "--processes", str(args.processes),
+        "--mounts", str(args.mounts),
+        "--timeout", str(args.timeout),
+        "--clients", args.clients,
+        "--duration", str(args.duration),
+        "--warmup", str(args.warmup),
+    ]
+    if args.coach_stats:
+        argv.append("--coach-stats")
+    for assignment in args.set:
+        argv.extend(["--set", assignment])
+    return argv
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def result_key(entry: Dict[str, Any]) -> Tuple[Any, ...]:
+    return entry["profile"], entry.get("mode", "cycles"), entry["hosts"], entry.get("clients")
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], limit: float) -> List[str]:
+    """Return one message per metric that regressed by more than ``limit`` (a ratio)."""
+    previous = {result_key(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        before = previous.get(result_key(entry))
+        if before is None:
+            continue
+        # (label, now, then, higher_is_better)
+        if entry["mode"] == "load":
+            checks = [
+                ("p99_ms", entry["p99_ms"], before["p99_ms"], False),
+                ("requests_per_second", entry["requests_per_second"], before["requests_per_second"], True),
+                ("fan_out", entry["fan_out"], before["fan_out"], False),
+            ]
+        else:
+            checks = [("cycle_p99_ms", entry["cycle_p99_ms"], before["cycle_p99_ms"], False)]
+        checks.append(("peak_rss_mb", entry["peak_rss_mb"], before["peak_rss_mb"], False))
+        for path, stats in entry["endpoints"].items():
+            if path in before["endpoints"]:
+                checks.append((f"{path} p99_ms", stats["p99_ms"], before["endpoints"][path]["p99_ms"], False))
+        for label, now, then, higher_is_better in checks:
+            if now is None or then is None:
+                continue
+            if label == "fan_out":
+                # Already a per-request ratio and usually ~0, so compare it absolutely.
+                change = now - then
+            elif not then:
+                continue
+            elif higher_is_better:
+                change = then / now - 1 if now else float("inf")
+            else:
+                change = now / then - 1
+            if change > limit:
+                where = f"{entry['hosts']} hosts" + (f", {entry['clients']} clients" if entry.get("clients") else "")
+                delta = f"+{change:.2f} per request" if label == "fan_out" else f"+{change * 100:.0f}% worse"
+                regressions.append(f"{entry['profile']} @ {where}: {label} {then} -> {now} ({delta})")
+    return regressions
+
+
+def print_cycles_report(results: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'hosts':>6} {'cycle p50':>10} {'cycle p99':>10} {'hosts/s':>9} {'failed':>7} "
+        f"{'parse p50':>10} {'buffer KB':>10} {'new conn':>9} {'reused':>7} {'rss MB':>8}"
+    )
+    for entry in results:
+        connections = entry.get("connections") or {}
+        parse_p50 = entry.get("parse_p50_ms")
+        parse = f"{parse_p50:>8.3f}ms" if parse_p50 is not None else f"{'-':>10}"
+        print(
+            f"{entry['hosts']:>6} {entry['cycle_p50_ms']:>8.1f}ms {entry['cycle_p99_ms']:>8.1f}ms "
+            f"{entry['hosts_per_second']:>9} {entry['failed_polls']:>7} "
+            f"{parse} {entry.get('peak_buffer_kb', '-'):>10} "
+            f"{connections.get('new', '-'):>9} {connections.get('reused', '-'):>7} {entry['peak_rss_mb']:>8}"
+        )
+    for entry in results:
+        print(f"\n{entry['profile']} @ {entry['hosts']} hosts")
+        for path, stats in entry["endpoints"].items():
+            print(
+                f"  {path:<26} first {stats['first_ms']:>9.2f}ms  p50 {stats['p50_ms']:>8.2f}ms  "
+                f"p99 {stats['p99_ms']:>8.2f}ms  {stats['bytes']:>9} B"
+            )
+
+
+def print_load_report(results: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'hosts':>6} {'clients':>8} {'req/s':>9} {'p50':>10} {'p99':>10} "
+        f"{'failed':>7} {'upstream':>9} {'bg':>6} {'fan-out':>8} {'rss MB':>8}"
+    )
+    for entry in results:
+        print(
+            f"{entry['hosts']:>6} {entry['clients']:>8} {entry['requests_per_second']:>9} "
+            f"{entry['p50_ms']:>8.1f}ms {entry['p99_ms']:>8.1f}ms {entry['failures']:>7} "
+            f"{entry['upstream_requests']:>9} {entry['background_upstream_requests']:>6} "
+            f"{entry['fan_out']:>8} {entry['peak_rss_mb']:>8}"
+        )
+    for entry in results:
+        print(f"\n{entry['profile']} @ {entry['hosts']} hosts, {entry['clients']} clients")
+        for path, stats in entry["endpoints"].items():
+            print(f"  {path:<10} {stats['requests']:>7} req  p50 {stats['p50_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms")
+
+
+def run(args: argparse.Namespace) -> int:
+    results = []
+    for hosts in parse_sizes(args.hosts):
+        completed = subprocess.run(scenario_argv(args, hosts), capture_output=True, text=True)
+        lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_MARKER)]
+        if completed.returncode != 0 or not lines:
+            print(f"Scenario with {hosts} hosts failed:\n{completed.stderr[-4000:]}", file=sys.stderr)
+            return 2
+        results.extend(json.loads(line[len(RESULT_MARKER):]) for line in lines)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.clients:
+        print_load_report(results)
+    else:
+        print_cycles_report(results)
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.max_regression)
+        if regressions:
+            print("\nRegressions:", *regressions, sep="\n  ")
+            return 1
+        print(f"\nNo regressions beyond {args.max_regression:.0%} of {args.baseline}")
+    return 0
+
+
+def add_fleet_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Glances response latency")
+    parser.add_argument("--jitter", type=float, default=0.5, help="latency spread, as a fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered 500")
+    parser.add_argument("--processes", type=int, default=200, help="processlist entries per payload")
+    parser.add_argument("--mounts", type=int, default=4, help="filesystems per payload")
+
+
+def add_scenario_arguments(parser: argparse.ArgumentParser) -> None:
+    add_fleet_arguments(parser)
+    parser.add_argument("--profile", default="coaches", choices=("coaches", "raspberry"),
+                        help="fleet profile the generated hosts are served as")
+    parser.add_argument("--cycles", type=int, default=5, help="forced refresh cycles per size")
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint")
+    parser.add_argument("--dead", type=float, default=0.0, help="share of hosts refusing connections")
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout_seconds for the app")
+    parser.add_argument("--coach-stats", action="store_true", help="collect coach stats via fake ssh")
+    parser.add_argument("--ssh-latency-ms", type=float, default=50.0, help="fake ssh command latency")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=YAML",
+                        help="override a hosts.yaml setting, e.g. fetch_mode=plugins")
+    parser.add_argument("--clients", default="",
+                        help="comma-separated concurrent viewer counts; switches to a load test")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds per load window; the idle windows either side are as long")
+    parser.add_argument("--warmup", type=float, default=5.0,
+                        help="seconds to let the poller settle before measuring")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    subcommands = parser.add_subparsers(dest="command")
+    serve_parser = subcommands.add_parser("serve", help="run only the fake Glances server")
+    serve_parser.add_argument("--port", type=int, default=0, help="first port; 0 picks free ports")
+    serve_parser.add_argument("--listeners", type=int, default=1, help="ports to listen on, one per host")
+    add_fleet_arguments(serve_parser)
+    scenario_parser = subcommands.add_parser("scenario", help="benchmark one fleet size (internal)")
+    scenario_parser.add_argument("--hosts", type=int, required=True)
+    add_scenario_arguments(scenario_parser)
+    add_scenario_arguments(parser)
+    parser.add_argument("--hosts", default="10,100", help="comma-separated fleet sizes")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed slowdown before --baseline fails, as a ratio")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == "scenario":
+        run_scenario(args)
+        return 0
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,4661 @@
+#!/usr/bin/env python3
+"""Aggregate Glances REST data from fleets of Home Assistant coaches and Raspberry Pis."""
+
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+import shlex
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import deque
+from contextlib import asynccontextmanager, suppress
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote, urlparse, urlunparse
+
+import httpx
+import yaml
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from rich import box
+from rich.console import Console
+from rich.table import Table
+
+try:
+    import orjson
+except ImportError:  # optional: faster encoding of large /status bodies
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional: "br" content-encoding
+    brotli = None
+try:
+    import numpy as np
+except ImportError:  # optional: vectorised fleet aggregates
+    np = None
+
+BASE_DIR = Path(__file__).resolve().parent
+# fleets.yaml lists one hosts file per fleet; a plain hosts.yaml is served as a single fleet.
+CONFIG_PATH = Path(
+    os.environ.get("FLEET_DASHBOARD_CONFIG") or (BASE_DIR / "fleets.yaml")
+).expanduser().resolve()
+# Profile of that single fleet when CONFIG_PATH is a plain hosts.yaml.
+DEFAULT_PROFILE = os.environ.get("FLEET_DASHBOARD_PROFILE", "coaches")
+TEMPLATES_DIR = BASE_DIR / "templates"
+SSH_DIR = Path.home() / ".ssh"
+SSH_SNIPPET_PATH = SSH_DIR / "raspberry-dashboard"
+SSH_CONFIG_PATH = SSH_DIR / "config"
+SSH_INCLUDE_DIRECTIVE = f"Include {SSH_SNIPPET_PATH}"
+
+HOST_METADATA: Dict[str, Dict[str, Any]] = {}
+HOST_LOOKUP: Dict[str, Dict[str, Any]] = {}
+# Fleet name -> {"name", "profile", "hosts_file", "hosts": [host names]}, plus "upstream",
+# "refresh_seconds" and "timeout_seconds" for fleets pulled from a child dashboard.
+FLEETS: Dict[str, Dict[str, Any]] = {}
+# Fleet profile -> what its hosts get: card links and which SSH actions exist.
+PROFILES: Dict[str, Dict[str, bool]] = {
+    "coaches": {
+        "ha_link": True,
+        "update_aliases": False,
+        "restart": False,
+        "vnc": False,
+        # Reboots need remote_actions_enabled and, if set, remote_actions_token.
+        "guarded_actions": True,
+    },
+    "raspberry": {
+        "ha_link": False,
+        "update_aliases": True,
+        "restart": True,
+        "vnc": True,
+        "guarded_actions": False,
+    },
+    # Hosts pulled from a child dashboard's /status; read-only, actions stay on the child.
+    "federated": {
+        "ha_link": False,
+        "update_aliases": False,
+        "restart": False,
+        "vnc": False,
+        "guarded_actions": False,
+    },
+}
+# Fleet-level keys a hosts file may set -> the per-host key they default.
+FLEET_HOST_DEFAULTS: Dict[str, str] = {
+    "default_api_version": "api_version",
+    "refresh_seconds": "poll_seconds",
+    "fetch_mode": "fetch_mode",
+    "parse_mode": "parse_mode",
+    "remote_actions_enabled": "remote_actions_enabled",
+    "remote_actions_token": "remote_actions_token",
+    "remote_actions_timeout_seconds": "remote_actions_timeout_seconds",
+    "update_timeout_seconds": "update_timeout_seconds",
+}
+# Everything a hosts file listed in ``fleets`` may set; other keys are process-wide.
+FLEET_FILE_KEYS = frozenset({"hosts", "coach_stats", *FLEET_HOST_DEFAULTS})
+UPDATE_COMMAND = 'bash -lc "sudo apt update && sudo apt dist-upgrade -y && sudo apt autoremove -y && sudo apt clean"'
+REBOOT_COMMAND = "sudo reboot"
+RESTART_COMMAND = "sudo systemctl restart glances || sudo systemctl restart glances.service"
+LOGGER = logging.getLogger("fleet_dashboard")
+
+
+def derive_ha_dashboard_url(host_cfg: Dict[str, Any]) -> Optional[str]:
+    """Compute the Home Assistant dashboard URL for a host."""
+    if "ha_url" in host_cfg:
+        return host_cfg["ha_url"]
+
+    base_url = host_cfg.get("url")
+    if not base_url:
+        return None
+
+    parsed = urlparse(base_url)
+    hostname = parsed.hostname
+    if not hostname:
+        return None
+
+    try:
+        port = int(host_cfg.get("ha_port", 8123))
+    except (TypeError, ValueError):
+        port = 8123
+
+    scheme = parsed.scheme or "http"
+    netloc = f"{hostname}:{port}"
+    path = "/dashboard-remote/0"
+    return urlunparse((scheme, netloc, path, "", "", ""))
+
+
+def _resolve_ssh_target(host_cfg: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[int]]:
+    """Return (user, host, port) for SSH operations."""
+    if host_cfg.get("ssh_disabled"):
+        return None, None, None
+    ssh_user = host_cfg.get("ssh_user", "sayer")
+    ssh_host = host_cfg.get("ssh_host")
+    if not ssh_host:
+        parsed = urlparse(host_cfg.get("url", ""))
+        ssh_host = parsed.hostname
+    if not ssh_host:
+        return None, None, None
+    ssh_port = host_cfg.get("ssh_port")
+    try:
+        port_value = int(ssh_port) if ssh_port is not None else None
+    except (TypeError, ValueError):
+        port_value = None
+    return ssh_user, ssh_host, port_value
+
+
+def derive_ssh_url(
+    host_cfg: Dict[str, Any],
+    command: Optional[str] = None
+) -> Optional[str]:
+    """Build an ssh:// URL that macOS will route through Terminal.app."""
+    ssh_user, ssh_host, port_value = _resolve_ssh_target(host_cfg)
+    if not ssh_user or not ssh_host:
+        return None
+
+    netloc = f"{ssh_user}@{ssh_host}"
+    if port_value:
+        netloc = f"{netloc}:{port_value}"
+    path = ""
+    if command:
+        path = "/" + quote(command, safe="")
+    # macOS Terminal expects ssh://user@host[:port][/command]
+    return urlunparse(("ssh", netloc, path, "", "", ""))
+
+
+def derive_glances_url(host_cfg: Dict[str, Any]) -> Optional[str]:
+    """Compute the Glances web UI URL for a host."""
+    base_url = host_cfg.get("url")
+    if not base_url:
+        return None
+    parsed = urlparse(base_url)
+    hostname = parsed.hostname
+    if not hostname:
+        return None
+    try:
+        port = int(host_cfg.get("glances_port", parsed.port or 61208))
+    except (TypeError, ValueError):
+        port = parsed.port or 61208
+    scheme = parsed.scheme or "http"
+    netloc = f"{hostname}:{port}"
+    return urlunparse((scheme, netloc, "/", "", "", ""))
+
+
+def derive_vnc_url(host_cfg: Dict[str, Any]) -> Optional[str]:
+    """Compute the VNC URL for a host."""
+    if host_cfg.get("vnc_disabled"):
+        return None
+
+    vnc_host = host_cfg.get("vnc_host")
+    if not vnc_host:
+        _, ssh_host, _ = _resolve_ssh_target(host_cfg)
+        vnc_host = ssh_host
+    if not vnc_host:
+        parsed = urlparse(host_cfg.get("url", ""))
+        vnc_host = parsed.hostname
+    if not vnc_host:
+        return None
+
+    return urlunparse(("vnc", vnc_host, "", "", "", ""))
+
+
+def _slugify(value: str) -> str:
+    slug = re.sub(r"[^a-z0-9]+", "-", value.lower())
+    slug = slug.strip("-")
+    return slug or "host"
+
+
+def _sync_update_aliases(entries: List[Dict[str, Any]]) -> None:
+    """Write/update the SSH config snippet used for update buttons."""
+    try:
+        SSH_DIR.mkdir(mode=0o700, exist_ok=True)
+    except OSError:
+        return
+
+    lines: List[str] = [
+        "# Autogenerated by Raspberry Fleet Dashboard. Do not edit.",
+        "# Edit hosts.yaml instead."
+    ]
+    if entries:
+        for entry in entries:
+            lines.extend([
+                "",
+                f"# Remote update command for {entry['label']}",
+                f"Host {entry['alias']}",
+                f"  HostName {entry['host']}",
+                f"  User {entry['user']}",
+                "  RequestTTY force",
+                f"  RemoteCommand {entry['command']}",
+            ])
+            if entry.get("port"):
+                lines.append(f"  Port {entry['port']}")
+            lines.append("  PermitLocalCommand no")
+    else:
+        lines.append("")
+
+    content = "\n".join(lines) + "\n"
+    try:
+        unchanged = SSH_SNIPPET_PATH.read_text(encoding="utf-8") == content
+    except OSError:
+        unchanged = False
+    if not unchanged:
+        # Reloads rewrite the snippet only when an alias actually changed.
+        try:
+            SSH_SNIPPET_PATH.write_text(content, encoding="utf-8")
+            os.chmod(SSH_SNIPPET_PATH, 0o600)
+        except OSError:
+            return
+
+    _ensure_ssh_include_directive()
+
+
+def _ensure_ssh_include_directive() -> None:
+    """Ensure ~/.ssh/config includes the raspberry alias snippet."""
+    try:
+        SSH_DIR.mkdir(mode=0o700, exist_ok=True)
+    except OSError:
+        return
+
+    if SSH_CONFIG_PATH.exists():
+        try:
+            content = SSH_CONFIG_PATH.read_text(encoding="utf-8")
+        except OSError:
+            return
+        if SSH_INCLUDE_DIRECTIVE in content:
+            return
+        updated = content
+        if not updated.endswith("\n"):
+            updated += "\n"
+        updated += f"\n{SSH_INCLUDE_DIRECTIVE}\n"
+    else:
+        updated = f"{SSH_INCLUDE_DIRECTIVE}\n"
+
+    try:
+        SSH_CONFIG_PATH.write_text(updated, encoding="utf-8")
+        os.chmod(SSH_CONFIG_PATH, 0o600)
+    except OSError:
+        return
+
+
+def _read_yaml(path: Path) -> Dict[str, Any]:
+    with path.open("r", encoding="utf-8") as handle:
+        data = yaml.safe_load(handle)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path.name} must be a mapping of settings.")
+    return data
+
+
+def _fleet_specs(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Validate the ``fleets`` list, or describe CONFIG_PATH itself as one fleet."""
+    if "fleets" not in config:
+        if "hosts" not in config:
+            raise ValueError(f"{CONFIG_PATH.name} must define a 'fleets' or 'hosts' list.")
+        return [{"name": DEFAULT_PROFILE, "profile": DEFAULT_PROFILE, "hosts_file": None}]
+    fleets = config["fleets"]
+    if not isinstance(fleets, list) or not fleets:
+        raise ValueError("'fleets' must be a non-empty list of fleet definitions.")
+    specs: List[Dict[str, Any]] = []
+    for index, fleet_cfg in enumerate(fleets):
+        if not isinstance(fleet_cfg, dict):
+            raise ValueError(f"fleets[{index}] must be a mapping of fleet settings.")
+        upstream = fleet_cfg.get("upstream")
+        if upstream is not None:
+            name = _slugify(str(fleet_cfg.get("name") or ""))
+            if not name:
+                raise ValueError(f"fleets[{index}] needs a 'name' to go with its 'upstream'.")
+            if any(spec["name"] == name for spec in specs):
+                raise ValueError(f"Duplicate fleet name detected: '{name}'. Fleet names must be unique.")
+            if not isinstance(upstream, str) or not upstream.strip().startswith(("http://", "https://")):
+                raise ValueError(f"Fleet '{name}' has an invalid 'upstream'; use the child dashboard's http(s) URL.")
+            specs.append({
+                "name": name,
+                "profile": "federated",
+                "hosts_file": None,
+                "upstream": upstream.strip().rstrip("/"),
+                "refresh_seconds": fleet_cfg.get("refresh_seconds"),
+                "timeout_seconds": fleet_cfg.get("timeout_seconds"),
+            })
+            continue
+        profile = fleet_cfg.get("profile", DEFAULT_PROFILE)
+        if profile not in PROFILES or profile == "federated":
+            raise ValueError(
+                f"fleets[{index}] has unknown profile '{profile}'. "
+                f"Choose from: {', '.join(name for name in PROFILES if name != 'federated')}"
+            )
+        name = _slugify(str(fleet_cfg.get("name") or profile))
+        if any(spec["name"] == name for spec in specs):
+            raise ValueError(f"Duplicate fleet name detected: '{name}'. Fleet names must be unique.")
+        hosts_file = fleet_cfg.get("hosts_file")
+        if not isinstance(hosts_file, str) or not hosts_file.strip():
+            raise ValueError(f"Fleet '{name}' is missing a valid 'hosts_file'.")
+        specs.append({
+            "name": name,
+            "profile": profile,
+            "hosts_file": str((CONFIG_PATH.parent / hosts_file.strip()).expanduser().resolve()),
+        })
+    return specs
+
+
+def _apply_fleet_defaults(host_cfg: Dict[str, Any], fleet_cfg: Dict[str, Any]) -> None:
+    """Give a host the fleet-level settings from its hosts file unless it sets its own."""
+    for fleet_key, host_key in FLEET_HOST_DEFAULTS.items():
+        if fleet_key in fleet_cfg:
+            host_cfg.setdefault(host_key, fleet_cfg[fleet_key])
+    stats_cfg = fleet_cfg.get("coach_stats")
+    if isinstance(stats_cfg, dict):
+        merged = {**stats_cfg, "enabled": bool(stats_cfg.get("enabled", bool(stats_cfg)))}
+        override = host_cfg.get("coach_stats")
+        if isinstance(override, dict):
+            merged.update(override)
+        host_cfg["coach_stats"] = merged
+
+
+def parse_config() -> Tuple[
+    Dict[str, Any],
+    Dict[str, Dict[str, Any]],
+    Dict[str, Dict[str, Any]],
+    Dict[str, Dict[str, Any]],
+    Optional[List[Dict[str, Any]]],
+]:
+    """Read the config and every hosts file it lists.
+
+    Returns (config, slug lookup, per-host metadata, fleets, SSH update
+    aliases); the aliases are None when no fleet uses them. ``config["hosts"]``
+    holds the hosts of every fleet, each tagged with ``__fleet``/``__profile``.
+    """
+    config = _read_yaml(CONFIG_PATH)
+    lookup: Dict[str, Dict[str, Any]] = {}
+    host_metadata: Dict[str, Dict[str, Any]] = {}
+    fleets: Dict[str, Dict[str, Any]] = {}
+    update_alias_specs: Optional[List[Dict[str, Any]]] = None
+    all_hosts: List[Dict[str, Any]] = []
+    seen_names: set[str] = set()
+    for spec in _fleet_specs(config):
+        fleet_name = spec["name"]
+        profile = PROFILES[spec["profile"]]
+        if spec.get("upstream"):
+            # Filled in from the child's /status by the federation pullers.
+            fleets[fleet_name] = {**spec, "hosts": []}
+            continue
+        if spec["hosts_file"] is None:
+            fleet_cfg, where = config, ""
+        else:
+            hosts_path = Path(spec["hosts_file"])
+            fleet_cfg, where = _read_yaml(hosts_path), f"{hosts_path.name}: "
+            for key in sorted(str(key) for key in fleet_cfg if key not in FLEET_FILE_KEYS):
+                LOGGER.warning(
+                    "%s'%s' is ignored in a fleet's hosts file; set it in %s to apply it",
+                    where, key, CONFIG_PATH.name,
+                )
+        hosts = fleet_cfg.get("hosts")
+        if not isinstance(hosts, list):
+            raise ValueError(f"{where}'hosts' must be a list of host definitions.")
+        if profile["update_aliases"] and update_alias_specs is None:
+            update_alias_specs = []
+        fleets[fleet_name] = {**spec, "hosts": []}
+        for index, host_cfg in enumerate(hosts):
+            if not isinstance(host_cfg, dict):
+                raise ValueError(f"{where}hosts[{index}] must be a mapping of host settings.")
+            raw_name = host_cfg.get("name")
+            if not isinstance(raw_name, str) or not raw_name.strip():
+                raise ValueError(f"{where}hosts[{index}] is missing a valid 'name'.")
+            name = raw_name.strip()
+            if name in seen_names:
+                raise ValueError(f"Duplicate host name detected: '{name}'. Host names must be unique.")
+            seen_names.add(name)
+            raw_url = host_cfg.get("url")
+            if not isinstance(raw_url, str) or not raw_url.strip():
+                raise ValueError(f"Host '{name}' is missing a valid 'url'.")
+            host_cfg["name"] = name
+            host_cfg["url"] = raw_url.strip()
+            if spec["hosts_file"] is not None:
+                _apply_fleet_defaults(host_cfg, fleet_cfg)
+            host_cfg["__fleet"] = fleet_name
+            host_cfg["__profile"] = spec["profile"]
+            slug = _slugify(name)
+            metadata: Dict[str, Any] = {"slug": slug, "fleet": fleet_name, "profile": spec["profile"]}
+            if profile["ha_link"]:
+                ha_url = derive_ha_dashboard_url(host_cfg)
+                if ha_url:
+                    metadata["ha_dashboard_url"] = ha_url
+            if profile["restart"]:
+                metadata["restart_allowed"] = not bool(host_cfg.get("restart_disabled"))
+            ssh_url = derive_ssh_url(host_cfg)
+            if ssh_url:
+                metadata["ssh_url"] = ssh_url
+            if profile["update_aliases"] and not host_cfg.get("update_disabled"):
+                ssh_user, ssh_host, ssh_port = _resolve_ssh_target(host_cfg)
+                if ssh_user and ssh_host:
+                    alias = f"raspberry-update-{slug}"
+                    metadata["update_url"] = f"ssh://{alias}"
+                    update_alias_specs.append({
+                        "alias": alias,
+                        "host": ssh_host,
+                        "user": ssh_user,
+                        "port": ssh_port,
+                        "command": host_cfg.get("update_command", UPDATE_COMMAND),
+                        "label": name,
+                    })
+            glances_url = derive_glances_url(host_cfg)
+            if glances_url:
+                metadata["glances_url"] = glances_url
+            if profile["vnc"]:
+                vnc_url = derive_vnc_url(host_cfg)
+                if vnc_url:
+                    metadata["vnc_url"] = vnc_url
+            host_cfg["__meta"] = metadata
+            lookup[slug] = host_cfg
+            host_metadata[name] = metadata
+            fleets[fleet_name]["hosts"].append(name)
+            all_hosts.append(host_cfg)
+    config["hosts"] = all_hosts
+    return config, lookup, host_metadata, fleets, update_alias_specs
+
+
+def load_config() -> Dict[str, Any]:
+    """Load the dashboard configuration and every fleet's hosts file."""
+    config, lookup, host_metadata, fleets, update_alias_specs = parse_config()
+    HOST_LOOKUP.clear()
+    HOST_LOOKUP.update(lookup)
+    HOST_METADATA.clear()
+    HOST_METADATA.update(host_metadata)
+    FLEETS.clear()
+    FLEETS.update(fleets)
+    if update_alias_specs is not None:
+        _sync_update_aliases(update_alias_specs)
+    return config
+
+
+def _config_stamp() -> Tuple[Optional[Tuple[int, int]], ...]:
+    """Modification time and size of the config and each hosts file (None if unreadable)."""
+    paths = [CONFIG_PATH] + [
+        Path(fleet["hosts_file"]) for fleet in FLEETS.values() if fleet["hosts_file"] is not None
+    ]
+    stamps: List[Optional[Tuple[int, int]]] = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            stamps.append(None)
+            continue
+        stamps.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stamps)
+
+
+CONFIG = load_config()
+_CONFIG_STAMP = _config_stamp()
+DEFAULT_API_VERSION = int(CONFIG.get("default_api_version", 3))
+REFRESH_SECONDS = int(CONFIG.get("refresh_seconds", 10))
+TIMEOUT_SECONDS = float(CONFIG.get("timeout_seconds", 3))
+COACH_STATS_CONFIG: Dict[str, Any] = CONFIG.get("coach_stats", {}) or {}
+COACH_STATS_DEFAULT_TIMEOUT = float(COACH_STATS_CONFIG.get("timeout_seconds", 5))
+COACH_STATS_ENABLED = bool(COACH_STATS_CONFIG.get("enabled", bool(COACH_STATS_CONFIG)))
+# Data class (top-level key of the coach stats JSON) -> seconds a collected value stays fresh.
+# Pending apt/docker counts always have a TTL, so they are re-collected even
+# when the configured classes never expire.
+COACH_STATS_DEFAULT_TTLS: Dict[str, float] = {"updates": 3600.0}
+COACH_STATS_TTLS: Dict[str, float] = {
+    **COACH_STATS_DEFAULT_TTLS,
+    **{
+        str(key): float(value)
+        for key, value in (COACH_STATS_CONFIG.get("ttl_seconds") or {}).items()
+    },
+}
+COACH_STATS_MULTIPLEX = bool(COACH_STATS_CONFIG.get("multiplex", True))
+COACH_STATS_CONTROL_DIR = Path(
+    COACH_STATS_CONFIG.get("control_dir") or (SSH_DIR / "fleet-dashboard-mux")
+).expanduser()
+COACH_STATS_CONTROL_PERSIST_SECONDS = int(
+    COACH_STATS_CONFIG.get("control_persist_seconds", max(300, 2 * REFRESH_SECONDS))
+)
+REMOTE_ACTIONS_ENABLED = bool(CONFIG.get("remote_actions_enabled", False))
+REMOTE_ACTIONS_TOKEN = str(CONFIG.get("remote_actions_token", "") or "").strip() or None
+REMOTE_ACTIONS_TIMEOUT_SECONDS = float(CONFIG.get("remote_actions_timeout_seconds", 15))
+UPDATES_CONFIG: Dict[str, Any] = CONFIG.get("updates", {}) or {}
+# Hosts updating at once, and hosts per wave after the canary wave.
+UPDATE_CONCURRENCY = max(1, int(UPDATES_CONFIG.get("concurrency", 4)))
+UPDATE_WAVE_SIZE = max(1, int(UPDATES_CONFIG.get("wave_size", 2 * UPDATE_CONCURRENCY)))
+# Size of the first wave when no host sets update_canary: true.
+UPDATE_CANARY_HOSTS = max(0, int(UPDATES_CONFIG.get("canary_hosts", 1)))
+# apt dist-upgrade takes minutes, far past remote_actions_timeout_seconds.
+UPDATE_HOST_TIMEOUT_SECONDS = float(UPDATES_CONFIG.get("host_timeout_seconds", 900))
+# Stop before the next wave once more than this share of the attempted hosts failed.
+UPDATE_ABORT_FAILURE_RATIO = float(UPDATES_CONFIG.get("abort_failure_ratio", 0.25))
+HTTP_CONFIG: Dict[str, Any] = CONFIG.get("http", {}) or {}
+HTTP2_ENABLED = bool(HTTP_CONFIG.get("http2", False))
+# Per-plugin requests in flight for one host in "plugins" fetch mode.
+PLUGIN_CONCURRENCY = max(1, int(CONFIG.get("plugin_concurrency", 2)))
+
+
+def http_pool_limits(host_count: int) -> Tuple[int, int]:
+    """(max connections, max keep-alive connections) for a fleet of ``host_count`` hosts.
+
+    The default leaves room for every host's plugin requests at once (plus
+    probes and upstream pulls), so a poll cycle reuses pooled connections
+    instead of closing and reopening them.
+    """
+    max_connections = int(HTTP_CONFIG.get("max_connections", max(10, host_count * PLUGIN_CONCURRENCY + 10)))
+    return max_connections, int(HTTP_CONFIG.get("max_keepalive_connections", max_connections))
+
+
+HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS = http_pool_limits(len(CONFIG["hosts"]))
+# Keep idle connections around long enough to survive the gap between polls.
+HTTP_KEEPALIVE_EXPIRY = float(
+    HTTP_CONFIG.get("keepalive_expiry_seconds", REFRESH_SECONDS + TIMEOUT_SECONDS)
+)
+FETCH_MODE = str(CONFIG.get("fetch_mode", "full")).strip().lower()
+# "stream" scans /all bodies incrementally and decodes only the plugins in PLUGIN_TTLS.
+PARSE_MODE = str(CONFIG.get("parse_mode", "buffered")).strip().lower()
+# Glances plugins consumed by extract_metrics() -> seconds a fetched value stays fresh.
+DEFAULT_PLUGIN_TTLS: Dict[str, float] = {
+    "cpu": 0,
+    "mem": 0,
+    "load": 0,
+    "uptime": 0,
+    "wifi": 0,
+    "ip": 300,
+    "fs": 300,
+}
+_plugins_cfg = CONFIG.get("plugins")
+if isinstance(_plugins_cfg, dict):
+    PLUGIN_TTLS: Dict[str, float] = {
+        str(plugin): float(ttl or 0) for plugin, ttl in _plugins_cfg.items()
+    }
+elif isinstance(_plugins_cfg, list):
+    PLUGIN_TTLS = {str(plugin): 0.0 for plugin in _plugins_cfg}
+else:
+    PLUGIN_TTLS = dict(DEFAULT_PLUGIN_TTLS)
+# "full" keeps every fetched plugin; "dashboard" drops those outside PLUGIN_TTLS.
+PAYLOAD_RETENTION = str(CONFIG.get("payload_retention", "full")).strip().lower()
+STREAM_KEEPALIVE_SECONDS = float(CONFIG.get("stream_keepalive_seconds", 15))
+COMPRESSION_CONFIG: Dict[str, Any] = CONFIG.get("compression", {}) or {}
+COMPRESSION_MIN_BYTES = int(COMPRESSION_CONFIG.get("min_bytes", 1024))
+COMPRESSION_GZIP_LEVEL = int(COMPRESSION_CONFIG.get("gzip_level", 6))
+COMPRESSION_BROTLI_QUALITY = int(COMPRESSION_CONFIG.get("brotli_quality", 5))
+HISTORY_CONFIG: Dict[str, Any] = CONFIG.get("history", {}) or {}
+HISTORY_DEPTH = max(1, int(HISTORY_CONFIG.get("depth", 1440)))
+DEBUG_CONFIG: Dict[str, Any] = CONFIG.get("debug", {}) or {}
+DEBUG_TIMINGS_DEPTH = max(1, int(DEBUG_CONFIG.get("timings_depth", 20)))
+LOOP_LAG_INTERVAL_SECONDS = float(DEBUG_CONFIG.get("loop_lag_interval_seconds", 0.5))
+LOOP_LAG_SAMPLES_DEPTH = max(1, int(DEBUG_CONFIG.get("loop_lag_samples", 120)))
+FLEET_CONFIG: Dict[str, Any] = CONFIG.get("fleet", {}) or {}
+FLEET_TOP_N = max(0, int(FLEET_CONFIG.get("top_n", 3)))
+# Fleet column -> threshold; hosts above it (below it for wifi) count as offenders.
+FLEET_THRESHOLDS: Dict[str, float] = {
+    str(column): float(value)
+    for column, value in (FLEET_CONFIG.get("thresholds") or {"cpu": 90, "mem": 90, "disk": 85}).items()
+}
+STORE_CONFIG: Dict[str, Any] = CONFIG.get("store", {}) or {}
+STORE_ENABLED = bool(STORE_CONFIG.get("enabled", bool(STORE_CONFIG)))
+STORE_PATH = Path(STORE_CONFIG.get("path", "metrics.sqlite3")).expanduser()
+if not STORE_PATH.is_absolute():
+    STORE_PATH = CONFIG_PATH.parent / STORE_PATH
+STORE_FLUSH_SECONDS = float(STORE_CONFIG.get("flush_seconds", 60))
+_store_retention_days: Dict[str, Any] = STORE_CONFIG.get("retention_days", {}) or {}
+# (tier name, bucket seconds, retention seconds); bucket 0 keeps raw samples.
+STORE_TIERS: List[Tuple[str, int, float]] = [
+    ("raw", 0, float(_store_retention_days.get("raw", 1)) * 86400),
+    ("5m", 300, float(_store_retention_days.get("5m", 30)) * 86400),
+    ("1h", 3600, float(_store_retention_days.get("1h", 365)) * 86400),
+]
+SCHEDULER_CONFIG: Dict[str, Any] = CONFIG.get("scheduler", {}) or {}
+SCHEDULER_BACKOFF_BASE_SECONDS = float(SCHEDULER_CONFIG.get("backoff_base_seconds", 30))
+SCHEDULER_BACKOFF_MAX_SECONDS = float(
+    SCHEDULER_CONFIG.get("backoff_max_seconds", max(REFRESH_SECONDS, 1800))
+)
+SCHEDULER_FAILURE_THRESHOLD = max(1, int(SCHEDULER_CONFIG.get("failure_threshold", 2)))
+SCHEDULER_PROBE_TIMEOUT_SECONDS = float(
+    SCHEDULER_CONFIG.get("probe_timeout_seconds", min(2.0, TIMEOUT_SECONDS))
+)
+SHARDS_CONFIG: Dict[str, Any] = CONFIG.get("shards", {}) or {}
+# Poller processes the hosts are split across; 0 polls on the web process's own event loop.
+SHARD_WORKERS = max(0, int(SHARDS_CONFIG.get("workers", 0)))
+RELOAD_CONFIG: Dict[str, Any] = CONFIG.get("reload", {}) or {}
+# Watch hosts.yaml and reconcile the host list without a restart.
+RELOAD_WATCH = bool(RELOAD_CONFIG.get("watch", False))
+RELOAD_INTERVAL_SECONDS = max(0.1, float(RELOAD_CONFIG.get("interval_seconds", 2)))
+
+ENV = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    autoescape=select_autoescape(["html", "xml"])
+)
+
+
+def warm_templates() -> None:
+    """Compile the Jinja templates up front so the first page view is not slow."""
+    for template_name in ("dashboard.html", "host_card.html"):
+        ENV.get_template(template_name)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """Run the background fleet poller for the lifetime of the app."""
+    warm_templates()
+    if STORE_ENABLED:
+        await open_store()
+    poller = asyncio.create_task(_poll_forever())
+    flusher = asyncio.create_task(_flush_store_forever()) if STORE is not None else None
+    lag_sampler = asyncio.create_task(_sample_loop_lag()) if LOOP_LAG_INTERVAL_SECONDS > 0 else None
+    watcher = asyncio.create_task(_watch_config_forever()) if RELOAD_WATCH else None
+    await start_federation()
+    try:
+        yield
+    finally:
+        await stop_federation()
+        for task in (poller, flusher, lag_sampler, watcher):
+            if task is None:
+                continue
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await cancel_update_run()
+        await stop_shard_workers()
+        await close_http_client()
+        await close_ssh_masters()
+        await close_store()
+
+
+APP = FastAPI(title="Glances Fleet Dashboard", lifespan=lifespan)
+
+
+def build_endpoint(host_cfg: Dict[str, Any]) -> str:
+    """Build the base API endpoint for a host."""
+    base_url = host_cfg["url"].rstrip("/")
+    api_version = host_cfg.get("api_version", DEFAULT_API_VERSION)
+    return f"{base_url}/api/{api_version}"
+
+
+def _coach_stats_allowed(host_cfg: Dict[str, Any]) -> bool:
+    # A fleet's own coach_stats section (merged into its hosts) decides for that fleet.
+    override = host_cfg.get("coach_stats")
+    if isinstance(override, dict) and "enabled" in override:
+        return bool(override["enabled"])
+    return COACH_STATS_ENABLED
+
+
+def _merge_coach_stats_config(host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    cfg: Dict[str, Any] = {}
+    if isinstance(COACH_STATS_CONFIG, dict):
+        cfg.update(COACH_STATS_CONFIG)
+    override = host_cfg.get("coach_stats")
+    if isinstance(override, dict):
+        cfg.update(override)
+    return cfg
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per tuple of label values."""
+
+    __slots__ = ("name", "help", "labels", "buckets", "series")
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    ) -> None:
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = buckets
+        # Label values -> [per-bucket counts..., +Inf count, sum].
+        self.series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in self.series.items():
+            labels = list(zip(self.labels, label_values))
+            for bound, count in zip(self.buckets, series):
+                lines.append(_metric_line(f"{self.name}_bucket", labels + [("le", f"{bound:g}")], count))
+            lines.append(_metric_line(f"{self.name}_bucket", labels + [("le", "+Inf")], series[-2]))
+            lines.append(_metric_line(f"{self.name}_count", labels, series[-2]))
+            lines.append(_metric_line(f"{self.name}_sum", labels, series[-1]))
+        return lines
+
+
+def _metric_line(name: str, labels: Iterable[Tuple[str, str]], value: float) -> str:
+    rendered = ",".join(
+        '{}="{}"'.format(
+            key, str(label).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        )
+        for key, label in labels
+    )
+    number = str(value) if isinstance(value, int) else repr(float(value))
+    return f"{name}{{{rendered}}} {number}" if rendered else f"{name} {number}"
+
+
+FETCH_SECONDS = Histogram(
+    "fleet_fetch_seconds", "Time to fetch one host's Glances stats.", ("host",)
+)
+COACH_STATS_SECONDS = Histogram(
+    "fleet_coach_stats_seconds", "Time to collect coach stats over SSH.", ("host",)
+)
+REFRESH_CYCLE_SECONDS = Histogram(
+    "fleet_refresh_cycle_seconds", "Time to poll the due hosts and publish a snapshot."
+)
+# (host, source, error type) -> count; source is glances, probe or coach_stats.
+ERROR_COUNTS: Dict[Tuple[str, str, str], int] = {}
+
+
+def count_error(host_name: str, source: str, error_type: str) -> None:
+    key = (host_name, source, error_type)
+    ERROR_COUNTS[key] = ERROR_COUNTS.get(key, 0) + 1
+
+
+class HostTrace:
+    """Timed spans of one host poll, as offsets from the moment the poll started."""
+
+    __slots__ = ("started", "started_at", "version", "spans")
+
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.started_at = time.time()
+        # Snapshot version the poll was published in; None until then.
+        self.version: Optional[int] = None
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def add(self, name: str, start: float, end: float) -> None:
+        self.spans.append((name, start - self.started, end - start))
+
+    def as_dict(self) -> Dict[str, Any]:
+        spans = sorted(self.spans, key=lambda span: span[1])
+        return {
+            "version": self.version,
+            "started_at": self.started_at,
+            "total_seconds": round(max((o + d for _, o, d in spans), default=0.0), 6),
+            "spans": [
+                {"name": name, "offset": round(offset, 6), "duration": round(duration, 6)}
+                for name, offset, duration in spans
+            ],
+        }
+
+
+# Host name -> traces of its last DEBUG_TIMINGS_DEPTH polls.
+HOST_TRACES: Dict[str, deque] = {}
+CYCLE_TIMINGS: deque = deque(maxlen=DEBUG_TIMINGS_DEPTH)
+RENDER_TIMINGS: deque = deque(maxlen=DEBUG_TIMINGS_DEPTH)
+# (wall time, seconds the event loop woke up late).
+LOOP_LAG_SAMPLES: deque = deque(maxlen=LOOP_LAG_SAMPLES_DEPTH)
+LOOP_LAG_SECONDS = Histogram(
+    "fleet_event_loop_lag_seconds",
+    "How late the event loop woke a sleeping task.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+# Set for the duration of a host poll so nested fetches can add spans without plumbing.
+_CURRENT_TRACE: ContextVar[Optional[HostTrace]] = ContextVar("current_trace", default=None)
+
+
+def record_span(name: str, start: float, end: Optional[float] = None) -> None:
+    """Add a span to the poll trace of the current task, if there is one."""
+    trace = _CURRENT_TRACE.get()
+    if trace is not None:
+        trace.add(name, start, time.monotonic() if end is None else end)
+
+
+async def _sample_loop_lag() -> None:
+    """Sleep on a fixed interval and record how late each wake-up was."""
+    while True:
+        expected = time.monotonic() + LOOP_LAG_INTERVAL_SECONDS
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.monotonic() - expected)
+        LOOP_LAG_SAMPLES.append((time.time(), lag))
+        LOOP_LAG_SECONDS.observe(lag)
+
+
+SSH_POOL_STATS: Dict[str, int] = {
+    "commands": 0,
+    "sessions_opened": 0,
+    "sessions_reused": 0,
+    "session_failures": 0,
+}
+# Control socket path -> ssh argv prefix and target needed to shut the master down.
+_SSH_MASTERS: Dict[str, Tuple[List[str], str]] = {}
+
+
+def _ssh_control_path(target: str, port: int) -> Path:
+    # Hash the target so the socket path stays under the unix socket length limit.
+    digest = hashlib.sha1(f"{target}:{port}".encode("utf-8")).hexdigest()[:16]
+    return COACH_STATS_CONTROL_DIR / digest
+
+
+async def _ensure_ssh_master(
+    base_cmd: List[str],
+    target: str,
+    control_path: Path,
+    timeout_seconds: float
+) -> Tuple[bool, Optional[float]]:
+    """Make sure a ControlMaster session is up; return (reused, connect_seconds)."""
+    if control_path.exists():
+        check = await asyncio.create_subprocess_exec(
+            *base_cmd, "-O", "check", target,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        try:
+            returncode = await asyncio.wait_for(check.wait(), timeout_seconds)
+        except asyncio.TimeoutError:
+            check.kill()
+            returncode = None
+        if returncode == 0:
+            SSH_POOL_STATS["sessions_reused"] += 1
+            return True, None
+        # A socket without a live master would make the new master refuse to bind.
+        with suppress(OSError):
+            control_path.unlink()
+
+    try:
+        COACH_STATS_CONTROL_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    except OSError:
+        SSH_POOL_STATS["session_failures"] += 1
+        return False, None
+
+    started = time.monotonic()
+    # -f backgrounds ssh once it is authenticated, so the wait below measures
+    # the handshake only; stdio goes to /dev/null so the master never holds our pipes.
+    master = await asyncio.create_subprocess_exec(
+        *base_cmd,
+        "-o", "ControlMaster=yes",
+        "-o", f"ControlPersist={COACH_STATS_CONTROL_PERSIST_SECONDS}",
+        "-o", "ServerAliveInterval=30",
+        "-o", "ServerAliveCountMax=3",
+        "-N", "-f", target,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        returncode = await asyncio.wait_for(master.wait(), timeout_seconds)
+    except asyncio.TimeoutError:
+        master.kill()
+        returncode = None
+    connect_seconds = time.monotonic() - started
+    if returncode == 0:
+        SSH_POOL_STATS["sessions_opened"] += 1
+        _SSH_MASTERS[str(control_path)] = (list(base_cmd), target)
+    else:
+        SSH_POOL_STATS["session_failures"] += 1
+    return False, connect_seconds
+
+
+async def close_ssh_masters() -> None:
+    """Ask every ControlMaster session started by this process to exit."""
+    masters = list(_SSH_MASTERS.values())
+    _SSH_MASTERS.clear()
+    for base_cmd, target in masters:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *base_cmd, "-O", "exit", target,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            await asyncio.wait_for(process.wait(), 5)
+        except Exception:  # pragma: no cover - best effort cleanup
+            continue
+
+
+# Fixed error_type label values for coach stats failures, set where each one is raised.
+COACH_STATS_ERROR_TYPES = ("timeout", "ssh", "exit", "parse", "other")
+
+
+async def fetch_coach_stats(host_cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Fetch supplemental coach stats (owner, coach info) via SSH."""
+    if not _coach_stats_allowed(host_cfg):
+        return None
+
+    try:
+        stats_cfg = _merge_coach_stats_config(host_cfg)
+        if stats_cfg.get("enabled") is False:
+            return None
+
+        command = stats_cfg.get("command") or stats_cfg.get("remote_command")
+        if not command:
+            return None
+
+        parsed = urlparse(host_cfg.get("url", ""))
+        remote_host = stats_cfg.get("host") or parsed.hostname or host_cfg.get("name")
+        if not remote_host:
+            return None
+
+        ssh_user = stats_cfg.get("ssh_user", "hassio")
+        ssh_port = int(stats_cfg.get("ssh_port", 2222))
+        timeout_seconds = float(stats_cfg.get("timeout_seconds", COACH_STATS_DEFAULT_TIMEOUT))
+        connect_timeout = int(stats_cfg.get("connect_timeout", max(3, int(timeout_seconds))))
+        extra_options = stats_cfg.get("ssh_options")
+        if isinstance(extra_options, str):
+            extra_options = [extra_options]
+        extra_options = extra_options or []
+
+        remote_shell = stats_cfg.get("shell", "bash -l -c")
+        if remote_shell:
+            remote_command = f"{remote_shell} {shlex.quote(command)}"
+        else:
+            remote_command = command
+
+        ssh_cmd = [
+            "ssh",
+            "-p",
+            str(ssh_port),
+            "-o",
+            f"ConnectTimeout={connect_timeout}",
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            "StrictHostKeyChecking=no",
+        ]
+        ssh_cmd.extend(extra_options)
+        target = f"{ssh_user}@{remote_host}"
+        timing: Dict[str, Any] = {
+            "multiplexed": False,
+            "reused": False,
+            "connect_seconds": None,
+            "command_seconds": None,
+        }
+
+        try:
+            if stats_cfg.get("multiplex", COACH_STATS_MULTIPLEX):
+                control_path = _ssh_control_path(target, ssh_port)
+                ssh_cmd.extend(["-o", f"ControlPath={control_path}"])
+                master_started = time.monotonic()
+                reused, connect_seconds = await _ensure_ssh_master(
+                    ssh_cmd, target, control_path, timeout_seconds
+                )
+                record_span("ssh.master", master_started)
+                timing["multiplexed"] = True
+                timing["reused"] = reused
+                if connect_seconds is not None:
+                    timing["connect_seconds"] = round(connect_seconds, 3)
+                # Without a live master ssh falls back to a direct connection.
+                ssh_cmd.extend(["-o", "ControlMaster=no"])
+            ssh_cmd.append(target)
+            ssh_cmd.append(remote_command)
+
+            command_started = time.monotonic()
+            process = await asyncio.create_subprocess_exec(
+                *ssh_cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError as err:
+            return {"__error": f"ssh not available: {err}", "__error_type": "ssh", "__ssh": timing}
+        except Exception as err:  # pragma: no cover - defensive guard
+            return {"__error": f"unable to spawn ssh: {err}", "__error_type": "ssh", "__ssh": timing}
+
+        SSH_POOL_STATS["commands"] += 1
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout_seconds)
+        except asyncio.TimeoutError:
+            process.kill()
+            record_span("ssh.command", command_started)
+            return {"__error": f"timeout after {timeout_seconds:.1f}s", "__error_type": "timeout", "__ssh": timing}
+        record_span("ssh.command", command_started)
+        timing["command_seconds"] = round(time.monotonic() - command_started, 3)
+
+        raw_stdout = stdout.decode().strip()
+        raw_stderr = stderr.decode().strip()
+        if process.returncode != 0 and not raw_stdout:
+            return {
+                "__error": f"exit {process.returncode}",
+                # ssh itself exits 255 when it cannot connect or authenticate.
+                "__error_type": "ssh" if process.returncode == 255 else "exit",
+                "__stderr": raw_stderr or None,
+                "__ssh": timing,
+            }
+
+        # Attempt to parse JSON from stdout; fall back to scanning line-by-line.
+        def _parse_output(payload: str) -> Optional[Dict[str, Any]]:
+            candidate = payload.strip()
+            if not candidate:
+                return None
+            try:
+                return json.loads(candidate)
+            except json.JSONDecodeError:
+                return None
+
+        parsed_json = _parse_output(raw_stdout)
+        if parsed_json is None:
+            for line in reversed(raw_stdout.splitlines()):
+                parsed_json = _parse_output(line)
+                if parsed_json is not None:
+                    break
+
+        if parsed_json is None:
+            return {
+                "__error": "invalid JSON",
+                "__error_type": "parse",
+                "__stdout": raw_stdout or None,
+                "__stderr": raw_stderr or None,
+                "__ssh": timing,
+            }
+
+        if isinstance(parsed_json, dict):
+            parsed_json["__ssh"] = timing
+        return parsed_json
+    except asyncio.CancelledError:
+        raise
+    except Exception as err:
+        return {"__error": f"coach stats failed: {err}", "__error_type": "other"}
+
+
+def _host_auth(host_cfg: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    if host_cfg.get("username") and host_cfg.get("password"):
+        return host_cfg["username"], host_cfg["password"]
+    return None
+
+
+async def probe_host(client: httpx.AsyncClient, host_cfg: Dict[str, Any]) -> Optional[str]:
+    """Cheaply check whether a host answers HTTP at all; return an error or None."""
+    endpoint = f"{build_endpoint(host_cfg)}/status"
+    connection_state, trace = _connection_tracer("probe")
+    try:
+        await client.get(
+            endpoint,
+            auth=_host_auth(host_cfg),
+            timeout=SCHEDULER_PROBE_TIMEOUT_SECONDS,
+            extensions={"trace": trace},
+        )
+    except Exception as err:
+        count_error(host_cfg["name"], "probe", type(err).__name__)
+        return f"{type(err).__name__}: {err}"
+    finally:
+        _record_connection_use(host_cfg["name"], connection_state)
+    # Any HTTP answer, even an error status, means the host is back.
+    return None
+
+
+# Host name -> data class -> {"value", "collected_at" (monotonic), "collected_at_local"}.
+COACH_STATS_CACHE: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+
+def _coach_stats_ttls(host_cfg: Dict[str, Any]) -> Dict[str, float]:
+    ttls = dict(COACH_STATS_TTLS)
+    override = _merge_coach_stats_config(host_cfg).get("ttl_seconds")
+    if isinstance(override, dict):
+        for key, value in override.items():
+            try:
+                ttls[str(key)] = float(value)
+            except (TypeError, ValueError):
+                continue
+    return ttls
+
+
+def _coach_stats_due(host_cfg: Dict[str, Any]) -> bool:
+    """True when a cached data class with a TTL is older than that TTL.
+
+    Classes without their own TTL only count when ``ttl_seconds.default`` is
+    set, so bookkeeping keys such as ``timestamp`` do not force a collection on
+    every poll. Without any TTL that applies, every poll collects.
+    """
+    cache = COACH_STATS_CACHE.get(host_cfg["name"])
+    if not cache:
+        return True
+    ttls = _coach_stats_ttls(host_cfg)
+    default_ttl = ttls.get("default")
+    now = time.monotonic()
+    governed = False
+    for section, entry in cache.items():
+        ttl = ttls.get(section, default_ttl)
+        if ttl is None:
+            continue
+        governed = True
+        if now - entry["collected_at"] >= ttl:
+            return True
+    return not governed
+
+
+def cached_coach_stats(host_cfg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Merge the cached data classes for a host, annotated with their age."""
+    cache = COACH_STATS_CACHE.get(host_cfg["name"])
+    if not cache:
+        return None
+    now = time.monotonic()
+    merged: Dict[str, Any] = {section: entry["value"] for section, entry in cache.items()}
+    merged["__age_seconds"] = {
+        section: round(now - entry["collected_at"], 1) for section, entry in cache.items()
+    }
+    merged["__collected_at"] = {
+        section: entry["collected_at_local"] for section, entry in cache.items()
+    }
+    return merged
+
+
+async def collect_coach_stats(
+    host_cfg: Dict[str, Any],
+    force: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Return coach stats, running the SSH command only when a data class is stale."""
+    if not _coach_stats_allowed(host_cfg):
+        return None
+    if not force and not _coach_stats_due(host_cfg):
+        return cached_coach_stats(host_cfg)
+
+    started = time.monotonic()
+    fresh = await fetch_coach_stats(host_cfg)
+    if not isinstance(fresh, dict):
+        return cached_coach_stats(host_cfg)
+    COACH_STATS_SECONDS.observe(time.monotonic() - started, host_cfg["name"])
+    if "__error" in fresh:
+        error_type = fresh.get("__error_type")
+        count_error(
+            host_cfg["name"],
+            "coach_stats",
+            error_type if error_type in COACH_STATS_ERROR_TYPES else "other",
+        )
+        cached = cached_coach_stats(host_cfg)
+        if cached is None:
+            return fresh
+        # Keep serving what we know; the failure is surfaced alongside it.
+        cached["__last_error"] = fresh["__error"]
+        return cached
+
+    cache = COACH_STATS_CACHE.setdefault(host_cfg["name"], {})
+    collected_at = time.monotonic()
+    collected_at_local = current_timestamp()
+    for section, value in fresh.items():
+        if section.startswith("__"):
+            continue
+        cache[section] = {
+            "value": value,
+            "collected_at": collected_at,
+            "collected_at_local": collected_at_local,
+        }
+    merged = cached_coach_stats(host_cfg) or {}
+    for key, value in fresh.items():
+        if key.startswith("__"):
+            merged[key] = value
+    return merged
+
+
+# Host name -> plugin -> {"value", "fetched_at" (monotonic)}.
+PLUGIN_CACHE: Dict[str, Dict[str, Dict[str, Any]]] = {}
+# Hosts whose Glances API answered no per-plugin request; they are polled via /all.
+_FULL_FETCH_HOSTS: set[str] = set()
+
+
+class PluginFetchUnsupported(Exception):
+    """Raised when a host rejects every per-plugin request."""
+
+
+def _fetch_mode(host_cfg: Dict[str, Any]) -> str:
+    if host_cfg["name"] in _FULL_FETCH_HOSTS:
+        return "full"
+    mode = str(host_cfg.get("fetch_mode", FETCH_MODE)).strip().lower()
+    return "plugins" if mode == "plugins" and PLUGIN_TTLS else "full"
+
+
+def _parse_mode(host_cfg: Dict[str, Any]) -> str:
+    mode = str(host_cfg.get("parse_mode", PARSE_MODE)).strip().lower()
+    return "stream" if mode == "stream" else "buffered"
+
+
+async def _get_json(
+    client: httpx.AsyncClient,
+    host_cfg: Dict[str, Any],
+    endpoint: str
+) -> Tuple[Any, int, float]:
+    """GET a Glances endpoint and return (decoded JSON, body size in bytes, parse seconds)."""
+    label = endpoint.rsplit("/", 1)[-1]
+    connection_state, trace = _connection_tracer(label)
+    try:
+        response = await client.get(
+            endpoint,
+            auth=_host_auth(host_cfg),
+            extensions={"trace": trace},
+        )
+    finally:
+        _record_connection_use(host_cfg["name"], connection_state)
+    response.raise_for_status()
+    started = time.monotonic()
+    value = response.json()
+    record_span(f"{label}.parse", started)
+    return value, len(response.content), time.monotonic() - started
+
+
+async def fetch_plugins(client: httpx.AsyncClient, host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Fetch only the plugins the dashboard uses, honouring each plugin's TTL.
+
+    Plugins that are still fresh come from the cache. A transport error fails
+    the whole host; an HTTP error only drops that plugin, unless every plugin
+    was rejected, which raises ``PluginFetchUnsupported``.
+    """
+    name = host_cfg["name"]
+    base = build_endpoint(host_cfg)
+    cache = PLUGIN_CACHE.setdefault(name, {})
+    now = time.monotonic()
+    due = [
+        plugin
+        for plugin, ttl in PLUGIN_TTLS.items()
+        if plugin not in cache or now - cache[plugin]["fetched_at"] >= ttl
+    ]
+    semaphore = asyncio.Semaphore(PLUGIN_CONCURRENCY)
+    transport_errors: List[Exception] = []
+    rejected: List[str] = []
+    total_bytes = 0
+
+    async def _fetch_one(plugin: str) -> None:
+        nonlocal total_bytes
+        async with semaphore:
+            if transport_errors:
+                return
+            try:
+                value, size, _ = await _get_json(client, host_cfg, f"{base}/{plugin}")
+            except httpx.HTTPStatusError:
+                rejected.append(plugin)
+                return
+            except Exception as err:
+                transport_errors.append(err)
+                return
+        total_bytes += size
+        cache[plugin] = {"value": value, "fetched_at": time.monotonic()}
+
+    await asyncio.gather(*[_fetch_one(plugin) for plugin in due])
+    if transport_errors:
+        raise transport_errors[0]
+    if due and len(rejected) == len(due) and not cache:
+        raise PluginFetchUnsupported(f"no per-plugin endpoint answered under {base}")
+
+    now = time.monotonic()
+    payload: Dict[str, Any] = {
+        plugin: entry["value"] for plugin, entry in cache.items() if plugin in PLUGIN_TTLS
+    }
+    payload["__fetch_mode"] = "plugins"
+    payload["__bytes"] = total_bytes
+    payload["__plugins_fetched"] = sorted(set(due) - set(rejected))
+    payload["__plugin_age_seconds"] = {
+        plugin: round(now - entry["fetched_at"], 1) for plugin, entry in cache.items()
+    }
+    return payload
+
+
+_JSON_STRUCTURAL = re.compile(rb'["\\{}\[\],:]')
+
+
+class SelectiveObjectParser:
+    """Incrementally scan a top-level JSON object, decoding only the wanted keys.
+
+    Values of other keys are skipped byte by byte without being buffered, so a
+    large ``processlist`` never has to be held in memory or turned into objects.
+    """
+
+    __slots__ = (
+        "wanted", "result", "bytes_seen", "peak_buffer", "parse_seconds",
+        "_depth", "_complete", "_in_string", "_escape_pending", "_expect_key",
+        "_key", "_key_buf", "_value_buf",
+    )
+
+    def __init__(self, wanted: Iterable[str]) -> None:
+        self.wanted = set(wanted)
+        self.result: Dict[str, Any] = {}
+        self.bytes_seen = 0
+        self.peak_buffer = 0
+        self.parse_seconds = 0.0
+        self._depth = 0
+        # Set once the top-level object has been closed.
+        self._complete = False
+        self._in_string = False
+        self._escape_pending = False
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._key_buf: Optional[bytearray] = None
+        self._value_buf: Optional[bytearray] = None
+
+    def feed(self, chunk: bytes) -> None:
+        started = time.perf_counter()
+        self.bytes_seen += len(chunk)
+        key_start = 0 if self._key_buf is not None else None
+        value_start = 0 if self._value_buf is not None else None
+        skip_to = 1 if self._escape_pending else 0
+        self._escape_pending = False
+        for match in _JSON_STRUCTURAL.finditer(chunk):
+            index = match.start()
+            if index < skip_to:
+                continue
+            char = chunk[index]
+            if self._in_string:
+                if char == 0x5C:  # backslash: the next byte is escaped
+                    skip_to = index + 2
+                    self._escape_pending = skip_to > len(chunk)
+                elif char == 0x22:
+                    self._in_string = False
+                    if key_start is not None:
+                        self._key_buf += chunk[key_start:index]
+                        self._key = json.loads(b'"' + bytes(self._key_buf) + b'"')
+                        self._key_buf = None
+                        key_start = None
+                        self._expect_key = False
+                continue
+            if char == 0x22:
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_buf = bytearray()
+                    key_start = index + 1
+            elif char in (0x7B, 0x5B):  # { [
+                self._depth += 1
+                if self._depth == 1:
+                    if char != 0x7B:
+                        raise ValueError("expected a JSON object")
+                    if self._complete:
+                        raise ValueError("unexpected data after the JSON object")
+                    self._expect_key = True
+            elif char in (0x7D, 0x5D):  # } ]
+                if self._depth == 0:
+                    raise ValueError("unbalanced JSON object")
+                if self._depth == 1:
+                    self._finish_value(chunk, value_start, index)
+                    value_start = None
+                    self._complete = True
+                self._depth -= 1
+            elif self._depth == 1:
+                if char == 0x3A:  # : value starts after the colon
+                    if self._key in self.wanted:
+                        self._value_buf = bytearray()
+                        value_start = index + 1
+                elif char == 0x2C:  # , next key
+                    self._finish_value(chunk, value_start, index)
+                    value_start = None
+                    self._expect_key = True
+        if key_start is not None:
+            self._key_buf += chunk[key_start:]
+        if value_start is not None:
+            self._value_buf += chunk[value_start:]
+            self.peak_buffer = max(self.peak_buffer, len(self._value_buf))
+        self.parse_seconds += time.perf_counter() - started
+
+    def _finish_value(self, chunk: bytes, value_start: Optional[int], end: int) -> None:
+        if self._value_buf is not None:
+            self._value_buf += chunk[value_start or 0:end]
+            self.peak_buffer = max(self.peak_buffer, len(self._value_buf))
+            self.result[self._key] = json.loads(self._value_buf)
+            self._value_buf = None
+        self._key = None
+
+    def close(self) -> Dict[str, Any]:
+        """Return the wanted keys, or raise if the body was not one complete JSON object.
+
+        A ``null`` or truncated body must fail the poll like a buffered parse
+        would, rather than pass as a healthy host with no plugins.
+        """
+        if self._depth != 0 or self._in_string:
+            raise ValueError("truncated JSON object")
+        if not self._complete:
+            raise ValueError("expected a JSON object")
+        return self.result
+
+
+async def _stream_json_object(
+    client: httpx.AsyncClient,
+    host_cfg: Dict[str, Any],
+    endpoint: str,
+    wanted: Iterable[str]
+) -> SelectiveObjectParser:
+    """GET a JSON object and keep only ``wanted`` keys while the body streams in."""
+    parser = SelectiveObjectParser(wanted)
+    connection_state, trace = _connection_tracer("all")
+    try:
+        async with client.stream(
+            "GET",
+            endpoint,
+            auth=_host_auth(host_cfg),
+            extensions={"trace": trace},
+        ) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                parser.feed(chunk)
+    finally:
+        _record_connection_use(host_cfg["name"], connection_state)
+    parser.close()
+    # Parsing is interleaved with the body; show its total at the end of the body.
+    finished = time.monotonic()
+    record_span("all.parse", finished - parser.parse_seconds, finished)
+    return parser
+
+
+async def fetch_all(client: httpx.AsyncClient, host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Fetch the complete Glances /all payload for a host."""
+    endpoint = f"{build_endpoint(host_cfg)}/all"
+    if _parse_mode(host_cfg) == "stream":
+        parser = await _stream_json_object(client, host_cfg, endpoint, PLUGIN_TTLS)
+        payload = parser.result
+        size, parse_seconds, peak_buffer = parser.bytes_seen, parser.parse_seconds, parser.peak_buffer
+    else:
+        payload, size, parse_seconds = await _get_json(client, host_cfg, endpoint)
+        peak_buffer = size
+    payload["__fetch_mode"] = "full"
+    payload["__parse_mode"] = _parse_mode(host_cfg)
+    payload["__bytes"] = size
+    payload["__parse_seconds"] = round(parse_seconds, 6)
+    payload["__peak_buffer_bytes"] = peak_buffer
+    return payload
+
+
+def retain_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop plugins the dashboard never reads when ``payload_retention`` is "dashboard"."""
+    if PAYLOAD_RETENTION != "dashboard":
+        return payload
+    return dashboard_payload(payload)
+
+
+def dashboard_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The plugins listed in ``plugins`` plus the ``__`` bookkeeping keys of a payload."""
+    return {
+        key: value for key, value in payload.items()
+        if key in PLUGIN_TTLS or key.startswith("__")
+    }
+
+
+async def fetch_host(
+    client: httpx.AsyncClient,
+    host_cfg: Dict[str, Any]
+) -> Tuple[str, Dict[str, Any]]:
+    """Fetch the Glances stats for a single host (per-plugin or /all)."""
+    name = host_cfg["name"]
+    mode = _fetch_mode(host_cfg)
+    endpoint = f"{build_endpoint(host_cfg)}/all" if mode == "full" else build_endpoint(host_cfg)
+    stats_task: Optional[asyncio.Task] = None
+    if _coach_stats_allowed(host_cfg):
+        stats_task = asyncio.create_task(collect_coach_stats(host_cfg))
+    started = time.monotonic()
+    try:
+        if mode == "plugins":
+            try:
+                payload = await fetch_plugins(client, host_cfg)
+            except PluginFetchUnsupported:
+                LOGGER.warning("%s does not serve per-plugin endpoints; using /all", name)
+                _FULL_FETCH_HOSTS.add(name)
+                PLUGIN_CACHE.pop(name, None)
+                endpoint = f"{build_endpoint(host_cfg)}/all"
+                payload = await fetch_all(client, host_cfg)
+        else:
+            payload = await fetch_all(client, host_cfg)
+        payload = retain_payload(payload)
+        payload["__fetch_seconds"] = round(time.monotonic() - started, 4)
+        FETCH_SECONDS.observe(payload["__fetch_seconds"], name)
+        payload["__fetched_at"] = current_timestamp()
+        api_version = host_cfg.get("api_version", DEFAULT_API_VERSION)
+        payload["__api_version"] = int(api_version) if api_version else DEFAULT_API_VERSION
+    except Exception as err:
+        FETCH_SECONDS.observe(time.monotonic() - started, name)
+        count_error(name, "glances", type(err).__name__)
+        error_message = f"{type(err).__name__}: {err}"
+        stats_payload = await stats_task if stats_task else None
+        error_response = {
+            "__error": error_message,
+            "__endpoint": endpoint,
+            "__fetched_at": current_timestamp()
+        }
+        if isinstance(stats_payload, dict):
+            error_response["__coach_stats"] = stats_payload
+        return name, error_response
+
+    stats_payload = await stats_task if stats_task else None
+    if isinstance(stats_payload, dict):
+        payload["__coach_stats"] = stats_payload
+    return name, payload
+
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+HTTP_POOL_STATS: Dict[str, Any] = {
+    "requests": 0,
+    "new_connections": 0,
+    "reused_connections": 0,
+    "hosts": {},
+}
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide Glances client, creating it on first use."""
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed:
+        timeout = httpx.Timeout(
+            connect=TIMEOUT_SECONDS,
+            read=TIMEOUT_SECONDS,
+            write=TIMEOUT_SECONDS,
+            pool=TIMEOUT_SECONDS
+        )
+        limits = httpx.Limits(
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+        http2 = HTTP2_ENABLED
+        if http2 and not _http2_available():
+            LOGGER.warning("http.http2 is enabled but the 'h2' package is missing; using HTTP/1.1")
+            http2 = False
+        _HTTP_CLIENT = httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+    return _HTTP_CLIENT
+
+
+async def resize_http_pool() -> bool:
+    """Re-size the pool for the current host list, rebuilding the client if the limits moved.
+
+    Called after a reload with ``_REFRESH_LOCK`` held, so no poll is using the
+    client; an upstream pull caught in flight fails once and retries on its
+    next interval.
+    """
+    global HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS
+    limits = http_pool_limits(len(CONFIG["hosts"]))
+    if limits == (HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS):
+        return False
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS = limits
+    await close_http_client()
+    return True
+
+
+async def close_http_client() -> None:
+    """Close the shared Glances client and drop its pooled connections."""
+    global _HTTP_CLIENT
+    client = _HTTP_CLIENT
+    _HTTP_CLIENT = None
+    if client is not None:
+        await client.aclose()
+
+
+# httpcore trace step -> waterfall span suffix.
+_TRACE_PHASES = {
+    "connect_tcp": "connect",
+    "start_tls": "tls",
+    "send_request_headers": "send",
+    "receive_response_headers": "wait",
+    "receive_response_body": "body",
+}
+
+
+def _connection_tracer(label: str = "http") -> Tuple[Dict[str, bool], Any]:
+    """Return a state dict and an httpcore trace hook that fills it in.
+
+    The hook also adds connect/tls/send/wait/body spans, prefixed with
+    ``label``, to the current poll trace.
+    """
+    state = {"sent": False, "new": False}
+    started: Dict[str, float] = {}
+
+    async def trace(event_name: str, _info: Dict[str, Any]) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            state["new"] = True
+        elif event_name.endswith("send_request_headers.started"):
+            state["sent"] = True
+        step, _, phase = event_name.rpartition(".")
+        step = step.partition(".")[2]
+        if step not in _TRACE_PHASES:
+            return
+        if phase == "started":
+            started[step] = time.monotonic()
+        elif step in started:
+            record_span(f"{label}.{_TRACE_PHASES[step]}", started.pop(step))
+
+    return state, trace
+
+
+def _record_connection_use(host_name: str, state: Dict[str, bool]) -> None:
+    """Count whether a request reused a pooled connection or opened a new one."""
+    if not state["sent"]:
+        return
+    key = "new_connections" if state["new"] else "reused_connections"
+    host_stats = HTTP_POOL_STATS["hosts"].setdefault(
+        host_name,
+        {"requests": 0, "new_connections": 0, "reused_connections": 0},
+    )
+    for bucket in (HTTP_POOL_STATS, host_stats):
+        bucket["requests"] += 1
+        bucket[key] += 1
+
+
+@dataclass
+class HostSchedule:
+    """Polling state for one host: when to poll next and how it has been doing."""
+
+    name: str
+    interval: float
+    next_poll: float = 0.0
+    failure_streak: int = 0
+    last_success: Optional[str] = None
+    last_failure: Optional[str] = None
+    last_error: Optional[str] = None
+
+    @property
+    def circuit_open(self) -> bool:
+        """True once the host failed often enough to be probed instead of polled."""
+        return self.failure_streak >= SCHEDULER_FAILURE_THRESHOLD
+
+    def record(self, payload: Dict[str, Any]) -> None:
+        """Update the history from a poll result and schedule the next poll."""
+        now = time.monotonic()
+        if "__error" in payload:
+            self.failure_streak += 1
+            self.last_failure = current_timestamp()
+            self.last_error = payload.get("__error")
+            delay = min(
+                SCHEDULER_BACKOFF_MAX_SECONDS,
+                SCHEDULER_BACKOFF_BASE_SECONDS * (2 ** (self.failure_streak - 1)),
+            )
+        else:
+            self.failure_streak = 0
+            self.last_success = current_timestamp()
+            delay = self.interval
+        self.next_poll = now + delay
+
+    def as_dict(self) -> Dict[str, Any]:
+        next_in = max(0.0, self.next_poll - time.monotonic())
+        if self.failure_streak == 0:
+            state = "healthy"
+        elif self.circuit_open:
+            state = "probing"
+        else:
+            state = "backoff"
+        next_at = datetime.now(local_tz()) + timedelta(seconds=next_in)
+        return {
+            "state": state,
+            "interval_seconds": self.interval,
+            "next_poll_in_seconds": round(next_in, 1),
+            "next_poll_at": next_at.strftime("%Y-%m-%d %H:%M:%S %Z"),
+            "failure_streak": self.failure_streak,
+            "last_success": self.last_success,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+        }
+
+
+HOST_SCHEDULES: Dict[str, HostSchedule] = {}
+
+
+def schedule_for(host_cfg: Dict[str, Any]) -> HostSchedule:
+    """Return the scheduler state for a host, creating it on first use."""
+    name = host_cfg["name"]
+    schedule = HOST_SCHEDULES.get(name)
+    if schedule is None:
+        try:
+            interval = float(host_cfg.get("poll_seconds", REFRESH_SECONDS))
+        except (TypeError, ValueError):
+            interval = float(REFRESH_SECONDS)
+        schedule = HostSchedule(name=name, interval=interval)
+        HOST_SCHEDULES[name] = schedule
+    return schedule
+
+
+async def poll_host(
+    client: httpx.AsyncClient,
+    host_cfg: Dict[str, Any]
+) -> Tuple[str, Dict[str, Any]]:
+    """Poll a host, probing it cheaply first while its circuit is open."""
+    trace = HostTrace()
+    token = _CURRENT_TRACE.set(trace)
+    try:
+        return await _poll_host(client, host_cfg)
+    finally:
+        _CURRENT_TRACE.reset(token)
+        trace.add("poll", trace.started, time.monotonic())
+        _append_trace(host_cfg["name"], trace)
+
+
+def _append_trace(name: str, trace: HostTrace) -> None:
+    traces = HOST_TRACES.get(name)
+    if traces is None:
+        traces = HOST_TRACES[name] = deque(maxlen=DEBUG_TIMINGS_DEPTH)
+    traces.append(trace)
+
+
+async def _poll_host(
+    client: httpx.AsyncClient,
+    host_cfg: Dict[str, Any]
+) -> Tuple[str, Dict[str, Any]]:
+    schedule = schedule_for(host_cfg)
+    if schedule.circuit_open:
+        probe_error = await probe_host(client, host_cfg)
+        if probe_error:
+            payload = {
+                "__error": f"offline (probe failed): {probe_error}",
+                "__endpoint": f"{build_endpoint(host_cfg)}/status",
+                "__fetched_at": current_timestamp(),
+                "__probe": True,
+            }
+            cached_stats = cached_coach_stats(host_cfg) if _coach_stats_allowed(host_cfg) else None
+            if cached_stats:
+                payload["__coach_stats"] = cached_stats
+            schedule.record(payload)
+            return host_cfg["name"], payload
+    name, payload = await fetch_host(client, host_cfg)
+    schedule.record(payload)
+    return name, payload
+
+
+async def gather_hosts(
+    hosts: Optional[List[Dict[str, Any]]] = None
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Fetch stats for the given hosts (default: every configured host)."""
+    targets = CONFIG["hosts"] if hosts is None else hosts
+    if SHARD_WORKERS:
+        return await _gather_sharded(targets)
+    return await _gather_local(targets)
+
+
+async def _gather_local(targets: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    client = get_http_client()
+    tasks = [poll_host(client, host_cfg) for host_cfg in targets]
+    return await asyncio.gather(*tasks)
+
+
+def _due_hosts(now: float) -> List[Dict[str, Any]]:
+    return [host_cfg for host_cfg in CONFIG["hosts"] if schedule_for(host_cfg).next_poll <= now]
+
+
+def _seconds_until_next_poll() -> float:
+    now = time.monotonic()
+    waits = [schedule_for(host_cfg).next_poll - now for host_cfg in CONFIG["hosts"]]
+    if not waits:
+        return float(REFRESH_SECONDS)
+    return min(float(REFRESH_SECONDS), max(1.0, min(waits)))
+
+
+def shard_index(name: str) -> int:
+    """Worker process a host is polled by; stable across restarts and reloads."""
+    return zlib.crc32(name.encode("utf-8")) % SHARD_WORKERS
+
+
+class ShardWorker:
+    """A poller process for the hosts whose name hashes to ``index``.
+
+    The process runs its own event loop, HTTP client, SSH masters, scheduler
+    state and caches. The web process sends it ``(request_id, command,
+    argument)`` tuples over a pipe and a reader thread resolves the replies;
+    request id 0 expects no reply.
+    """
+
+    __slots__ = ("index", "process", "conn", "pending", "next_id", "counters")
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn: Any = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_id = 0
+        # Cumulative error, pool and histogram counters the process last reported.
+        self.counters: Dict[str, Any] = {}
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_shard_worker_main,
+            args=(child_conn,),
+            name=f"fleet-shard-{self.index}",
+            daemon=True,
+        )
+        try:
+            process.start()
+        finally:
+            child_conn.close()
+        self.process = process
+        self.conn = conn
+        self.counters = {}
+        threading.Thread(
+            target=self._read,
+            args=(asyncio.get_running_loop(), conn),
+            name=f"fleet-shard-{self.index}-reader",
+            daemon=True,
+        ).start()
+        self.send("hosts", (self.hosts(), []))
+
+    def hosts(self) -> List[Dict[str, Any]]:
+        return [host_cfg for host_cfg in CONFIG["hosts"] if shard_index(host_cfg["name"]) == self.index]
+
+    def send(self, command: str, argument: Any = None) -> None:
+        self.conn.send((0, command, argument))
+
+    async def call(self, command: str, argument: Any = None) -> Any:
+        self.next_id += 1
+        request_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        try:
+            self.conn.send((request_id, command, argument))
+            return await future
+        finally:
+            self.pending.pop(request_id, None)
+
+    def _read(self, loop: asyncio.AbstractEventLoop, conn: Any) -> None:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            with suppress(RuntimeError):
+                loop.call_soon_threadsafe(self._resolve, *message)
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(self._fail_pending)
+
+    def _resolve(self, request_id: int, ok: bool, result: Any) -> None:
+        future = self.pending.get(request_id)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(result))
+
+    def _fail_pending(self) -> None:
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError(f"shard worker {self.index} exited"))
+
+    async def stop(self) -> None:
+        if self.process is None:
+            return
+        # Closing the pipe ends the worker's command loop, which closes its pools.
+        with suppress(OSError):
+            self.conn.close()
+        await asyncio.to_thread(self.process.join, 5)
+        if self.process.is_alive():
+            self.process.terminate()
+            await asyncio.to_thread(self.process.join, 5)
+        self._fail_pending()
+        self.process = None
+
+
+SHARDS: List[ShardWorker] = []
+# Host name -> metrics a shard worker or an upstream dashboard already extracted,
+# consumed by the next _publish_snapshot().
+_PRECOMPUTED_METRICS: Dict[str, HostMetrics] = {}
+
+
+def _ensure_shard_workers() -> List[ShardWorker]:
+    """Start the worker processes on first use and restart any that died."""
+    if not SHARDS:
+        SHARDS.extend(ShardWorker(index) for index in range(SHARD_WORKERS))
+    for worker in SHARDS:
+        if worker.alive:
+            continue
+        if worker.process is not None:
+            LOGGER.warning(
+                "Shard worker %d exited with code %s; restarting",
+                worker.index, worker.process.exitcode,
+            )
+            worker._fail_pending()
+        worker.start()
+    return SHARDS
+
+
+async def stop_shard_workers() -> None:
+    await asyncio.gather(*(worker.stop() for worker in SHARDS))
+    SHARDS.clear()
+
+
+def _sync_shard_hosts(dropped: List[str]) -> None:
+    """Send each running worker its current host list after a reload."""
+    for worker in SHARDS:
+        if worker.alive:
+            worker.send("hosts", (worker.hosts(), dropped))
+
+
+async def _gather_sharded(targets: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Poll ``targets`` on the worker processes that own them and collect their records."""
+    workers = _ensure_shard_workers()
+    by_shard: Dict[int, List[str]] = {}
+    for host_cfg in targets:
+        by_shard.setdefault(shard_index(host_cfg["name"]), []).append(host_cfg["name"])
+    replies = await asyncio.gather(
+        *(workers[index].call("poll", names) for index, names in by_shard.items()),
+        return_exceptions=True,
+    )
+    host_cfgs = {host_cfg["name"]: host_cfg for host_cfg in targets}
+    payloads: Dict[str, Dict[str, Any]] = {}
+    for (index, names), reply in zip(by_shard.items(), replies):
+        if isinstance(reply, BaseException):
+            LOGGER.warning("Shard worker %d failed to poll: %s", index, reply)
+            for name in names:
+                payloads[name] = {
+                    "__error": f"shard worker {index} failed: {reply}",
+                    "__endpoint": build_endpoint(host_cfgs[name]),
+                    "__fetched_at": current_timestamp(),
+                }
+            continue
+        workers[index].counters = reply["counters"]
+        for name, payload, metrics, schedule, trace in reply["records"]:
+            payloads[name] = payload
+            _PRECOMPUTED_METRICS[name] = metrics
+            HOST_SCHEDULES[name] = schedule
+            if trace is not None:
+                _append_trace(name, trace)
+    _merge_shard_counters()
+    return [(name, payloads[name]) for name in host_cfgs if name in payloads]
+
+
+def _merge_shard_counters() -> None:
+    """Replace this process's counters with the sum of what every worker reported."""
+    ERROR_COUNTS.clear()
+    FETCH_SECONDS.series.clear()
+    COACH_STATS_SECONDS.series.clear()
+    for key in SSH_POOL_STATS:
+        SSH_POOL_STATS[key] = 0
+    for key in ("requests", "new_connections", "reused_connections"):
+        HTTP_POOL_STATS[key] = 0
+    HTTP_POOL_STATS["hosts"].clear()
+    for worker in SHARDS:
+        counters = worker.counters
+        if not counters:
+            continue
+        for key, count in counters["errors"].items():
+            ERROR_COUNTS[key] = ERROR_COUNTS.get(key, 0) + count
+        for key, value in counters["ssh"].items():
+            SSH_POOL_STATS[key] = SSH_POOL_STATS.get(key, 0) + value
+        for key, value in counters["http"].items():
+            if key == "hosts":
+                HTTP_POOL_STATS["hosts"].update(value)
+            else:
+                HTTP_POOL_STATS[key] = HTTP_POOL_STATS.get(key, 0) + value
+        for histogram, key in ((FETCH_SECONDS, "fetch"), (COACH_STATS_SECONDS, "coach_stats")):
+            for labels, series in counters[key].items():
+                merged = histogram.series.get(labels)
+                histogram.series[labels] = (
+                    list(series) if merged is None else [a + b for a, b in zip(merged, series)]
+                )
+
+
+def _shard_worker_main(conn: Any) -> None:
+    """Entry point of a shard worker process."""
+    with suppress(KeyboardInterrupt):
+        asyncio.run(_serve_shard(conn))
+
+
+async def _serve_shard(conn: Any) -> None:
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    try:
+        while True:
+            try:
+                request_id, command, argument = await loop.run_in_executor(None, conn.recv)
+            except (EOFError, OSError):
+                break
+            if command == "hosts":
+                # Applied inline so a following poll already sees the new host list.
+                _apply_shard_hosts(*argument)
+                await resize_http_pool()
+                continue
+            task = asyncio.create_task(_run_shard_command(conn, request_id, command, argument))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await close_http_client()
+        await close_ssh_masters()
+
+
+def _apply_shard_hosts(hosts: List[Dict[str, Any]], dropped: List[str]) -> None:
+    CONFIG["hosts"] = hosts
+    forget_hosts(dropped)
+
+
+async def _run_shard_command(conn: Any, request_id: int, command: str, argument: Any) -> None:
+    try:
+        if command == "poll":
+            result = await _shard_poll(argument)
+        elif command == "coach_stats":
+            host_cfg = next(host_cfg for host_cfg in CONFIG["hosts"] if host_cfg["name"] == argument)
+            result = await collect_coach_stats(host_cfg, force=True)
+        else:
+            raise ValueError(f"Unknown shard command: {command}")
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        if request_id:
+            conn.send((request_id, False, f"{type(exc).__name__}: {exc}"))
+        return
+    if request_id:
+        conn.send((request_id, True, result))
+
+
+async def _shard_poll(names: List[str]) -> Dict[str, Any]:
+    """Poll the named hosts and reduce each result to a compact record for the web process."""
+    hosts = {host_cfg["name"]: host_cfg for host_cfg in CONFIG["hosts"]}
+    results = await _gather_local([hosts[name] for name in names if name in hosts])
+    records = []
+    for name, payload in results:
+        traces = HOST_TRACES.get(name)
+        records.append((
+            name,
+            dashboard_payload(payload),
+            extract_metrics(payload),
+            HOST_SCHEDULES[name],
+            traces[-1] if traces else None,
+        ))
+    return {
+        "records": records,
+        "counters": {
+            "errors": ERROR_COUNTS,
+            "ssh": SSH_POOL_STATS,
+            "http": HTTP_POOL_STATS,
+            "fetch": FETCH_SECONDS.series,
+            "coach_stats": COACH_STATS_SECONDS.series,
+        },
+    }
+
+
+@dataclass(frozen=True)
+class FleetSnapshot:
+    """Result of one fleet poll, shared by every read endpoint."""
+
+    version: int
+    updated: str
+    results: List[Tuple[str, Dict[str, Any]]]
+    refreshed_at: float
+    # Host name -> snapshot version in which that host's payload last changed.
+    host_versions: Dict[str, int]
+    # Host name -> metrics derived once when that host's payload arrived.
+    metrics: Dict[str, HostMetrics]
+    # Fleet-wide aggregates over ``metrics``, see summarize_fleet().
+    summary: Dict[str, Any]
+    # Hosts polled for this version whose data did not change (they keep their version).
+    repolled: Tuple[str, ...] = ()
+
+
+_SNAPSHOT: Optional[FleetSnapshot] = None
+_REFRESH_LOCK = asyncio.Lock()
+# One queue per live stream client; each holds at most the newest snapshot.
+_SUBSCRIBERS: set[asyncio.Queue] = set()
+
+
+async def refresh_snapshot(
+    min_version: Optional[int] = None,
+    force: bool = False
+) -> FleetSnapshot:
+    """Poll the hosts that are due and publish the result as a new snapshot version.
+
+    Hosts that are not due keep their previous result. ``force`` polls every
+    host regardless of its schedule. When ``min_version`` is given and another
+    caller already published that version while we waited for the lock, the
+    existing snapshot is returned instead of scraping the fleet a second time.
+    """
+    async with _REFRESH_LOCK:
+        current = _SNAPSHOT
+        if min_version is not None and current is not None and current.version >= min_version:
+            return current
+        if force or current is None:
+            targets = list(CONFIG["hosts"])
+        else:
+            targets = _due_hosts(time.monotonic())
+        if not targets and current is not None:
+            return current
+        started_at = time.time()
+        started = time.monotonic()
+        results = await gather_hosts(targets)
+        gathered = time.monotonic()
+        REFRESH_CYCLE_SECONDS.observe(gathered - started)
+        snapshot = _publish_snapshot(current, results)
+        published = time.monotonic()
+        record_history(results, snapshot.metrics)
+        CYCLE_TIMINGS.append({
+            "version": snapshot.version,
+            "started_at": started_at,
+            "hosts": len(targets),
+            "gather_seconds": round(gathered - started, 6),
+            "publish_seconds": round(published - gathered, 6),
+            "history_seconds": round(time.monotonic() - published, 6),
+        })
+        return snapshot
+
+
+# Per-poll bookkeeping that changes on every fetch even when the host's data does not.
+VOLATILE_PAYLOAD_KEYS = frozenset({
+    "__fetched_at",
+    "__fetch_seconds",
+    "__parse_seconds",
+    "__bytes",
+    "__peak_buffer_bytes",
+    "__plugins_fetched",
+    "__plugin_age_seconds",
+})
+VOLATILE_COACH_STATS_KEYS = frozenset({"__age_seconds", "__ssh"})
+
+
+def _payload_signature(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a payload that decides whether a host's data changed."""
+    signature = {key: value for key, value in payload.items() if key not in VOLATILE_PAYLOAD_KEYS}
+    coach_stats = signature.get("__coach_stats")
+    if isinstance(coach_stats, dict):
+        signature["__coach_stats"] = {
+            key: value for key, value in coach_stats.items() if key not in VOLATILE_COACH_STATS_KEYS
+        }
+    return signature
+
+
+def _publish_snapshot(
+    current: Optional[FleetSnapshot],
+    updates: Iterable[Tuple[str, Dict[str, Any]]]
+) -> FleetSnapshot:
+    """Merge per-host results into the current snapshot and publish a new version.
+
+    Callers must hold ``_REFRESH_LOCK``.
+    """
+    global _SNAPSHOT
+    version = (current.version + 1) if current else 1
+    merged: Dict[str, Dict[str, Any]] = dict(current.results) if current else {}
+    host_versions: Dict[str, int] = dict(current.host_versions) if current else {}
+    metrics: Dict[str, HostMetrics] = dict(current.metrics) if current else {}
+    repolled: List[str] = []
+    for name, payload in updates:
+        precomputed = _PRECOMPUTED_METRICS.pop(name, None)
+        previous = merged.get(name)
+        merged[name] = payload
+        if (
+            previous is not None
+            and name in host_versions
+            and _payload_signature(previous) == _payload_signature(payload)
+        ):
+            # Unchanged data keeps its version so deltas and live updates skip it.
+            repolled.append(name)
+            _stamp_trace(name, version)
+            continue
+        host_versions[name] = version
+        started = time.monotonic()
+        metrics[name] = precomputed if precomputed is not None else extract_metrics(payload)
+        _stamp_trace(name, version, started)
+    results = [(name, merged[name]) for name in _snapshot_order() if name in merged]
+    if len(results) != len(merged):
+        # Hosts removed from hosts.yaml or by an upstream drop out of every per-host map.
+        names = {name for name, _ in results}
+        host_versions = {name: value for name, value in host_versions.items() if name in names}
+        metrics = {name: value for name, value in metrics.items() if name in names}
+    snapshot = FleetSnapshot(
+        version=version,
+        updated=current_timestamp(),
+        results=results,
+        refreshed_at=time.monotonic(),
+        host_versions=host_versions,
+        metrics=metrics,
+        summary=summarize_fleet([name for name, _ in results], metrics),
+        repolled=tuple(name for name in repolled if name in host_versions),
+    )
+    _SNAPSHOT = snapshot
+    _notify_subscribers(snapshot)
+    return snapshot
+
+
+def _snapshot_order() -> List[str]:
+    """Local hosts in config order, then each upstream's hosts in the child's order."""
+    names = [host_cfg["name"] for host_cfg in CONFIG["hosts"]]
+    for upstream in UPSTREAMS.values():
+        names.extend(upstream.hosts)
+    return names
+
+
+def _stamp_trace(name: str, version: int, extract_started: Optional[float] = None) -> None:
+    traces = HOST_TRACES.get(name)
+    if traces and traces[-1].version is None:
+        traces[-1].version = version
+        if extract_started is not None:
+            traces[-1].add("extract_metrics", extract_started, time.monotonic())
+
+
+def _notify_subscribers(snapshot: FleetSnapshot) -> None:
+    for queue in list(_SUBSCRIBERS):
+        # Subscribers only need the newest snapshot; drop one they have not read yet.
+        if queue.full():
+            with suppress(asyncio.QueueEmpty):
+                queue.get_nowait()
+        queue.put_nowait(snapshot)
+
+
+async def get_snapshot() -> FleetSnapshot:
+    """Return the latest snapshot, polling once if none has been published yet."""
+    snapshot = _SNAPSHOT
+    if snapshot is not None:
+        return snapshot
+    return await refresh_snapshot(min_version=1)
+
+
+async def _poll_forever() -> None:
+    """Poll hosts as they come due and keep the shared snapshot current."""
+    while True:
+        try:
+            await refresh_snapshot()
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pragma: no cover - keep the poller alive
+            LOGGER.exception("Fleet refresh failed")
+        await asyncio.sleep(_seconds_until_next_poll())
+
+
+# Bumped whenever a reload changes the host list, so open pages know to re-render.
+CONFIG_GENERATION = 0
+RELOAD_STATE: Dict[str, Any] = {
+    "reloads": 0,
+    "last_reload": None,
+    "last_error": None,
+    "added": [],
+    "removed": [],
+    "changed": [],
+    "restart_required": [],
+}
+
+
+def _host_signature(host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """The settings of a host, including its fleet and profile but not derived metadata."""
+    return {key: value for key, value in host_cfg.items() if key != "__meta"}
+
+
+def forget_hosts(names: Iterable[str]) -> None:
+    """Drop the caches, schedules and per-host counters of removed or changed hosts.
+
+    Changed hosts may point at another machine, so nothing fetched from the
+    old one (plugin cache, /all fallback, coach stats) may be served for them.
+    """
+    names = set(names)
+    if not names:
+        return
+    for name in names:
+        HOST_SCHEDULES.pop(name, None)
+        COACH_STATS_CACHE.pop(name, None)
+        HOST_TRACES.pop(name, None)
+        PLUGIN_CACHE.pop(name, None)
+        _FULL_FETCH_HOSTS.discard(name)
+        _CARD_CACHE.pop(name, None)
+        HTTP_POOL_STATS["hosts"].pop(name, None)
+    for key in [key for key in ERROR_COUNTS if key[0] in names]:
+        del ERROR_COUNTS[key]
+    for histogram in (FETCH_SECONDS, COACH_STATS_SECONDS):
+        for labels in [labels for labels in histogram.series if labels[0] in names]:
+            del histogram.series[labels]
+    # Sharded mode rebuilds these counters from what each worker last reported.
+    for worker in SHARDS:
+        counters = worker.counters
+        if not counters:
+            continue
+        counters["errors"] = {key: count for key, count in counters["errors"].items() if key[0] not in names}
+        counters["http"]["hosts"] = {
+            name: stats for name, stats in counters["http"]["hosts"].items() if name not in names
+        }
+        for key in ("fetch", "coach_stats"):
+            counters[key] = {labels: series for labels, series in counters[key].items() if labels[0] not in names}
+
+
+async def reload_config() -> Dict[str, Any]:
+    """Re-read the config and hosts files and reconcile the running fleets with them.
+
+    Hosts are matched by name across all fleets. Unchanged hosts keep their
+    schedule, history, coach stats cache and pooled connections; added and
+    changed hosts (including ones moved to another fleet) are polled straight
+    away and removed ones are dropped. Process-level settings are read once at
+    startup, so changes to them are only reported.
+    """
+    global CONFIG_GENERATION, _CONFIG_STAMP
+    try:
+        config, _lookup, _metadata, fleets, update_alias_specs = parse_config()
+    except (OSError, ValueError, yaml.YAMLError) as exc:
+        RELOAD_STATE["last_error"] = str(exc)
+        raise
+    async with _REFRESH_LOCK:
+        current = {host_cfg["name"]: host_cfg for host_cfg in CONFIG["hosts"]}
+        incoming = {host_cfg["name"]: host_cfg for host_cfg in config["hosts"]}
+        added = [name for name in incoming if name not in current]
+        removed = [name for name in current if name not in incoming]
+        changed = [
+            name for name in incoming
+            if name in current and _host_signature(incoming[name]) != _host_signature(current[name])
+        ]
+        hosts = [
+            current[name] if name in current and name not in changed else host_cfg
+            for name, host_cfg in incoming.items()
+        ]
+        forget_hosts(removed + changed)
+        for name in removed:
+            HISTORY.pop(name, None)
+        CONFIG["hosts"] = hosts
+        _sync_shard_hosts(removed + changed)
+        if await resize_http_pool():
+            LOGGER.info("HTTP pool resized to %d connections for %d hosts", HTTP_MAX_CONNECTIONS, len(hosts))
+        HOST_LOOKUP.clear()
+        HOST_LOOKUP.update({host_cfg["__meta"]["slug"]: host_cfg for host_cfg in hosts})
+        HOST_METADATA.clear()
+        HOST_METADATA.update({host_cfg["name"]: host_cfg["__meta"] for host_cfg in hosts})
+        _sync_upstreams(fleets)
+        _fill_federated(fleets, HOST_METADATA)
+        had_update_aliases = any(
+            PROFILES[fleet["profile"]]["update_aliases"] for fleet in FLEETS.values()
+        )
+        fleets_changed = fleets != FLEETS
+        FLEETS.clear()
+        FLEETS.update(fleets)
+        if update_alias_specs is not None or had_update_aliases:
+            _sync_update_aliases(update_alias_specs or [])
+        reordered = list(incoming) != [name for name in current if name in incoming]
+        if added or removed or changed or reordered or fleets_changed:
+            CONFIG_GENERATION += 1
+            if _SNAPSHOT is not None:
+                _publish_snapshot(_SNAPSHOT, [])
+        RELOAD_STATE.update({
+            "reloads": RELOAD_STATE["reloads"] + 1,
+            "last_reload": current_timestamp(),
+            "last_error": None,
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "restart_required": sorted(
+                str(key) for key in set(config) | set(CONFIG)
+                if key not in ("hosts", "fleets") and config.get(key) != CONFIG.get(key)
+            ),
+        })
+        _CONFIG_STAMP = _config_stamp()
+    if added or changed or removed:
+        LOGGER.info(
+            "Reloaded fleet config: %d added, %d removed, %d changed",
+            len(added), len(removed), len(changed),
+        )
+    if RELOAD_STATE["restart_required"]:
+        LOGGER.warning(
+            "%s settings need a restart to apply: %s",
+            CONFIG_PATH.name,
+            ", ".join(RELOAD_STATE["restart_required"]),
+        )
+    if added or changed:
+        await refresh_snapshot()
+    return {"generation": CONFIG_GENERATION, **RELOAD_STATE}
+
+
+async def _watch_config_forever() -> None:
+    """Reload whenever the config or a hosts file changes modification time or size."""
+    global _CONFIG_STAMP
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL_SECONDS)
+        stamp = _config_stamp()
+        if stamp == _CONFIG_STAMP:
+            continue
+        _CONFIG_STAMP = stamp
+        try:
+            await reload_config()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Keep running on the previous host list; a later save triggers another try.
+            LOGGER.warning("Ignoring fleet config change: %s", exc)
+
+
+# Payload keys pulled from a child dashboard: enough for the card and staleness, not the raw plugins.
+UPSTREAM_PAYLOAD_KEYS = ("__error", "__endpoint", "__fetched_at", "__fetch_seconds", "__stale")
+
+
+class Upstream:
+    """Pull state for one child dashboard whose hosts are merged in as a fleet."""
+
+    __slots__ = (
+        "fleet",
+        "url",
+        "interval",
+        "timeout",
+        "hosts",
+        "version",
+        "etag",
+        "generation",
+        "pulls",
+        "bytes_received",
+        "last_success",
+        "last_success_at",
+        "last_error",
+        "conflicts",
+        "marked_stale",
+    )
+
+    def __init__(self, spec: Dict[str, Any]) -> None:
+        self.fleet = spec["name"]
+        self.url = spec["upstream"]
+        self.interval = float(spec.get("refresh_seconds") or REFRESH_SECONDS)
+        self.timeout = float(spec.get("timeout_seconds") or TIMEOUT_SECONDS)
+        # Accepted host names in the child's order.
+        self.hosts: List[str] = []
+        # The child's snapshot version, ETag and config generation from the last pull.
+        self.version: Optional[int] = None
+        self.etag: Optional[str] = None
+        self.generation: Optional[int] = None
+        self.pulls = 0
+        self.bytes_received = 0
+        self.last_success: Optional[str] = None
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # Child hosts skipped because a local or other upstream host has the same name.
+        self.conflicts: set[str] = set()
+        # Whether this upstream's hosts are currently published with a ``__stale`` note.
+        self.marked_stale = False
+
+    def settings(self) -> Tuple[str, float, float]:
+        return (self.url, self.interval, self.timeout)
+
+    def age(self) -> Optional[float]:
+        return None if self.last_success_at is None else round(time.monotonic() - self.last_success_at, 1)
+
+    def is_stale(self) -> bool:
+        """True once two pulls in a row have not succeeded."""
+        age = self.age()
+        return age is None or age > 2 * self.interval + self.timeout
+
+    def as_dict(self) -> Dict[str, Any]:
+        age = self.age()
+        return {
+            "url": self.url,
+            "refresh_seconds": self.interval,
+            "hosts": len(self.hosts),
+            "child_version": self.version,
+            "last_success": self.last_success,
+            "age_seconds": age,
+            "stale": self.is_stale(),
+            "last_error": self.last_error,
+            "pulls": self.pulls,
+            "bytes_received": self.bytes_received,
+            "conflicts": sorted(self.conflicts),
+        }
+
+
+# Fleet name -> puller state for every fleet configured with an ``upstream``.
+UPSTREAMS: Dict[str, Upstream] = {}
+_UPSTREAM_TASKS: Dict[str, asyncio.Task] = {}
+# Pullers only run inside the app lifespan; reloads before that just record state.
+_FEDERATION_RUNNING = False
+
+
+def _federated_metadata(upstream: Upstream, name: str) -> Dict[str, Any]:
+    return {
+        "slug": _slugify(name),
+        "fleet": upstream.fleet,
+        "profile": "federated",
+        "upstream_url": upstream.url,
+    }
+
+
+def _fill_federated(fleets: Dict[str, Dict[str, Any]], host_metadata: Dict[str, Dict[str, Any]]) -> None:
+    """Add the hosts pulled so far to the fleet map and per-host metadata."""
+    for upstream in UPSTREAMS.values():
+        fleet = fleets.get(upstream.fleet)
+        if fleet is None:
+            continue
+        fleet["hosts"] = list(upstream.hosts)
+        for name in upstream.hosts:
+            host_metadata[name] = _federated_metadata(upstream, name)
+
+
+def resolve_host_name(host: str) -> Optional[str]:
+    """Name of the local or federated host with this name or slug, if any."""
+    slug = _slugify(host)
+    host_cfg = HOST_LOOKUP.get(slug)
+    if host_cfg:
+        return host_cfg["name"]
+    # Federated hosts have no config entry, only the metadata filled in per pull.
+    for name, meta in HOST_METADATA.items():
+        if meta.get("slug") == slug:
+            return name
+    return None
+
+
+def _upstream_metrics(entry: Dict[str, Any], failed: bool) -> HostMetrics:
+    """Metrics as sent by a child, keeping only the fields this instance knows.
+
+    A child on another version may send fields that do not exist here (or
+    lack ones that do); unknown ones are dropped instead of failing the pull.
+    """
+    values = entry.get("metrics") or {}
+    if not isinstance(values, dict):
+        raise TypeError(f"metrics must be a mapping, not {type(values).__name__}")
+    return HostMetrics(
+        failed=failed,
+        **{field: values[field] for field in HostMetrics.__slots__[1:] if field in values},
+    )
+
+
+def _sync_upstreams(fleets: Dict[str, Dict[str, Any]]) -> None:
+    """Start, restart or drop pullers so they match the ``upstream`` fleets.
+
+    Callers must hold ``_REFRESH_LOCK`` once the app is running.
+    """
+    wanted = {name: fleet for name, fleet in fleets.items() if fleet.get("upstream")}
+    for name in list(UPSTREAMS):
+        spec = wanted.get(name)
+        if spec is not None and Upstream(spec).settings() == UPSTREAMS[name].settings():
+            continue
+        task = _UPSTREAM_TASKS.pop(name, None)
+        if task is not None:
+            task.cancel()
+        for host_name in UPSTREAMS.pop(name).hosts:
+            HOST_METADATA.pop(host_name, None)
+            _CARD_CACHE.pop(host_name, None)
+            HISTORY.pop(host_name, None)
+    for name, spec in wanted.items():
+        if name not in UPSTREAMS:
+            UPSTREAMS[name] = Upstream(spec)
+            if _FEDERATION_RUNNING:
+                _UPSTREAM_TASKS[name] = asyncio.create_task(_federate_forever(UPSTREAMS[name]))
+
+
+async def pull_upstream(upstream: Upstream) -> None:
+    """Pull the hosts that changed on a child dashboard and merge them into the snapshot.
+
+    The child answers ``/status?since=`` with only the hosts whose data moved
+    past the version seen last time, or 304 when nothing did. A change in the
+    child's config generation triggers one full pull so removed hosts drop out,
+    and so does recovering from staleness, which replaces every ``__stale`` note.
+    """
+    global CONFIG_GENERATION
+    if upstream.marked_stale:
+        upstream.version = None
+    params = {"fields": "version,metrics,payload", "plugins": ",".join(UPSTREAM_PAYLOAD_KEYS)}
+    headers: Dict[str, str] = {}
+    if upstream.version is not None:
+        params["since"] = str(upstream.version)
+        if upstream.etag:
+            headers["If-None-Match"] = upstream.etag
+    try:
+        response = await get_http_client().get(
+            f"{upstream.url}/status", params=params, headers=headers, timeout=upstream.timeout
+        )
+        upstream.bytes_received += len(response.content)
+        if response.status_code != 304:
+            response.raise_for_status()
+            body = response.json()
+    except (httpx.HTTPError, ValueError) as exc:
+        upstream.last_error = str(exc) or type(exc).__name__
+        count_error(upstream.fleet, "upstream", type(exc).__name__)
+        return
+    upstream.pulls += 1
+    upstream.last_error = None
+    upstream.last_success = current_timestamp()
+    upstream.last_success_at = time.monotonic()
+    if response.status_code == 304:
+        return
+    full = body.get("since") is None
+    generation = body.get("config_generation")
+    if not full and generation != upstream.generation:
+        upstream.version = None
+        await pull_upstream(upstream)
+        return
+    entries = body.get("hosts") or {}
+    async with _REFRESH_LOCK:
+        if UPSTREAMS.get(upstream.fleet) is not upstream:
+            return  # dropped or replaced by a reload while the pull was in flight
+        taken = {host_cfg["name"] for host_cfg in CONFIG["hosts"]}
+        for other in UPSTREAMS.values():
+            if other is not upstream:
+                taken.update(other.hosts)
+        names = [] if full else list(upstream.hosts)
+        updates: List[Tuple[str, Dict[str, Any]]] = []
+        for name, entry in entries.items():
+            try:
+                payload = dict(entry.get("payload") or {})
+                metrics = _upstream_metrics(entry, "__error" in payload)
+            except (AttributeError, TypeError, ValueError) as exc:
+                # One malformed host must not cost the rest of the pull.
+                LOGGER.warning("Skipping host '%s' from upstream '%s': %s", name, upstream.fleet, exc)
+                count_error(upstream.fleet, "upstream", type(exc).__name__)
+                continue
+            if name in taken:
+                if name not in upstream.conflicts:
+                    upstream.conflicts.add(name)
+                    LOGGER.warning("Skipping host '%s' from upstream '%s': name already in use", name, upstream.fleet)
+                continue
+            if name not in names:
+                names.append(name)
+            payload["__upstream"] = upstream.fleet
+            _PRECOMPUTED_METRICS[name] = metrics
+            updates.append((name, payload))
+        hosts_changed = names != upstream.hosts
+        if hosts_changed:
+            for name in set(upstream.hosts) - set(names):
+                HOST_METADATA.pop(name, None)
+                _CARD_CACHE.pop(name, None)
+                HISTORY.pop(name, None)
+            upstream.hosts = names
+            _fill_federated(FLEETS, HOST_METADATA)
+            CONFIG_GENERATION += 1
+        if updates or hosts_changed:
+            snapshot = _publish_snapshot(_SNAPSHOT, updates)
+            record_history(updates, snapshot.metrics)
+        upstream.version = body.get("version")
+        upstream.etag = response.headers.get("ETag")
+        upstream.generation = generation
+        if full:
+            upstream.marked_stale = False
+
+
+async def mark_stale_upstream(upstream: Upstream) -> None:
+    """Publish an upstream's hosts with a ``__stale`` note once its pulls stop succeeding.
+
+    Cards, deltas and the event stream only follow snapshot versions, so the
+    note is what makes a silent child visible on them; the next successful
+    (full) pull replaces it.
+    """
+    if upstream.marked_stale or not upstream.hosts or not upstream.is_stale():
+        return
+    async with _REFRESH_LOCK:
+        snapshot = _SNAPSHOT
+        if UPSTREAMS.get(upstream.fleet) is not upstream or snapshot is None:
+            return
+        note = f"no data from {upstream.fleet} since {upstream.last_success or 'startup'}"
+        if upstream.last_error:
+            note += f" ({upstream.last_error})"
+        hosts = set(upstream.hosts)
+        updates = [
+            (name, {**payload, "__stale": note})
+            for name, payload in snapshot.results
+            if name in hosts
+        ]
+        for name, _ in updates:
+            _PRECOMPUTED_METRICS[name] = snapshot.metrics[name]
+        upstream.marked_stale = True
+        _publish_snapshot(snapshot, updates)
+    LOGGER.warning("Upstream '%s' is stale: %s", upstream.fleet, note)
+
+
+async def _federate_forever(upstream: Upstream) -> None:
+    """Pull one child dashboard on its own cadence."""
+    while True:
+        try:
+            await pull_upstream(upstream)
+            await mark_stale_upstream(upstream)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # pragma: no cover - keep the puller alive
+            LOGGER.exception("Pull from upstream '%s' failed", upstream.fleet)
+        await asyncio.sleep(upstream.interval)
+
+
+async def start_federation() -> None:
+    """Start one puller per ``upstream`` fleet."""
+    global _FEDERATION_RUNNING
+    async with _REFRESH_LOCK:
+        _FEDERATION_RUNNING = True
+        _sync_upstreams(FLEETS)
+        for name, upstream in UPSTREAMS.items():
+            if name not in _UPSTREAM_TASKS:
+                _UPSTREAM_TASKS[name] = asyncio.create_task(_federate_forever(upstream))
+
+
+async def stop_federation() -> None:
+    """Cancel the upstream pullers."""
+    global _FEDERATION_RUNNING
+    _FEDERATION_RUNNING = False
+    tasks = list(_UPSTREAM_TASKS.values())
+    _UPSTREAM_TASKS.clear()
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+# History series name -> how to read it from (payload, metrics).
+HISTORY_METRICS: Dict[str, Any] = {
+    "cpu": lambda payload, metrics: metrics.cpu_percent,
+    "mem": lambda payload, metrics: metrics.mem_percent,
+    "load": lambda payload, metrics: metrics.load_1m,
+    "disk": lambda payload, metrics: metrics.disk_percent,
+    "wifi": lambda payload, metrics: metrics.wifi_signal,
+    "fetch_seconds": lambda payload, metrics: payload.get("__fetch_seconds"),
+    "parse_seconds": lambda payload, metrics: payload.get("__parse_seconds"),
+}
+
+
+class HostHistory:
+    """Fixed-depth ring buffers holding one host's recent metric samples.
+
+    All series share a single timestamp ring. Storage is preallocated
+    ``array('d')`` so memory stays flat however long the process runs;
+    missing values are stored as NaN.
+    """
+
+    __slots__ = ("depth", "times", "series", "start", "size")
+
+    def __init__(self, depth: int) -> None:
+        self.depth = depth
+        self.times = array("d", [0.0]) * depth
+        self.series = {metric: array("d", [math.nan]) * depth for metric in HISTORY_METRICS}
+        self.start = 0
+        self.size = 0
+
+    def append(self, timestamp: float, values: Dict[str, Optional[float]]) -> None:
+        if self.size < self.depth:
+            index = (self.start + self.size) % self.depth
+            self.size += 1
+        else:
+            index = self.start
+            self.start = (self.start + 1) % self.depth
+        self.times[index] = timestamp
+        for metric, ring in self.series.items():
+            value = values.get(metric)
+            ring[index] = float(value) if isinstance(value, (int, float)) else math.nan
+
+    def _indices(self, since: Optional[float]) -> Iterable[int]:
+        """Yield ring positions in chronological order, oldest first."""
+        for offset in range(self.size):
+            index = (self.start + offset) % self.depth
+            if since is None or self.times[index] >= since:
+                yield index
+
+    def query(
+        self,
+        metric: str,
+        since: Optional[float] = None,
+        bucket_seconds: float = 0
+    ) -> Dict[str, List[Any]]:
+        """Return a series as parallel lists, optionally averaged into time buckets.
+
+        Samples are read in place from the ring; only the output is allocated.
+        """
+        ring = self.series[metric]
+        if bucket_seconds <= 0:
+            times: List[float] = []
+            values: List[Optional[float]] = []
+            for index in self._indices(since):
+                value = ring[index]
+                times.append(self.times[index])
+                values.append(None if math.isnan(value) else value)
+            return {"t": times, "value": values}
+
+        buckets: Dict[str, List[Any]] = {"t": [], "avg": [], "min": [], "max": [], "count": []}
+        current_bucket: Optional[float] = None
+        total = 0.0
+        count = 0
+        low = math.inf
+        high = -math.inf
+
+        def _flush() -> None:
+            buckets["t"].append(current_bucket)
+            buckets["avg"].append(total / count if count else None)
+            buckets["min"].append(low if count else None)
+            buckets["max"].append(high if count else None)
+            buckets["count"].append(count)
+
+        for index in self._indices(since):
+            bucket = math.floor(self.times[index] / bucket_seconds) * bucket_seconds
+            if current_bucket is not None and bucket != current_bucket:
+                _flush()
+                total, count, low, high = 0.0, 0, math.inf, -math.inf
+            current_bucket = bucket
+            value = ring[index]
+            if not math.isnan(value):
+                total += value
+                count += 1
+                low = min(low, value)
+                high = max(high, value)
+        if current_bucket is not None:
+            _flush()
+        return buckets
+
+
+HISTORY: Dict[str, HostHistory] = {}
+
+
+def record_history(
+    results: Iterable[Tuple[str, Dict[str, Any]]],
+    host_metrics: Dict[str, HostMetrics]
+) -> None:
+    """Append freshly polled results to each host's ring buffers."""
+    timestamp = time.time()
+    for name, payload in results:
+        if "__error" in payload:
+            continue
+        metrics = host_metrics[name]
+        values = {metric: reader(payload, metrics) for metric, reader in HISTORY_METRICS.items()}
+        history = HISTORY.get(name)
+        if history is None:
+            history = HISTORY[name] = HostHistory(HISTORY_DEPTH)
+        history.append(timestamp, values)
+        if STORE is not None:
+            _STORE_PENDING.extend(
+                (name, metric, timestamp, float(value))
+                for metric, value in values.items()
+                if isinstance(value, (int, float))
+            )
+    overflow = len(_STORE_PENDING) - STORE_MAX_PENDING
+    if overflow > 0:
+        del _STORE_PENDING[:overflow]
+
+
+class MetricsStore:
+    """SQLite archive of metric samples with RRD-style rollup tiers.
+
+    Raw samples are kept for a short time while 5-minute and hourly buckets
+    are maintained incrementally on every write, each tier pruned to its own
+    retention. All methods block and are meant to run in a worker thread.
+    """
+
+    def __init__(self, path: Path, tiers: List[Tuple[str, int, float]]) -> None:
+        self.path = path
+        self.tiers = tiers
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS samples (
+                    tier TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    ts REAL NOT NULL,
+                    avg REAL NOT NULL,
+                    min REAL NOT NULL,
+                    max REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (tier, host, metric, ts)
+                ) WITHOUT ROWID
+                """
+            )
+
+    def write(self, rows: List[Tuple[str, str, float, float]]) -> None:
+        """Insert (host, metric, timestamp, value) rows into every tier."""
+        if not rows:
+            return
+        tier_rows = []
+        for tier, bucket_seconds, _ in self.tiers:
+            for host, metric, timestamp, value in rows:
+                ts = timestamp if bucket_seconds <= 0 else timestamp - (timestamp % bucket_seconds)
+                tier_rows.append((tier, host, metric, ts, value, value, value, 1))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                """
+                INSERT INTO samples (tier, host, metric, ts, avg, min, max, count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (tier, host, metric, ts) DO UPDATE SET
+                    avg = (avg * count + excluded.avg * excluded.count) / (count + excluded.count),
+                    min = MIN(min, excluded.min),
+                    max = MAX(max, excluded.max),
+                    count = count + excluded.count
+                """,
+                tier_rows,
+            )
+        now = time.time()
+        if now - self._last_prune >= 3600:
+            self.prune(now)
+
+    def prune(self, now: float) -> None:
+        """Drop rows older than each tier's retention."""
+        with self._lock, self._conn:
+            for tier, _, retention in self.tiers:
+                self._conn.execute(
+                    "DELETE FROM samples WHERE tier = ? AND ts < ?",
+                    (tier, now - retention),
+                )
+        self._last_prune = now
+
+    def pick_tier(self, since: float, now: float) -> str:
+        """Return the finest tier whose retention still covers ``since``."""
+        for tier, _, retention in self.tiers:
+            if since >= now - retention:
+                return tier
+        return self.tiers[-1][0]
+
+    def query(
+        self,
+        host: str,
+        metric: str,
+        since: float,
+        until: float,
+        tier: str
+    ) -> Dict[str, List[Any]]:
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                SELECT ts, avg, min, max, count FROM samples
+                WHERE tier = ? AND host = ? AND metric = ? AND ts >= ? AND ts <= ?
+                ORDER BY ts
+                """,
+                (tier, host, metric, since, until),
+            )
+            rows = cursor.fetchall()
+        return {
+            "t": [row[0] for row in rows],
+            "avg": [row[1] for row in rows],
+            "min": [row[2] for row in rows],
+            "max": [row[3] for row in rows],
+            "count": [row[4] for row in rows],
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+STORE: Optional[MetricsStore] = None
+# Rows waiting for the next batched write; bounded so a stuck disk cannot grow it forever.
+_STORE_PENDING: List[Tuple[str, str, float, float]] = []
+STORE_MAX_PENDING = 200_000
+
+
+async def open_store() -> None:
+    global STORE
+    try:
+        STORE = await asyncio.to_thread(MetricsStore, STORE_PATH, STORE_TIERS)
+    except (OSError, sqlite3.Error) as err:
+        LOGGER.error("Metrics store disabled, unable to open %s: %s", STORE_PATH, err)
+        STORE = None
+
+
+async def flush_store() -> None:
+    """Write pending samples to the store in one batch off the event loop."""
+    if STORE is None or not _STORE_PENDING:
+        return
+    rows = _STORE_PENDING[:]
+    del _STORE_PENDING[:len(rows)]
+    try:
+        await asyncio.to_thread(STORE.write, rows)
+    except sqlite3.Error as err:
+        LOGGER.error("Metrics store write failed: %s", err)
+        room = STORE_MAX_PENDING - len(_STORE_PENDING)
+        if room > 0:
+            _STORE_PENDING[:0] = rows[-room:]
+
+
+async def _flush_store_forever() -> None:
+    while True:
+        await asyncio.sleep(STORE_FLUSH_SECONDS)
+        await flush_store()
+
+
+async def close_store() -> None:
+    global STORE
+    if STORE is None:
+        return
+    await flush_store()
+    store, STORE = STORE, None
+    await asyncio.to_thread(store.close)
+
+
+def _history_response(
+    names: Iterable[str],
+    metric: Optional[str],
+    since_seconds: Optional[float],
+    bucket_seconds: float
+) -> Dict[str, Any]:
+    if metric is not None and metric not in HISTORY_METRICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metric '{metric}'. Choose from: {', '.join(HISTORY_METRICS)}",
+        )
+    metrics = [metric] if metric else list(HISTORY_METRICS)
+    since = time.time() - since_seconds if since_seconds else None
+    hosts: Dict[str, Any] = {}
+    for name in names:
+        history = HISTORY.get(name)
+        if history is None:
+            continue
+        hosts[name] = {
+            series: history.query(series, since=since, bucket_seconds=bucket_seconds)
+            for series in metrics
+        }
+    return {
+        "depth": HISTORY_DEPTH,
+        "bucket_seconds": bucket_seconds,
+        "hosts": hosts,
+    }
+
+
+def local_tz():
+    """Return the local timezone object."""
+    return datetime.now().astimezone().tzinfo
+
+
+def current_timestamp() -> str:
+    """Return the current time formatted in the local timezone."""
+    return datetime.now(local_tz()).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+
+def format_bytes(num_bytes: Optional[float]) -> str:
+    """Convert bytes to a human-readable string."""
+    if num_bytes is None:
+        return "-"
+    thresholds = (
+        (1 << 40, "TiB"),
+        (1 << 30, "GiB"),
+        (1 << 20, "MiB"),
+        (1 << 10, "KiB"),
+    )
+    for threshold, suffix in thresholds:
+        if num_bytes >= threshold:
+            value = num_bytes / threshold
+            return f"{value:.1f}{suffix}"
+    return f"{num_bytes:.0f}B"
+
+
+class HostMetrics:
+    """Display metrics derived from one host payload, shared by every renderer."""
+
+    __slots__ = (
+        "failed",
+        "cpu_percent",
+        "mem_percent",
+        "mem_used",
+        "mem_total",
+        "load_1m",
+        "uptime",
+        "ip_address",
+        "public_ip",
+        "wifi_signal",
+        "wifi_label",
+        "disk_percent",
+        "coach_owner",
+        "coach_number",
+        "coach_year",
+        "coach_collected_at",
+        "updates_apt_pending",
+        "updates_docker_pending",
+    )
+    # A failed poll only carries the coach details cached from earlier collections.
+    FAILED_FIELDS = ("coach_owner", "coach_number", "coach_year", "coach_collected_at")
+
+    def __init__(self, failed: bool = False, **values: Any) -> None:
+        self.failed = failed
+        for field in self.__slots__[1:]:
+            setattr(self, field, values.get(field))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def as_dict(self) -> Dict[str, Any]:
+        fields = self.FAILED_FIELDS if self.failed else self.__slots__[1:]
+        return {field: getattr(self, field) for field in fields}
+
+
+def extract_metrics(payload: Dict[str, Any]) -> HostMetrics:
+    """Collect derived metrics for dashboard display."""
+    coach_stats = payload.get("__coach_stats") if isinstance(payload, dict) else None
+    coach_owner = None
+    coach_number = None
+    coach_year = None
+    coach_collected_at = None
+    updates_apt_pending = None
+    updates_docker_pending = None
+
+    def _coerce_int(value: Any) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    if isinstance(coach_stats, dict):
+        coach_section = coach_stats.get("coach")
+        if isinstance(coach_section, dict):
+            coach_owner = coach_section.get("owner") or None
+            coach_number = coach_section.get("number")
+            coach_year = coach_section.get("year")
+        collected_at = coach_stats.get("__collected_at")
+        if isinstance(collected_at, dict):
+            coach_collected_at = collected_at.get("coach")
+        updates_section = coach_stats.get("updates")
+        if isinstance(updates_section, dict):
+            for key in ("apt_pending", "apt", "apt_updates", "aptitude"):
+                if updates_apt_pending is None:
+                    updates_apt_pending = _coerce_int(updates_section.get(key))
+            for key in ("docker_pending", "docker", "container_updates"):
+                if updates_docker_pending is None:
+                    updates_docker_pending = _coerce_int(updates_section.get(key))
+
+    if "__error" in payload:
+        return HostMetrics(
+            failed=True,
+            coach_owner=coach_owner,
+            coach_number=coach_number,
+            coach_year=coach_year,
+            coach_collected_at=coach_collected_at,
+        )
+
+    def ensure_list(value: Any) -> List[Dict[str, Any]]:
+        if isinstance(value, list):
+            return [item for item in value if isinstance(item, dict)]
+        if isinstance(value, dict):
+            return [value]
+        return []
+
+    cpu_total = payload.get("cpu", {}).get("total")
+    mem_section = payload.get("mem", {}) or {}
+    mem_percent = mem_section.get("percent")
+    mem_used = mem_section.get("used")
+    mem_total = mem_section.get("total")
+    load_1m = payload.get("load", {}).get("min1")
+    uptime = payload.get("uptime", "n/a")
+
+    ip_raw = payload.get("ip")
+    ip_section = ip_raw if isinstance(ip_raw, dict) else {}
+    ip_address = ip_section.get("address")
+    public_ip = ip_section.get("public_address") or None
+
+    wifi_section = ensure_list(payload.get("wifi"))
+    primary_wifi = wifi_section[0] if wifi_section else {}
+    wifi_signal = primary_wifi.get("signal") or primary_wifi.get("quality")
+    wifi_label = (
+        primary_wifi.get("ssid")
+        or primary_wifi.get("essid")
+        or primary_wifi.get("interface")
+        or None
+    )
+
+    fs_section = ensure_list(payload.get("fs"))
+    disk_percent = None
+    if fs_section:
+        total_percent = 0.0
+        counted = 0
+        for fs in fs_section:
+            percent = fs.get("percent")
+            if isinstance(percent, (int, float)):
+                total_percent += float(percent)
+                counted += 1
+        if counted:
+            disk_percent = total_percent / counted
+
+    return HostMetrics(
+        cpu_percent=cpu_total,
+        mem_percent=mem_percent,
+        mem_used=mem_used,
+        mem_total=mem_total,
+        load_1m=load_1m,
+        uptime=uptime,
+        ip_address=ip_address,
+        public_ip=public_ip,
+        wifi_signal=wifi_signal,
+        wifi_label=wifi_label,
+        disk_percent=disk_percent,
+        coach_owner=coach_owner,
+        coach_number=coach_number,
+        coach_year=coach_year,
+        coach_collected_at=coach_collected_at,
+        updates_apt_pending=updates_apt_pending,
+        updates_docker_pending=updates_docker_pending,
+    )
+
+
+# Fleet column -> HostMetrics attribute.
+FLEET_COLUMNS: Dict[str, str] = {
+    "cpu": "cpu_percent",
+    "mem": "mem_percent",
+    "load": "load_1m",
+    "disk": "disk_percent",
+    "wifi": "wifi_signal",
+}
+# Columns where a low value is the bad one (signal strength in dBm).
+FLEET_LOWER_IS_WORSE = {"wifi"}
+
+
+class FleetTable:
+    """Latest metrics of every online host, one float column per metric (NaN if unknown)."""
+
+    __slots__ = ("names", "columns")
+
+    def __init__(self, names: List[str], metrics: Dict[str, HostMetrics]) -> None:
+        self.names = [name for name in names if name in metrics and not metrics[name].failed]
+        self.columns: Dict[str, array] = {}
+        for column, attr in FLEET_COLUMNS.items():
+            values = array("d")
+            for name in self.names:
+                value = getattr(metrics[name], attr)
+                values.append(float(value) if isinstance(value, (int, float)) else math.nan)
+            self.columns[column] = values
+
+    def column_summary(self, column: str) -> Dict[str, Any]:
+        """Count, mean, min/max, p50/p95, threshold offenders and the top-N worst hosts."""
+        lower_is_worse = column in FLEET_LOWER_IS_WORSE
+        threshold = FLEET_THRESHOLDS.get(column)
+        if np is not None:
+            values = np.frombuffer(self.columns[column], dtype=np.float64)
+            rows = np.flatnonzero(~np.isnan(values))
+            present = values[rows]
+            if not present.size:
+                return {"count": 0}
+            p50, p95 = np.percentile(present, [50, 95])
+            order = np.argsort(present, kind="stable")
+            worst = [int(rows[i]) for i in (order if lower_is_worse else order[::-1])[:FLEET_TOP_N]]
+            over: List[int] = []
+            if threshold is not None:
+                hit = present < threshold if lower_is_worse else present > threshold
+                over = [int(row) for row in rows[hit]]
+            stats = {
+                "count": int(present.size),
+                "mean": float(present.mean()),
+                "min": float(present.min()),
+                "max": float(present.max()),
+                "p50": float(p50),
+                "p95": float(p95),
+            }
+        else:
+            pairs = sorted(
+                (value, row) for row, value in enumerate(self.columns[column]) if not math.isnan(value)
+            )
+            if not pairs:
+                return {"count": 0}
+            ordered = [value for value, _ in pairs]
+            worst = [row for _, row in (pairs if lower_is_worse else reversed(pairs))][:FLEET_TOP_N]
+            over = []
+            if threshold is not None:
+                over = [
+                    row for value, row in pairs
+                    if (value < threshold if lower_is_worse else value > threshold)
+                ]
+            stats = {
+                "count": len(ordered),
+                "mean": math.fsum(ordered) / len(ordered),
+                "min": ordered[0],
+                "max": ordered[-1],
+                "p50": _percentile(ordered, 50),
+                "p95": _percentile(ordered, 95),
+            }
+        column_values = self.columns[column]
+        stats["top"] = [{"host": self.names[row], "value": column_values[row]} for row in worst]
+        if threshold is not None:
+            stats["threshold"] = threshold
+            stats["over_threshold"] = sorted(self.names[row] for row in over)
+        return stats
+
+
+def _percentile(ordered: List[float], percent: float) -> float:
+    # Linear interpolation between closest ranks, matching numpy.percentile's default.
+    rank = (len(ordered) - 1) * percent / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize_fleet(names: List[str], metrics: Dict[str, HostMetrics]) -> Dict[str, Any]:
+    """Aggregate the latest metrics across the fleet for /fleet/summary and the page header."""
+    table = FleetTable(names, metrics)
+    summary = {
+        "hosts": {
+            "total": len(names),
+            "online": len(table.names),
+            "offline": len(names) - len(table.names),
+        },
+        "metrics": {column: table.column_summary(column) for column in FLEET_COLUMNS},
+    }
+    summary["line"] = fleet_summary_line(summary)
+    return summary
+
+
+# (fleet, snapshot version) -> that fleet's summary; only the latest version is kept.
+_FLEET_SUMMARY_CACHE: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+
+
+def fleet_results(
+    snapshot: FleetSnapshot, fleet: Optional[str]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """The snapshot's host results, limited to one fleet unless ``fleet`` is None."""
+    if fleet is None:
+        return snapshot.results
+    names = set(FLEETS[fleet]["hosts"]) if fleet in FLEETS else set()
+    return [(name, payload) for name, payload in snapshot.results if name in names]
+
+
+def summary_for(snapshot: FleetSnapshot, fleet: Optional[str]) -> Dict[str, Any]:
+    """Summary of the whole snapshot or of one fleet, computed once per snapshot version."""
+    if fleet is None:
+        return snapshot.summary
+    cached = _FLEET_SUMMARY_CACHE.get(fleet)
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+    names = [name for name, _ in fleet_results(snapshot, fleet)]
+    summary = summarize_fleet(names, {name: snapshot.metrics[name] for name in names})
+    _FLEET_SUMMARY_CACHE[fleet] = (snapshot.version, summary)
+    return summary
+
+
+def fleet_summary_line(summary: Dict[str, Any]) -> str:
+    """One-line fleet overview shown under the page title."""
+    hosts = summary["hosts"]
+    parts = [f"{hosts['online']}/{hosts['total']} online"]
+    cpu = summary["metrics"].get("cpu", {})
+    if cpu.get("count"):
+        parts.append(f"CPU avg {cpu['mean']:.0f}% (p95 {cpu['p95']:.0f}%)")
+    mem = summary["metrics"].get("mem", {})
+    if mem.get("count"):
+        parts.append(f"RAM p95 {mem['p95']:.0f}%")
+    for column, label in (("cpu", "CPU"), ("mem", "RAM"), ("disk", "disk")):
+        stats = summary["metrics"].get(column, {})
+        offenders = stats.get("over_threshold")
+        if offenders:
+            parts.append(f"{len(offenders)} over {label} {stats['threshold']:.0f}%")
+    return " · ".join(parts)
+
+
+def render_rich_table(
+    stats: Iterable[Tuple[str, Dict[str, Any], HostMetrics]]
+) -> str:
+    """Render a plaintext summary table using Rich."""
+    console = Console(record=True, width=140)
+    table = Table(title="Glances Fleet", box=box.SIMPLE)
+    table.add_column("Host")
+    table.add_column("CPU %", justify="right")
+    table.add_column("RAM %", justify="right")
+    table.add_column("Load 1m", justify="right")
+    table.add_column("Uptime", justify="left")
+    table.add_column("WiFi", justify="left")
+    table.add_column("IP", justify="left")
+    table.add_column("Disk %", justify="right")
+    table.add_column("Status", justify="left")
+
+    for host_name, payload, metrics in stats:
+        if "__error" in payload:
+            owner = metrics.coach_owner
+            host_display = f"{host_name} ({owner})" if owner else host_name
+            table.add_row(
+                host_display,
+                "-",
+                "-",
+                "-",
+                "-",
+                "-",
+                "-",
+                "-",
+                f"ERROR: {payload['__error']}"
+            )
+            continue
+
+        cpu_total = metrics.cpu_percent
+        mem_percent = metrics.mem_percent
+        load_1m = metrics.load_1m
+        uptime = metrics.uptime
+        wifi_signal = metrics.wifi_signal
+        wifi_label = metrics.wifi_label
+        ip_address = metrics.ip_address or "-"
+        public_ip = metrics.public_ip
+        disk_percent = metrics.disk_percent
+        coach_owner = metrics.coach_owner
+
+        wifi_display = "-"
+        if wifi_signal is not None:
+            wifi_display = f"{wifi_signal} dBm"
+            if wifi_label:
+                wifi_display = f"{wifi_display} ({wifi_label})"
+        elif wifi_label:
+            wifi_display = wifi_label
+
+        ip_display = ip_address
+        if public_ip:
+            ip_display = f"{ip_address} / {public_ip}" if ip_address else public_ip
+
+        host_display = f"{host_name} ({coach_owner})" if coach_owner else host_name
+
+        table.add_row(
+            host_display,
+            f"{cpu_total:.1f}" if cpu_total is not None else "-",
+            f"{mem_percent:.1f}" if mem_percent is not None else "-",
+            f"{load_1m:.2f}" if load_1m is not None else "-",
+            str(uptime),
+            wifi_display,
+            ip_display or "-",
+            f"{disk_percent:.1f}" if disk_percent is not None else "-",
+            "OK"
+        )
+
+    console.print(table)
+    return console.export_text()
+
+
+def _host_profile(host_cfg: Dict[str, Any]) -> Dict[str, bool]:
+    return PROFILES[host_cfg.get("__profile", DEFAULT_PROFILE)]
+
+
+def _has_ssh_target(host_cfg: Dict[str, Any]) -> bool:
+    ssh_user, ssh_host, _ssh_port = _resolve_ssh_target(host_cfg)
+    return bool(ssh_user and ssh_host)
+
+
+def _online_update_hosts(
+    raw_stats: List[Tuple[str, Dict[str, Any]]],
+    fleet: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Online hosts, optionally of one fleet, with an SSH target and an update action."""
+    online_names = {
+        name
+        for name, payload in raw_stats
+        if isinstance(payload, dict) and "__error" not in payload
+    }
+    return [
+        host_cfg
+        for host_cfg in CONFIG["hosts"]
+        if host_cfg["name"] in online_names
+        and _host_profile(host_cfg)["update_aliases"]
+        and not host_cfg.get("update_disabled")
+        and _has_ssh_target(host_cfg)
+        and (fleet is None or host_cfg["__fleet"] == fleet)
+    ]
+
+
+async def _kill_process(process: asyncio.subprocess.Process) -> None:
+    """Kill and reap a subprocess without letting a child that holds its pipes stall us."""
+    with suppress(ProcessLookupError):
+        process.kill()
+    with suppress(asyncio.TimeoutError):
+        await asyncio.wait_for(process.wait(), timeout=2)
+
+
+async def _run_remote_command(
+    host_cfg: Dict[str, Any],
+    command: str,
+    action: str,
+    timeout_seconds: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Run an arbitrary command over SSH for a single host."""
+    result: Dict[str, Any] = {"host": host_cfg["name"], "status": "skipped", "action": action}
+    ssh_user, ssh_host, ssh_port = _resolve_ssh_target(host_cfg)
+    if not ssh_user or not ssh_host:
+        result["reason"] = "ssh_disabled"
+        return result
+
+    # Ensure the request can't hang forever if ssh stalls or sudo prompts.
+    if timeout_seconds is None:
+        timeout_seconds = float(host_cfg.get("remote_actions_timeout_seconds", REMOTE_ACTIONS_TIMEOUT_SECONDS))
+
+    ssh_cmd = [
+        "ssh",
+        "-o",
+        "BatchMode=yes",
+        "-o",
+        "StrictHostKeyChecking=no",
+        "-o",
+        f"ConnectTimeout={max(3, int(min(60, timeout_seconds)))}",
+    ]
+    if ssh_port:
+        ssh_cmd.extend(["-p", str(ssh_port)])
+    ssh_cmd.append("-t")
+    ssh_cmd.append(f"{ssh_user}@{ssh_host}")
+    ssh_cmd.append(command)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *ssh_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout_seconds)
+        except asyncio.TimeoutError:
+            await _kill_process(process)
+            result["status"] = "error"
+            result["error"] = f"timeout after {timeout_seconds:.1f}s"
+            return result
+        except asyncio.CancelledError:
+            # A cancelled update run (e.g. on shutdown) must not leave ssh running.
+            await _kill_process(process)
+            raise
+    except Exception as err:  # pragma: no cover - defensive guard
+        result["status"] = "error"
+        result["error"] = str(err)
+        return result
+
+    result["returncode"] = process.returncode
+    if stdout:
+        lines = stdout.decode().strip().splitlines()
+        if lines:
+            result["stdout"] = lines[-1]
+    if stderr:
+        lines = stderr.decode().strip().splitlines()
+        if lines:
+            result["stderr"] = lines[-1]
+    if process.returncode == 0:
+        result["status"] = "success"
+    else:
+        result["status"] = "error"
+    return result
+
+
+async def _run_remote_update(host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the update command over SSH for a single host."""
+    update_command = host_cfg.get("update_command", UPDATE_COMMAND)
+    timeout_seconds = float(host_cfg.get("update_timeout_seconds", UPDATE_HOST_TIMEOUT_SECONDS))
+    return await _run_remote_command(host_cfg, update_command, "update", timeout_seconds)
+
+
+async def _run_remote_reboot(host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the reboot command over SSH for a single host."""
+    reboot_command = host_cfg.get("reboot_command", REBOOT_COMMAND)
+    return await _run_remote_command(host_cfg, reboot_command, "reboot")
+
+
+async def _run_remote_restart(host_cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """Restart the configured monitoring service over SSH for a single host."""
+    restart_command = host_cfg.get("restart_command", RESTART_COMMAND)
+    return await _run_remote_command(host_cfg, restart_command, "restart")
+
+
+# View name -> (snapshot version, rendered output), shared by every request for a snapshot.
+_RENDER_CACHE: Dict[str, Tuple[int, str]] = {}
+
+
+def cached_render(view: str, snapshot: FleetSnapshot, render: Any) -> str:
+    """Return ``render(snapshot)``, computed at most once per snapshot version."""
+    cached = _RENDER_CACHE.get(view)
+    if cached is not None and cached[0] == snapshot.version:
+        return cached[1]
+    started = time.monotonic()
+    output = render(snapshot)
+    _record_render(view, snapshot.version, started)
+    _RENDER_CACHE[view] = (snapshot.version, output)
+    return output
+
+
+def _record_render(view: str, version: int, started: float) -> None:
+    RENDER_TIMINGS.append({
+        "view": view,
+        "version": version,
+        "seconds": round(time.monotonic() - started, 6),
+    })
+
+
+def render_dashboard(snapshot: FleetSnapshot, fleet: Optional[str] = None) -> str:
+    """Render the dashboard page for a snapshot, for every fleet or just ``fleet``."""
+    results = fleet_results(snapshot, fleet)
+    stats = [(name, payload, snapshot.metrics[name]) for name, payload in results]
+    stats = sorted(
+        stats,
+        key=lambda item: (
+            1 if "__error" in item[1] else 0,
+            _host_number(item[0]),
+            item[0].lower(),
+        ),
+    )
+    template = ENV.get_template("dashboard.html")
+    return template.render(
+        stats=stats,
+        updated=snapshot.updated,
+        version=snapshot.version,
+        fleet_line=summary_for(snapshot, fleet)["line"],
+        config_generation=CONFIG_GENERATION,
+        refresh_seconds=REFRESH_SECONDS,
+        format_bytes=format_bytes,
+        host_meta=HOST_METADATA,
+        fleet=fleet,
+        fleets=list(FLEETS),
+        upstreams={name: upstream.as_dict() for name, upstream in UPSTREAMS.items()},
+        has_updates=any(
+            HOST_METADATA.get(name, {}).get("update_url") for name, _ in results
+        ),
+        updates_url=f"/fleets/{fleet}/updates" if fleet else "/updates",
+        events_url=f"/events?fleet={fleet}&version=" if fleet else "/events?version=",
+    )
+
+
+def render_text_summary(snapshot: FleetSnapshot, fleet: Optional[str] = None) -> str:
+    """Render the Rich text summary for a snapshot."""
+    stats = [(name, payload, snapshot.metrics[name]) for name, payload in fleet_results(snapshot, fleet)]
+    return render_rich_table(stats)
+
+
+def _fleet_or_404(fleet: str) -> str:
+    if fleet not in FLEETS:
+        raise HTTPException(status_code=404, detail="Fleet not found")
+    return fleet
+
+
+@APP.get("/", response_class=HTMLResponse)
+async def dashboard() -> HTMLResponse:
+    """Render the HTML dashboard."""
+    snapshot = await get_snapshot()
+    return HTMLResponse(content=cached_render("html", snapshot, render_dashboard))
+
+
+@APP.get("/fleets", response_class=JSONResponse)
+async def list_fleets() -> JSONResponse:
+    """List the configured fleets with their profile, hosts and one-line summary.
+
+    Fleets pulled from a child dashboard also report how stale that pull is.
+    """
+    snapshot = await get_snapshot()
+    return JSONResponse(content={
+        "fleets": [
+            {
+                "name": name,
+                "profile": fleet_cfg["profile"],
+                "hosts": fleet_cfg["hosts"],
+                "summary": summary_for(snapshot, name)["line"],
+                "upstream": UPSTREAMS[name].as_dict() if name in UPSTREAMS else None,
+            }
+            for name, fleet_cfg in FLEETS.items()
+        ]
+    })
+
+
+@APP.get("/fleets/{fleet}", response_class=HTMLResponse)
+async def fleet_dashboard(fleet: str) -> HTMLResponse:
+    """Render the HTML dashboard for a single fleet."""
+    fleet = _fleet_or_404(fleet)
+    snapshot = await get_snapshot()
+    return HTMLResponse(content=cached_render(
+        f"html:{fleet}", snapshot, lambda snap: render_dashboard(snap, fleet)
+    ))
+
+
+# Host name -> ((host version, poll time), rendered card) so every stream client shares one render.
+_CARD_CACHE: Dict[str, Tuple[Tuple[int, Optional[str]], str]] = {}
+
+
+def render_host_card(snapshot: FleetSnapshot, name: str, payload: Dict[str, Any]) -> str:
+    """Render one host card fragment, reusing the render for an unchanged host.
+
+    The card shows when the host was last polled, which moves without
+    changing its version, so the poll time is part of the cache key.
+    """
+    host_version = snapshot.host_versions.get(name, snapshot.version)
+    key = (host_version, payload.get("__fetched_at"))
+    cached = _CARD_CACHE.get(name)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    started = time.monotonic()
+    html = ENV.get_template("host_card.html").render(
+        host_name=name,
+        payload=payload,
+        metrics=snapshot.metrics[name],
+        updated=snapshot.updated,
+        format_bytes=format_bytes,
+        host_meta=HOST_METADATA,
+    )
+    _record_render(f"card:{name}", host_version, started)
+    _CARD_CACHE[name] = (key, html)
+    return html
+
+
+def _sse_event(event: str, data: Dict[str, Any], event_id: Optional[int] = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {encode_json(data).decode('utf-8')}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _snapshot_events(
+    snapshot: FleetSnapshot, since_version: int, fleet: Optional[str] = None
+) -> Iterable[str]:
+    """Yield one event per host that changed after ``since_version``, then a meta event.
+
+    The meta event carries the new poll time of hosts re-polled without a
+    change, so their cards stay current without being sent again.
+    """
+    polled: Dict[str, Any] = {}
+    repolled = set(snapshot.repolled)
+    for name, payload in fleet_results(snapshot, fleet):
+        meta = HOST_METADATA.get(name, {})
+        if snapshot.host_versions.get(name, 0) <= since_version:
+            if name in repolled:
+                polled[meta.get("slug")] = payload.get("__fetched_at")
+            continue
+        yield _sse_event("host", {
+            "name": name,
+            "slug": meta.get("slug"),
+            "version": snapshot.host_versions[name],
+            "ok": "__error" not in payload,
+            "html": render_host_card(snapshot, name, payload),
+        })
+    yield _sse_event(
+        "meta",
+        {
+            "version": snapshot.version,
+            "updated": snapshot.updated,
+            "fleet": summary_for(snapshot, fleet)["line"],
+            "config_generation": CONFIG_GENERATION,
+            "stale_upstreams": [name for name, upstream in UPSTREAMS.items() if upstream.is_stale()],
+            "polled": polled,
+        },
+        event_id=snapshot.version,
+    )
+
+
+@APP.get("/events")
+async def stream_events(
+    request: Request,
+    version: int = Query(default=0, ge=0),
+    fleet: Optional[str] = None,
+    last_event_id: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+) -> StreamingResponse:
+    """Stream per-host updates as Server-Sent Events whenever the snapshot changes.
+
+    Clients pass the snapshot ``version`` they already show (or reconnect with
+    ``Last-Event-ID``) and only receive hosts that changed after it; ``fleet``
+    limits the stream to one fleet's hosts and summary.
+    """
+    if fleet is not None:
+        _fleet_or_404(fleet)
+    since_version = version
+    if last_event_id and last_event_id.isdigit():
+        since_version = max(since_version, int(last_event_id))
+
+    async def _stream():
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        _SUBSCRIBERS.add(queue)
+        try:
+            snapshot = await get_snapshot()
+            sent_version = since_version
+            while True:
+                if snapshot.version > sent_version:
+                    for chunk in _snapshot_events(snapshot, sent_version, fleet):
+                        yield chunk
+                    sent_version = snapshot.version
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+        finally:
+            _SUBSCRIBERS.discard(queue)
+
+    return StreamingResponse(
+        _stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def encode_json(content: Any) -> bytes:
+    """Serialize a JSON body like JSONResponse does, with orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def _negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    offered: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        token, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            with suppress(ValueError):
+                quality = float(params.strip()[2:])
+        if token:
+            offered[token.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if offered.get(encoding, offered.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL)
+
+
+# (route, params) -> encoding -> body bytes, valid for one snapshot version.
+_ENCODED_CACHE: Dict[Tuple[Any, ...], Dict[str, bytes]] = {}
+_ENCODED_CACHE_VERSION = 0
+_ENCODED_CACHE_MAX_ENTRIES = 64
+
+
+async def cached_json_response(
+    snapshot: FleetSnapshot,
+    key: Tuple[Any, ...],
+    build: Any,
+    accept_encoding: Optional[str],
+    headers: Dict[str, str],
+) -> Response:
+    """Serve ``build()`` encoded and compressed at most once per snapshot version."""
+    global _ENCODED_CACHE_VERSION
+    if _ENCODED_CACHE_VERSION != snapshot.version:
+        _ENCODED_CACHE.clear()
+        _ENCODED_CACHE_VERSION = snapshot.version
+    bodies = _ENCODED_CACHE.get(key)
+    if bodies is None:
+        bodies = {"identity": encode_json(build())}
+        if len(_ENCODED_CACHE) < _ENCODED_CACHE_MAX_ENTRIES:
+            _ENCODED_CACHE[key] = bodies
+    encoding = "identity"
+    if len(bodies["identity"]) >= COMPRESSION_MIN_BYTES:
+        encoding = _negotiate_encoding(accept_encoding)
+    body = bodies.get(encoding)
+    if body is None:
+        body = await asyncio.to_thread(_compress, bodies["identity"], encoding)
+        bodies[encoding] = body
+    headers = {**headers, "Vary": "Accept-Encoding"}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+STATUS_SECTIONS = ("version", "payload", "metrics", "schedule")
+
+
+def _split_param(value: Optional[str]) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    return tuple(sorted({item.strip() for item in value.split(",") if item.strip()}))
+
+
+def _status_host_entry(
+    snapshot: FleetSnapshot,
+    name: str,
+    payload: Dict[str, Any],
+    sections: Tuple[str, ...],
+    plugins: Optional[Tuple[str, ...]],
+) -> Dict[str, Any]:
+    entry: Dict[str, Any] = {}
+    if "version" in sections:
+        entry["version"] = snapshot.host_versions.get(name, snapshot.version)
+    if "payload" in sections:
+        entry["payload"] = payload if plugins is None else {
+            plugin: payload[plugin] for plugin in plugins if plugin in payload
+        }
+    if "metrics" in sections:
+        entry["metrics"] = snapshot.metrics[name].as_dict()
+    if "schedule" in sections:
+        entry["schedule"] = HOST_SCHEDULES[name].as_dict() if name in HOST_SCHEDULES else None
+    return entry
+
+
+def snapshot_etag(snapshot: FleetSnapshot) -> str:
+    # Weak: pool counters and schedules in the body may move between versions.
+    return f'W/"{snapshot.version}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+@APP.get("/status", response_class=JSONResponse)
+async def status(
+    since: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    hosts: Optional[str] = None,
+    plugins: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Response:
+    """Expose the raw JSON data for other consumers.
+
+    ``since`` limits ``hosts`` to those whose data changed after that snapshot
+    version; an unchanged snapshot answers ``If-None-Match`` with 304. Bodies
+    are encoded once per snapshot version and served gzip/brotli compressed.
+    ``fields`` (version, payload, metrics, schedule), ``hosts`` (names or
+    slugs) and ``plugins`` (payload keys) are comma-separated projections.
+    """
+    return await _status_response(since, fields, hosts, plugins, if_none_match, accept_encoding)
+
+
+@APP.get("/fleets/{fleet}/status", response_class=JSONResponse)
+async def fleet_status(
+    fleet: str,
+    since: Optional[int] = Query(None, ge=0),
+    fields: Optional[str] = None,
+    hosts: Optional[str] = None,
+    plugins: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Response:
+    """``/status`` limited to the hosts of one fleet."""
+    return await _status_response(
+        since, fields, hosts, plugins, if_none_match, accept_encoding, _fleet_or_404(fleet)
+    )
+
+
+async def _status_response(
+    since: Optional[int],
+    fields: Optional[str],
+    hosts: Optional[str],
+    plugins: Optional[str],
+    if_none_match: Optional[str],
+    accept_encoding: Optional[str],
+    fleet: Optional[str] = None,
+) -> Response:
+    sections = _split_param(fields) or STATUS_SECTIONS
+    unknown = [section for section in sections if section not in STATUS_SECTIONS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    selected: Optional[set[str]] = None
+    if hosts is not None:
+        selected = set()
+        for host in _split_param(hosts) or ():
+            name = resolve_host_name(host)
+            if name is None:
+                raise HTTPException(status_code=404, detail=f"Host not found: {host}")
+            selected.add(name)
+    plugin_filter = _split_param(plugins)
+    snapshot = await get_snapshot()
+    etag = snapshot_etag(snapshot)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    # A version from before a restart cannot be diffed against; send everything.
+    delta = since is not None and since <= snapshot.version
+    key = (
+        "status",
+        fleet,
+        since if delta else None,
+        sections,
+        tuple(sorted(selected)) if selected is not None else None,
+        plugin_filter,
+    )
+    return await cached_json_response(snapshot, key, lambda: {
+        "updated": snapshot.updated,
+        "version": snapshot.version,
+        "since": since if delta else None,
+        # Parents federating this instance re-pull in full when the host list changes.
+        "config_generation": CONFIG_GENERATION,
+        "http_pool": HTTP_POOL_STATS,
+        "ssh_pool": SSH_POOL_STATS,
+        "hosts": {
+            name: _status_host_entry(snapshot, name, payload, sections, plugin_filter)
+            for name, payload in fleet_results(snapshot, fleet)
+            if (selected is None or name in selected)
+            and (not delta or snapshot.host_versions.get(name, snapshot.version) > since)
+        }
+    }, accept_encoding, headers)
+
+
+@APP.get("/fleet/summary", response_class=JSONResponse)
+async def fleet_summary(
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Response:
+    """Fleet-wide aggregates, percentiles and top offenders for the current snapshot."""
+    return await _summary_response(if_none_match, accept_encoding)
+
+
+@APP.get("/fleets/{fleet}/summary", response_class=JSONResponse)
+async def fleet_summary_for(
+    fleet: str,
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+) -> Response:
+    """``/fleet/summary`` computed over the hosts of one fleet."""
+    return await _summary_response(if_none_match, accept_encoding, _fleet_or_404(fleet))
+
+
+async def _summary_response(
+    if_none_match: Optional[str],
+    accept_encoding: Optional[str],
+    fleet: Optional[str] = None,
+) -> Response:
+    snapshot = await get_snapshot()
+    etag = snapshot_etag(snapshot)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return await cached_json_response(snapshot, ("fleet_summary", fleet), lambda: {
+        "updated": snapshot.updated,
+        "version": snapshot.version,
+        **summary_for(snapshot, fleet),
+    }, accept_encoding, headers)
+
+
+# Prometheus gauge -> (help text, HostMetrics attribute).
+PROMETHEUS_HOST_GAUGES: Dict[str, Tuple[str, str]] = {
+    "fleet_host_cpu_percent": ("Total CPU usage.", "cpu_percent"),
+    "fleet_host_memory_percent": ("Memory usage.", "mem_percent"),
+    "fleet_host_load1": ("One-minute load average.", "load_1m"),
+    "fleet_host_disk_percent": ("Average filesystem usage across mounts.", "disk_percent"),
+    "fleet_host_wifi_signal_dbm": ("Wi-Fi signal strength.", "wifi_signal"),
+    "fleet_host_apt_pending": ("Pending apt upgrades reported by coach stats.", "updates_apt_pending"),
+    "fleet_host_docker_pending": (
+        "Pending container updates reported by coach stats.", "updates_docker_pending"
+    ),
+}
+
+
+def render_prometheus(snapshot: Optional[FleetSnapshot]) -> str:
+    """Render host gauges and dashboard internals in the Prometheus text format."""
+    lines = _prometheus_snapshot_lines(snapshot) if snapshot is not None else []
+    lines.extend([
+        "# HELP fleet_errors_total Failed polls by source and error type.",
+        "# TYPE fleet_errors_total counter",
+    ])
+    for (name, source, error_type), count in ERROR_COUNTS.items():
+        lines.append(_metric_line(
+            "fleet_errors_total", [("host", name), ("source", source), ("type", error_type)], count
+        ))
+    lines.extend([
+        "# HELP fleet_http_connections_total Glances HTTP requests by connection reuse.",
+        "# TYPE fleet_http_connections_total counter",
+        _metric_line("fleet_http_connections_total", [("state", "new")], HTTP_POOL_STATS["new_connections"]),
+        _metric_line(
+            "fleet_http_connections_total", [("state", "reused")], HTTP_POOL_STATS["reused_connections"]
+        ),
+        "# HELP fleet_ssh_sessions_total SSH master sessions by outcome.",
+        "# TYPE fleet_ssh_sessions_total counter",
+        _metric_line("fleet_ssh_sessions_total", [("state", "opened")], SSH_POOL_STATS["sessions_opened"]),
+        _metric_line("fleet_ssh_sessions_total", [("state", "reused")], SSH_POOL_STATS["sessions_reused"]),
+        _metric_line("fleet_ssh_sessions_total", [("state", "failed")], SSH_POOL_STATS["session_failures"]),
+    ])
+    for histogram in (FETCH_SECONDS, COACH_STATS_SECONDS, REFRESH_CYCLE_SECONDS, LOOP_LAG_SECONDS):
+        lines.extend(histogram.expose())
+    return "\n".join(lines) + "\n"
+
+
+def _host_labels(name: str) -> List[Tuple[str, str]]:
+    return [("host", name), ("fleet", HOST_METADATA.get(name, {}).get("fleet", ""))]
+
+
+def _prometheus_snapshot_lines(snapshot: FleetSnapshot) -> List[str]:
+    lines = [
+        "# HELP fleet_host_up Whether the host's last poll succeeded.",
+        "# TYPE fleet_host_up gauge",
+    ]
+    for name, payload in snapshot.results:
+        lines.append(_metric_line(
+            "fleet_host_up", _host_labels(name), 0 if "__error" in payload else 1
+        ))
+    for gauge, (help_text, attr) in PROMETHEUS_HOST_GAUGES.items():
+        lines.extend([f"# HELP {gauge} {help_text}", f"# TYPE {gauge} gauge"])
+        for name, metrics in snapshot.metrics.items():
+            value = getattr(metrics, attr)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(_metric_line(gauge, _host_labels(name), value))
+    lines.extend([
+        "# HELP fleet_snapshot_version Version of the published fleet snapshot.",
+        "# TYPE fleet_snapshot_version gauge",
+        _metric_line("fleet_snapshot_version", [], snapshot.version),
+        "# HELP fleet_snapshot_age_seconds Seconds since the snapshot was published.",
+        "# TYPE fleet_snapshot_age_seconds gauge",
+        _metric_line("fleet_snapshot_age_seconds", [], time.monotonic() - snapshot.refreshed_at),
+    ])
+    if UPSTREAMS:
+        upstreams = [(name, upstream.as_dict()) for name, upstream in UPSTREAMS.items()]
+        lines.extend([
+            "# HELP fleet_upstream_up Whether the last pull from a child dashboard succeeded.",
+            "# TYPE fleet_upstream_up gauge",
+        ])
+        lines.extend(
+            _metric_line("fleet_upstream_up", [("upstream", name)], 0 if state["last_error"] else 1)
+            for name, state in upstreams
+        )
+        lines.extend([
+            "# HELP fleet_upstream_age_seconds Seconds since the last successful pull from a child dashboard.",
+            "# TYPE fleet_upstream_age_seconds gauge",
+        ])
+        lines.extend(
+            _metric_line("fleet_upstream_age_seconds", [("upstream", name)], state["age_seconds"])
+            for name, state in upstreams
+            if state["age_seconds"] is not None
+        )
+    return lines
+
+
+@APP.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint; reads the cached snapshot and never polls the fleet."""
+    return PlainTextResponse(
+        content=render_prometheus(_SNAPSHOT),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+def _loop_lag_summary() -> Dict[str, Any]:
+    lags = sorted(lag for _, lag in LOOP_LAG_SAMPLES)
+    return {
+        "interval_seconds": LOOP_LAG_INTERVAL_SECONDS,
+        "samples": len(lags),
+        "last_seconds": round(LOOP_LAG_SAMPLES[-1][1], 6) if LOOP_LAG_SAMPLES else None,
+        "p95_seconds": round(_percentile(lags, 95), 6) if lags else None,
+        "max_seconds": round(lags[-1], 6) if lags else None,
+    }
+
+
+def render_waterfall(name: str, trace: Dict[str, Any], width: int = 48) -> List[str]:
+    """Draw one poll trace as text bars on a shared time axis."""
+    total = trace["total_seconds"] or 1e-9
+    published = f"v{trace['version']}" if trace["version"] is not None else "no snapshot"
+    lines = [f"{name} · {published} · {trace['total_seconds'] * 1000:.1f} ms"]
+    for span in trace["spans"]:
+        start = int(span["offset"] / total * width)
+        length = max(1, int(round(span["duration"] / total * width)))
+        bar = " " * start + "#" * min(length, width - start or 1)
+        lines.append(
+            f"  {span['name']:<20} {span['offset'] * 1000:8.1f} {span['duration'] * 1000:8.1f} ms |{bar:<{width}}|"
+        )
+    return lines
+
+
+@APP.get("/debug/timings")
+async def debug_timings(
+    host: Optional[str] = None,
+    cycles: int = Query(default=5, ge=1),
+    output_format: str = Query(default="json", alias="format", pattern="^(json|text)$"),
+) -> Response:
+    """Per-host poll waterfalls for the last few cycles, render timings and event-loop lag."""
+    names = list(HOST_TRACES)
+    if host is not None:
+        name = resolve_host_name(host)
+        if name is None:
+            raise HTTPException(status_code=404, detail="Host not found")
+        names = [name] if name in HOST_TRACES else []
+    hosts = {
+        name: [trace.as_dict() for trace in list(HOST_TRACES[name])[-cycles:]]
+        for name in names
+    }
+    if output_format == "text":
+        lines = [f"event loop lag: {_loop_lag_summary()}", ""]
+        for name, traces in hosts.items():
+            for trace in traces:
+                lines.extend(render_waterfall(name, trace))
+                lines.append("")
+        return PlainTextResponse(content="\n".join(lines))
+    return JSONResponse(content={
+        "loop_lag": _loop_lag_summary(),
+        "cycles": list(CYCLE_TIMINGS)[-cycles:],
+        "renders": list(RENDER_TIMINGS),
+        "hosts": hosts,
+    })
+
+
+@APP.post("/hosts/{slug}/coach-stats/refresh", response_class=JSONResponse)
+async def refresh_coach_stats(slug: str) -> JSONResponse:
+    """Re-collect every coach stats data class for one host, ignoring TTLs."""
+    host_cfg = HOST_LOOKUP.get(slug)
+    if not host_cfg:
+        raise HTTPException(status_code=404, detail="Host not found")
+    if not _coach_stats_allowed(host_cfg):
+        raise HTTPException(status_code=400, detail="Coach stats disabled for host")
+    if SHARD_WORKERS:
+        worker = _ensure_shard_workers()[shard_index(host_cfg["name"])]
+        stats_payload = await worker.call("coach_stats", host_cfg["name"])
+    else:
+        stats_payload = await collect_coach_stats(host_cfg, force=True)
+    async with _REFRESH_LOCK:
+        current = _SNAPSHOT
+        previous = dict(current.results).get(host_cfg["name"]) if current else None
+        if previous is not None and isinstance(stats_payload, dict):
+            payload = dict(previous)
+            payload["__coach_stats"] = stats_payload
+            _publish_snapshot(current, [(host_cfg["name"], payload)])
+    return JSONResponse(content={
+        "host": host_cfg["name"],
+        "coach_stats": stats_payload,
+    })
+
+
+@APP.post("/refresh", response_class=JSONResponse)
+async def refresh_now() -> JSONResponse:
+    """Poll the fleet immediately instead of waiting for the next cycle."""
+    current = _SNAPSHOT
+    snapshot = await refresh_snapshot(
+        min_version=(current.version + 1) if current else 1,
+        force=True,
+    )
+    return JSONResponse(content={
+        "updated": snapshot.updated,
+        "version": snapshot.version,
+    })
+
+
+def _host_number(host_name: str) -> int:
+    """Extract a numeric suffix from host name for sorting, defaults high."""
+    match = re.search(r"(\d+)", host_name)
+    if match:
+        try:
+            return int(match.group(1))
+        except ValueError:
+            return 9999
+    return 9999
+
+
+@APP.get("/text", response_class=PlainTextResponse)
+async def text_summary() -> PlainTextResponse:
+    """Return a text summary for quick terminal checks."""
+    snapshot = await get_snapshot()
+    return PlainTextResponse(content=cached_render("text", snapshot, render_text_summary))
+
+
+@APP.get("/fleets/{fleet}/text", response_class=PlainTextResponse)
+async def fleet_text_summary(fleet: str) -> PlainTextResponse:
+    """Return the text summary for a single fleet."""
+    fleet = _fleet_or_404(fleet)
+    snapshot = await get_snapshot()
+    return PlainTextResponse(content=cached_render(
+        f"text:{fleet}", snapshot, lambda snap: render_text_summary(snap, fleet)
+    ))
+
+
+@APP.get("/history", response_class=JSONResponse)
+async def fleet_history(
+    metric: Optional[str] = None,
+    since_seconds: Optional[float] = Query(default=None, gt=0),
+    bucket_seconds: float = Query(default=0, ge=0),
+) -> JSONResponse:
+    """Return recent metric history for every host from the in-memory rings."""
+    names = _snapshot_order()
+    return JSONResponse(content=_history_response(names, metric, since_seconds, bucket_seconds))
+
+
+@APP.get("/hosts/{slug}/history", response_class=JSONResponse)
+async def host_history(
+    slug: str,
+    metric: Optional[str] = None,
+    since_seconds: Optional[float] = Query(default=None, gt=0),
+    bucket_seconds: float = Query(default=0, ge=0),
+) -> JSONResponse:
+    """Return recent metric history for a single host."""
+    name = resolve_host_name(slug)
+    if name is None:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return JSONResponse(
+        content=_history_response([name], metric, since_seconds, bucket_seconds)
+    )
+
+
+async def _archive_response(
+    names: Iterable[str],
+    metric: Optional[str],
+    since_seconds: float,
+    tier: Optional[str]
+) -> Dict[str, Any]:
+    if STORE is None:
+        raise HTTPException(status_code=404, detail="Metrics store is disabled")
+    if metric is not None and metric not in HISTORY_METRICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown metric '{metric}'. Choose from: {', '.join(HISTORY_METRICS)}",
+        )
+    tier_names = [name for name, _, _ in STORE_TIERS]
+    if tier is not None and tier not in tier_names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown tier '{tier}'. Choose from: {', '.join(tier_names)}",
+        )
+    # Make sure the newest samples are visible before reading.
+    await flush_store()
+    now = time.time()
+    since = now - since_seconds
+    chosen = tier or STORE.pick_tier(since, now)
+    metrics = [metric] if metric else list(HISTORY_METRICS)
+    hosts: Dict[str, Any] = {}
+    for name in names:
+        hosts[name] = {
+            series: await asyncio.to_thread(STORE.query, name, series, since, now, chosen)
+            for series in metrics
+        }
+    return {"tier": chosen, "since": since, "until": now, "hosts": hosts}
+
+
+@APP.get("/archive", response_class=JSONResponse)
+async def fleet_archive(
+    metric: Optional[str] = None,
+    since_seconds: float = Query(default=86400, gt=0),
+    tier: Optional[str] = None,
+) -> JSONResponse:
+    """Return long-term metric history for every host from the on-disk store."""
+    names = _snapshot_order()
+    return JSONResponse(content=await _archive_response(names, metric, since_seconds, tier))
+
+
+@APP.get("/hosts/{slug}/archive", response_class=JSONResponse)
+async def host_archive(
+    slug: str,
+    metric: Optional[str] = None,
+    since_seconds: float = Query(default=86400, gt=0),
+    tier: Optional[str] = None,
+) -> JSONResponse:
+    """Return long-term metric history for a single host."""
+    name = resolve_host_name(slug)
+    if name is None:
+        raise HTTPException(status_code=404, detail="Host not found")
+    return JSONResponse(
+        content=await _archive_response([name], metric, since_seconds, tier)
+    )
+
+
+@APP.get("/config", response_class=JSONResponse)
+async def config_dump() -> JSONResponse:
+    """Return sanitized configuration details."""
+    sanitized_hosts = []
+    for host_cfg in CONFIG["hosts"]:
+        sanitized_hosts.append({
+            "name": host_cfg["name"],
+            "url": host_cfg["url"],
+            "fleet": host_cfg["__fleet"],
+            "profile": host_cfg["__profile"],
+            "api_version": host_cfg.get("api_version", DEFAULT_API_VERSION),
+            "fetch_mode": _fetch_mode(host_cfg),
+            "ha_dashboard_url": HOST_METADATA.get(host_cfg["name"], {}).get("ha_dashboard_url"),
+        })
+    return JSONResponse(content={
+        "config_path": str(CONFIG_PATH),
+        "fleets": {
+            name: {
+                "profile": fleet_cfg["profile"],
+                "hosts_file": fleet_cfg["hosts_file"],
+                "upstream": fleet_cfg.get("upstream"),
+            }
+            for name, fleet_cfg in FLEETS.items()
+        },
+        "default_api_version": DEFAULT_API_VERSION,
+        "refresh_seconds": REFRESH_SECONDS,
+        "timeout_seconds": TIMEOUT_SECONDS,
+        "fetch_mode": FETCH_MODE,
+        "parse_mode": PARSE_MODE,
+        "plugins": PLUGIN_TTLS,
+        "payload_retention": PAYLOAD_RETENTION,
+        "http": {
+            "http2": HTTP2_ENABLED,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry_seconds": HTTP_KEEPALIVE_EXPIRY,
+        },
+        "fleet": {
+            "top_n": FLEET_TOP_N,
+            "thresholds": FLEET_THRESHOLDS,
+            "numpy": np is not None,
+        },
+        "compression": {
+            "min_bytes": COMPRESSION_MIN_BYTES,
+            "gzip_level": COMPRESSION_GZIP_LEVEL,
+            "brotli": brotli is not None,
+            "orjson": orjson is not None,
+        },
+        "updates": {
+            "concurrency": UPDATE_CONCURRENCY,
+            "wave_size": UPDATE_WAVE_SIZE,
+            "canary_hosts": UPDATE_CANARY_HOSTS,
+            "host_timeout_seconds": UPDATE_HOST_TIMEOUT_SECONDS,
+            "abort_failure_ratio": UPDATE_ABORT_FAILURE_RATIO,
+        },
+        "shards": {
+            "workers": SHARD_WORKERS,
+            "alive": sum(1 for worker in SHARDS if worker.alive),
+        },
+        "reload": {
+            "watch": RELOAD_WATCH,
+            "interval_seconds": RELOAD_INTERVAL_SECONDS,
+            "generation": CONFIG_GENERATION,
+            **RELOAD_STATE,
+        },
+        "hosts": sanitized_hosts
+    })
+
+
+@APP.post("/config/reload", response_class=JSONResponse)
+async def config_reload() -> JSONResponse:
+    """Re-read hosts.yaml and apply host additions, removals and changes."""
+    global _CONFIG_STAMP
+    _CONFIG_STAMP = _config_stamp()
+    try:
+        result = await reload_config()
+    except (OSError, ValueError, yaml.YAMLError) as exc:
+        raise HTTPException(400, f"hosts.yaml not reloaded: {exc}") from exc
+    return JSONResponse(content=result)
+
+
+# Run id -> state of the most recent update runs (oldest first); one runs at a time.
+UPDATE_RUNS: Dict[str, Dict[str, Any]] = {}
+UPDATE_RUNS_KEPT = 10
+_UPDATE_TASK: Optional[asyncio.Task] = None
+
+
+def plan_update_waves(targets: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split update targets into a canary wave followed by ``wave_size`` waves.
+
+    Hosts with ``update_canary: true`` form the canary wave; without any, the
+    first ``canary_hosts`` targets in config order do. Hosts without an SSH
+    target are dropped first: they would only come back skipped, and a canary
+    that never ran proves nothing.
+    """
+    targets = [host_cfg for host_cfg in targets if _has_ssh_target(host_cfg)]
+    canaries = [host_cfg for host_cfg in targets if host_cfg.get("update_canary")]
+    if not canaries:
+        canaries = targets[:UPDATE_CANARY_HOSTS]
+    rest = [host_cfg for host_cfg in targets if host_cfg not in canaries]
+    waves = [canaries] if canaries else []
+    waves.extend(rest[index:index + UPDATE_WAVE_SIZE] for index in range(0, len(rest), UPDATE_WAVE_SIZE))
+    return waves
+
+
+async def _timed_update(host_cfg: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    async with semaphore:
+        started = time.monotonic()
+        result = await _run_remote_update(host_cfg)
+        result["duration_seconds"] = round(time.monotonic() - started, 3)
+        return result
+
+
+def _summarize_wave(
+    index: int,
+    canary: bool,
+    results: List[Dict[str, Any]],
+    started: float,
+) -> Dict[str, Any]:
+    duration = time.monotonic() - started
+    finished = [result for result in results if result["status"] != "skipped"]
+    slowest = max(finished, key=lambda result: result["duration_seconds"], default=None)
+    return {
+        "wave": index,
+        "canary": canary,
+        "hosts": [result["host"] for result in results],
+        "succeeded": sum(1 for result in results if result["status"] == "success"),
+        "failed": sum(1 for result in results if result["status"] == "error"),
+        "skipped": len(results) - len(finished),
+        "duration_seconds": round(duration, 3),
+        "hosts_per_minute": round(len(finished) * 60 / duration, 2) if duration > 0 else None,
+        "slowest_host": slowest["host"] if slowest else None,
+    }
+
+
+async def orchestrate_updates(run: Dict[str, Any], targets: List[Dict[str, Any]]) -> None:
+    """Update hosts in waves, at most ``concurrency`` at a time, recording progress in ``run``.
+
+    The canary wave runs first; any failure in it, or no success at all,
+    stops the run. After each later wave the run stops if more than
+    ``abort_failure_ratio`` of the hosts attempted so far failed. Hosts that
+    never ran are reported as skipped with reason ``aborted``. A run whose
+    last wave trips either check ends ``failed`` rather than ``finished``.
+    """
+    semaphore = asyncio.Semaphore(UPDATE_CONCURRENCY)
+    waves = plan_update_waves(targets)
+    run_started = time.monotonic()
+    results: List[Dict[str, Any]] = run["results"]
+    run["planned_waves"] = len(waves)
+    canary_wave = UPDATE_CANARY_HOSTS > 0 or any(host_cfg.get("update_canary") for host_cfg in targets)
+    failed_reason = None
+    try:
+        for index, wave in enumerate(waves):
+            canary = index == 0 and canary_wave
+            started = time.monotonic()
+            wave_results = list(await asyncio.gather(*[_timed_update(cfg, semaphore) for cfg in wave]))
+            results.extend(wave_results)
+            summary = _summarize_wave(index, canary, wave_results, started)
+            run["waves"].append(summary)
+            LOGGER.info(
+                "Update wave %d/%d: %d ok, %d failed in %.1fs",
+                index + 1, len(waves), summary["succeeded"], summary["failed"], summary["duration_seconds"],
+            )
+            attempted = sum(1 for result in results if result["status"] != "skipped")
+            failed = sum(1 for result in results if result["status"] == "error")
+            reason = None
+            if canary and summary["failed"]:
+                reason = f"{summary['failed']} canary host(s) failed"
+            elif canary and not summary["succeeded"]:
+                reason = "no canary host was updated"
+            elif attempted and failed / attempted > UPDATE_ABORT_FAILURE_RATIO:
+                reason = f"{failed}/{attempted} hosts failed (limit {UPDATE_ABORT_FAILURE_RATIO:.0%})"
+            if reason and index + 1 < len(waves):
+                run.update({"aborted": True, "abort_reason": reason})
+                LOGGER.warning("Stopping updates after wave %d: %s", index + 1, reason)
+                results.extend(
+                    {"host": host_cfg["name"], "status": "skipped", "action": "update", "reason": "aborted"}
+                    for later in waves[index + 1:]
+                    for host_cfg in later
+                )
+                break
+            failed_reason = reason
+        if run["aborted"]:
+            run["state"] = "aborted"
+        elif failed_reason:
+            run.update({"state": "failed", "abort_reason": failed_reason})
+        else:
+            run["state"] = "finished"
+    except asyncio.CancelledError:
+        run["state"] = "cancelled"
+        raise
+    except Exception as exc:  # pragma: no cover - keep the run record honest
+        LOGGER.exception("Update run %s failed", run["run_id"])
+        run.update({"state": "failed", "abort_reason": str(exc)})
+    finally:
+        run["finished_at"] = current_timestamp()
+        run["duration_seconds"] = round(time.monotonic() - run_started, 3)
+
+
+def start_update_run(targets: List[Dict[str, Any]], fleet: Optional[str] = None) -> Dict[str, Any]:
+    """Start an update run in the background and return its (live) state."""
+    global _UPDATE_TASK
+    run_id = secrets.token_hex(6)
+    run: Dict[str, Any] = {
+        "run_id": run_id,
+        "state": "running",
+        "fleet": fleet,
+        "started_at": current_timestamp(),
+        "finished_at": None,
+        "requested": len(targets),
+        "hosts": [host_cfg["name"] for host_cfg in targets],
+        "planned_waves": len(plan_update_waves(targets)),
+        "waves": [],
+        "results": [],
+        "aborted": False,
+        "abort_reason": None,
+        "duration_seconds": None,
+        "settings": {
+            "concurrency": UPDATE_CONCURRENCY,
+            "wave_size": UPDATE_WAVE_SIZE,
+            "canary_hosts": UPDATE_CANARY_HOSTS,
+            "host_timeout_seconds": UPDATE_HOST_TIMEOUT_SECONDS,
+            "abort_failure_ratio": UPDATE_ABORT_FAILURE_RATIO,
+        },
+    }
+    UPDATE_RUNS[run_id] = run
+    while len(UPDATE_RUNS) > UPDATE_RUNS_KEPT:
+        del UPDATE_RUNS[next(iter(UPDATE_RUNS))]
+    _UPDATE_TASK = asyncio.create_task(orchestrate_updates(run, targets))
+    return run
+
+
+async def cancel_update_run() -> None:
+    """Cancel a running update run, e.g. on shutdown."""
+    task = _UPDATE_TASK
+    if task is not None and not task.done():
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+async def _update_response(fleet: Optional[str] = None) -> JSONResponse:
+    snapshot = await get_snapshot()
+    targets = _online_update_hosts(snapshot.results, fleet)
+    if not targets:
+        return JSONResponse(content={
+            "requested": 0,
+            "results": [],
+        })
+    if _UPDATE_TASK is not None and not _UPDATE_TASK.done():
+        raise HTTPException(status_code=409, detail="An update run is already in progress")
+    run = start_update_run(targets, fleet)
+    return JSONResponse(status_code=202, content={
+        "run_id": run["run_id"],
+        "state": run["state"],
+        "requested": run["requested"],
+        "planned_waves": run["planned_waves"],
+        "status_url": f"/updates/{run['run_id']}",
+    })
+
+
+@APP.get("/updates", response_class=JSONResponse)
+async def update_run() -> JSONResponse:
+    """The running update run, or the outcome of the last one."""
+    if not UPDATE_RUNS:
+        return JSONResponse(content={"state": "idle"})
+    return JSONResponse(content=UPDATE_RUNS[next(reversed(UPDATE_RUNS))])
+
+
+@APP.get("/updates/{run_id}", response_class=JSONResponse)
+async def update_run_by_id(run_id: str) -> JSONResponse:
+    """Progress or outcome of one of the recent update runs."""
+    run = UPDATE_RUNS.get(run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Update run not found")
+    return JSONResponse(content=run)
+
+
+@APP.post("/updates", response_class=JSONResponse)
+async def trigger_updates() -> JSONResponse:
+    """Start updating every online, update-capable host in canary-first, bounded waves.
+
+    Answers 202 with the run id straight away; poll ``/updates/{run_id}``.
+    """
+    return await _update_response()
+
+
+@APP.post("/fleets/{fleet}/updates", response_class=JSONResponse)
+async def trigger_fleet_updates(fleet: str) -> JSONResponse:
+    """Start an update run limited to the online, update-capable hosts of one fleet."""
+    return await _update_response(_fleet_or_404(fleet))
+
+
+def _check_remote_action(host_cfg: Dict[str, Any], x_auth_token: Optional[str]) -> None:
+    """Reject a reboot the host's profile or settings do not allow."""
+    if not _host_profile(host_cfg)["guarded_actions"]:
+        if host_cfg.get("update_disabled"):
+            raise HTTPException(status_code=400, detail="Host updates disabled")
+        return
+    if not bool(host_cfg.get("remote_actions_enabled", REMOTE_ACTIONS_ENABLED)):
+        raise HTTPException(status_code=403, detail="Remote actions are disabled")
+    token = str(host_cfg.get("remote_actions_token", "") or "").strip() or REMOTE_ACTIONS_TOKEN
+    if token:
+        candidate = (x_auth_token or "").strip()
+        if not candidate or not secrets.compare_digest(candidate, token):
+            raise HTTPException(status_code=403, detail="Invalid auth token")
+
+
+@APP.post("/hosts/{slug}/reboot", response_class=JSONResponse)
+async def reboot_host(
+    slug: str,
+    x_auth_token: Optional[str] = Header(default=None, alias="X-Auth-Token"),
+) -> JSONResponse:
+    """Reboot a single host via SSH."""
+    host_cfg = HOST_LOOKUP.get(slug)
+    if not host_cfg:
+        raise HTTPException(status_code=404, detail="Host not found")
+    _check_remote_action(host_cfg, x_auth_token)
+    result = await _run_remote_reboot(host_cfg)
+    return JSONResponse(content=result)
+
+
+@APP.post("/hosts/{slug}/restart", response_class=JSONResponse)
+async def restart_host(slug: str) -> JSONResponse:
+    """Restart the monitoring service on a single host via SSH."""
+    host_cfg = HOST_LOOKUP.get(slug)
+    if not host_cfg:
+        raise HTTPException(status_code=404, detail="Host not found")
+    if not _host_profile(host_cfg)["restart"]:
+        raise HTTPException(status_code=400, detail="Host profile has no restart action")
+    if host_cfg.get("restart_disabled"):
+        raise HTTPException(status_code=400, detail="Host restart disabled")
+    result = await _run_remote_restart(host_cfg)
+    return JSONResponse(content=result)
@@ -0,0 +1,23 @@
+"""Point the dashboard at a throwaway hosts file before it is imported."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+_SCRATCH = Path(tempfile.mkdtemp(prefix="fleet-dashboard-tests-"))
+(_SCRATCH / "hosts.yaml").write_text(
+    "refresh_seconds: 60\n"
+    "timeout_seconds: 1\n"
+    "fetch_mode: full\n"
+    "hosts:\n"
+    "  - name: Live\n"
+    "    url: http://127.0.0.1:9\n"
+    "    ssh_disabled: true\n"
+    "  - name: Dead\n"
+    "    url: http://127.0.0.1:9\n"
+    "    ssh_disabled: true\n"
+)
+os.environ["FLEET_DASHBOARD_CONFIG"] = str(_SCRATCH / "hosts.yaml")
+os.environ["FLEET_DASHBOARD_PROFILE"] = "coaches"
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
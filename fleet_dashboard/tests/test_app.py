@@ -0,0 +1,924 @@
+import asyncio
+import gzip
+import json
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from fleet_dashboard import app
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    app._SNAPSHOT = None
+    app.HOST_SCHEDULES.clear()
+    app.HOST_TRACES.clear()
+    app.COACH_STATS_CACHE.clear()
+    app._CARD_CACHE.clear()
+    app._ENCODED_CACHE.clear()
+    app._RENDER_CACHE.clear()
+    app._FLEET_SUMMARY_CACHE.clear()
+    yield
+    app._SNAPSHOT = None
+    app.COACH_STATS_CACHE.clear()
+
+
+def test_unchanged_host_keeps_its_version(monkeypatch):
+    real_fetch_host = app.fetch_host
+    fetches = []
+
+    async def fetch_host(client, host_cfg):
+        if host_cfg["name"] == "Dead":
+            return await real_fetch_host(client, host_cfg)
+        fetches.append(host_cfg["name"])
+        return host_cfg["name"], {
+            "cpu": {"total": 12.5},
+            "mem": {"percent": 40.0},
+            "__fetched_at": app.current_timestamp(),
+            "__fetch_seconds": 0.001 * len(fetches),
+        }
+
+    monkeypatch.setattr(app, "fetch_host", fetch_host)
+
+    async def poll_twice():
+        first = await app.refresh_snapshot(force=True)
+        second = await app.refresh_snapshot(force=True)
+        await app.close_http_client()
+        return first, second
+
+    first, second = asyncio.run(poll_twice())
+    assert fetches == ["Live", "Live"]
+    assert second.version == first.version + 1
+    assert second.host_versions == {"Live": first.version, "Dead": first.version}
+    # The newest poll time is still served, it just does not count as a change.
+    assert dict(second.results)["Live"]["__fetch_seconds"] == 0.002
+    assert second.repolled == ("Live", "Dead")
+
+
+def test_repolled_host_shows_its_new_poll_time():
+    first = app._publish_snapshot(None, [("Live", {"cpu": {"total": 1.0}, "__fetched_at": "10:00:00"})])
+    assert "10:00:00" in app.render_host_card(first, "Live", dict(first.results)["Live"])
+    second = app._publish_snapshot(first, [("Live", {"cpu": {"total": 1.0}, "__fetched_at": "10:05:00"})])
+    assert second.host_versions["Live"] == first.version
+    assert "10:05:00" in app.render_host_card(second, "Live", dict(second.results)["Live"])
+    events = list(app._snapshot_events(second, first.version))
+    assert len(events) == 1 and events[0].startswith("event: meta")
+    assert '"polled":{"live":"10:05:00"}' in events[0]
+
+
+def test_coach_stats_not_recollected_within_ttl(monkeypatch):
+    host_cfg = {
+        "name": "Coach",
+        "url": "http://127.0.0.1:9",
+        "coach_stats": {"enabled": True, "ttl_seconds": {"coach": 3600, "ha": 3600}},
+    }
+    runs = []
+
+    async def fetch_coach_stats(cfg):
+        runs.append(cfg["name"])
+        return {
+            "timestamp": f"2026-01-01T00:00:0{len(runs)}",
+            "instance": "coach",
+            "coach": {"owner": "Coach 12"},
+            "ha": {"version": "2026.1"},
+        }
+
+    monkeypatch.setattr(app, "fetch_coach_stats", fetch_coach_stats)
+
+    async def poll_twice():
+        first = await app.collect_coach_stats(host_cfg)
+        second = await app.collect_coach_stats(host_cfg)
+        return first, second
+
+    first, second = asyncio.run(poll_twice())
+    # timestamp/instance have no TTL of their own, so they must not force a second ssh run.
+    assert runs == ["Coach"]
+    assert second["coach"] == {"owner": "Coach 12"}
+    assert second["timestamp"] == first["timestamp"]
+
+
+def _update_hosts(*names, **extra):
+    return [{"name": name, "url": f"http://{name.lower()}:61208", **extra.get(name, {})} for name in names]
+
+
+def _run_updates(monkeypatch, targets, outcomes):
+    ran = []
+
+    async def run_remote_update(host_cfg):
+        ran.append(host_cfg["name"])
+        return {"host": host_cfg["name"], "status": outcomes.get(host_cfg["name"], "success"), "action": "update"}
+
+    monkeypatch.setattr(app, "_run_remote_update", run_remote_update)
+
+    async def run():
+        record = app.start_update_run(targets)
+        await app._UPDATE_TASK
+        return record
+
+    return asyncio.run(run()), ran
+
+
+def test_update_waves_put_a_reachable_canary_first(monkeypatch):
+    monkeypatch.setattr(app, "UPDATE_CANARY_HOSTS", 1)
+    monkeypatch.setattr(app, "UPDATE_WAVE_SIZE", 2)
+    targets = _update_hosts("A", "B", "C", "D", "E", A={"ssh_disabled": True}, D={"update_canary": True})
+    waves = app.plan_update_waves(targets)
+    assert [[host_cfg["name"] for host_cfg in wave] for wave in waves] == [["D"], ["B", "C"], ["E"]]
+    waves = app.plan_update_waves([host_cfg for host_cfg in targets if host_cfg["name"] != "D"])
+    assert [[host_cfg["name"] for host_cfg in wave] for wave in waves] == [["B"], ["C", "E"]]
+
+
+def test_failed_canary_stops_the_run(monkeypatch):
+    monkeypatch.setattr(app, "UPDATE_CANARY_HOSTS", 1)
+    monkeypatch.setattr(app, "UPDATE_WAVE_SIZE", 2)
+    run, ran = _run_updates(monkeypatch, _update_hosts("A", "B", "C"), {"A": "error"})
+    assert ran == ["A"]
+    assert run["state"] == "aborted"
+    assert run["abort_reason"] == "1 canary host(s) failed"
+    assert [(result["host"], result["status"]) for result in run["results"]] == [
+        ("A", "error"), ("B", "skipped"), ("C", "skipped"),
+    ]
+
+
+def test_canary_that_never_updated_stops_the_run(monkeypatch):
+    monkeypatch.setattr(app, "UPDATE_CANARY_HOSTS", 1)
+    run, ran = _run_updates(monkeypatch, _update_hosts("A", "B"), {"A": "skipped"})
+    assert ran == ["A"]
+    assert run["state"] == "aborted"
+    assert run["abort_reason"] == "no canary host was updated"
+
+
+def test_failures_in_the_last_wave_fail_the_run(monkeypatch):
+    monkeypatch.setattr(app, "UPDATE_CANARY_HOSTS", 1)
+    monkeypatch.setattr(app, "UPDATE_WAVE_SIZE", 4)
+    monkeypatch.setattr(app, "UPDATE_ABORT_FAILURE_RATIO", 0.25)
+    run, ran = _run_updates(monkeypatch, _update_hosts("A", "B", "C", "D"), {"C": "error", "D": "error"})
+    assert ran == ["A", "B", "C", "D"]
+    assert not run["aborted"]
+    assert run["state"] == "failed"
+    assert run["abort_reason"].startswith("2/4 hosts failed")
+    clean, _ran = _run_updates(monkeypatch, _update_hosts("A", "B"), {})
+    assert clean["state"] == "finished"
+
+
+class FakeChild:
+    """A child dashboard answering /status from a canned host map."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.version = 7
+        self.requests = []
+        self.down = False
+
+    def __call__(self, request):
+        self.requests.append(request)
+        if self.down:
+            raise httpx.ConnectError("child is down", request=request)
+        since = request.url.params.get("since")
+        etag = f'W/"{self.version}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, headers={"ETag": etag}, json={
+            "version": self.version,
+            "since": int(since) if since is not None else None,
+            "config_generation": 1,
+            "hosts": self.hosts,
+        })
+
+
+@pytest.fixture
+def child(monkeypatch):
+    fake = FakeChild({
+        # A newer child may send metric fields this instance has never heard of.
+        "c-1": {"version": 7, "payload": {"__fetched_at": "t1"}, "metrics": {"cpu_percent": 12.0, "gpu_percent": 3}},
+        "c-2": {"version": 7, "payload": {}, "metrics": ["not", "a", "mapping"]},
+    })
+    client = httpx.AsyncClient(transport=httpx.MockTransport(fake))
+    monkeypatch.setattr(app, "get_http_client", lambda: client)
+    spec = {"name": "child", "profile": "federated", "upstream": "http://child:8000", "hosts": []}
+    monkeypatch.setitem(app.FLEETS, "child", spec)
+    upstream = app.Upstream(spec)
+    monkeypatch.setitem(app.UPSTREAMS, "child", upstream)
+    yield fake, upstream
+    for name in ("c-1", "c-2"):
+        app.HOST_METADATA.pop(name, None)
+        app.HISTORY.pop(name, None)
+
+
+def test_upstream_pull_keeps_known_metrics_and_skips_bad_hosts(child):
+    fake, upstream = child
+    asyncio.run(app.pull_upstream(upstream))
+    assert upstream.hosts == ["c-1"]
+    snapshot = app._SNAPSHOT
+    assert dict(snapshot.results)["c-1"]["__upstream"] == "child"
+    assert snapshot.metrics["c-1"].cpu_percent == 12.0
+    assert app.ERROR_COUNTS[("child", "upstream", "TypeError")] >= 1
+
+
+def test_upstream_pulls_deltas_and_recovers_from_staleness(child):
+    fake, upstream = child
+    asyncio.run(app.pull_upstream(upstream))
+    asyncio.run(app.pull_upstream(upstream))
+    assert "since" not in fake.requests[0].url.params
+    assert fake.requests[1].url.params["since"] == "7"
+    assert fake.requests[1].headers["If-None-Match"] == 'W/"7"'
+    version = app._SNAPSHOT.version
+
+    fake.down = True
+    asyncio.run(app.pull_upstream(upstream))
+    upstream.last_success_at -= 3 * upstream.interval + upstream.timeout
+    asyncio.run(app.mark_stale_upstream(upstream))
+    assert app._SNAPSHOT.version == version + 1
+    assert "child is down" in dict(app._SNAPSHOT.results)["c-1"]["__stale"]
+
+    fake.down = False
+    asyncio.run(app.pull_upstream(upstream))
+    # Recovering pulls everything again, which replaces the stale notes.
+    assert "since" not in fake.requests[-1].url.params
+    assert not upstream.marked_stale
+    assert "__stale" not in dict(app._SNAPSHOT.results)["c-1"]
+
+
+def test_status_projects_federated_hosts(child):
+    fake, upstream = child
+    asyncio.run(app.pull_upstream(upstream))
+    client = TestClient(app.APP)
+    response = client.get("/status", params={"hosts": "c-1", "fields": "metrics"})
+    assert response.status_code == 200
+    assert list(response.json()["hosts"]) == ["c-1"]
+    assert response.json()["hosts"]["c-1"]["metrics"]["cpu_percent"] == 12.0
+    history = client.get("/hosts/c-1/history", params={"metric": "cpu"})
+    assert history.status_code == 200
+    assert history.json()["hosts"]["c-1"]["cpu"]["value"] == [12.0]
+    assert client.get("/status", params={"hosts": "c-9"}).status_code == 404
+
+
+class FakeSsh:
+    def __init__(self, returncode, stdout=b"", stderr=b""):
+        self.returncode = returncode
+        self.output = (stdout, stderr)
+
+    async def communicate(self):
+        return self.output
+
+
+@pytest.mark.parametrize("process, ssh_port, expected", [
+    (FakeSsh(255, stderr=b"Connection refused"), 2222, "ssh"),
+    (FakeSsh(3, stderr=b"no such command"), 2222, "exit"),
+    (FakeSsh(0, stdout=b"Welcome!\nnot json"), 2222, "parse"),
+    (FakeSsh(0, stdout=b"{}"), "not-a-port", "other"),
+])
+def test_coach_stats_errors_use_fixed_labels(monkeypatch, process, ssh_port, expected):
+    host_cfg = {
+        "name": "Coach",
+        "url": "http://127.0.0.1:9",
+        "coach_stats": {"enabled": True, "command": "coach-stats", "multiplex": False, "ssh_port": ssh_port},
+    }
+
+    async def create_subprocess_exec(*args, **kwargs):
+        return process
+
+    monkeypatch.setattr(app.asyncio, "create_subprocess_exec", create_subprocess_exec)
+    monkeypatch.setattr(app, "ERROR_COUNTS", {})
+    asyncio.run(app.collect_coach_stats(host_cfg))
+    assert list(app.ERROR_COUNTS) == [("Coach", "coach_stats", expected)]
+
+
+def test_pending_update_counts_expire_on_their_own_ttl(monkeypatch):
+    host_cfg = {
+        "name": "Coach",
+        "url": "http://127.0.0.1:9",
+        # The config only sets long TTLs; ``updates`` falls back to its built-in default.
+        "coach_stats": {"enabled": True, "ttl_seconds": {"coach": 86400}},
+    }
+    runs = []
+
+    async def fetch_coach_stats(cfg):
+        runs.append(cfg["name"])
+        return {"coach": {"owner": "Coach 12"}, "updates": {"apt_pending": len(runs)}}
+
+    monkeypatch.setattr(app, "fetch_coach_stats", fetch_coach_stats)
+    asyncio.run(app.collect_coach_stats(host_cfg))
+    assert not app._coach_stats_due(host_cfg)
+    updates = app.COACH_STATS_CACHE["Coach"]["updates"]
+    updates["collected_at"] -= app.COACH_STATS_DEFAULT_TTLS["updates"]
+    assert app._coach_stats_due(host_cfg)
+    stats = asyncio.run(app.collect_coach_stats(host_cfg))
+    assert runs == ["Coach", "Coach"]
+    assert stats["updates"] == {"apt_pending": 2}
+
+
+def _hosts_yaml(names, **settings):
+    lines = [f"{key}: {value}" for key, value in settings.items()] + ["hosts:"]
+    for name in names:
+        lines += [f"  - name: {name}", "    url: http://127.0.0.1:9", "    ssh_disabled: true"]
+    return "\n".join(lines) + "\n"
+
+
+@pytest.fixture
+def reload_env(tmp_path, monkeypatch):
+    """Reload from a scratch config, restoring the import-time fleet afterwards."""
+    config_path = tmp_path / "hosts.yaml"
+    monkeypatch.setattr(app, "CONFIG_PATH", config_path)
+    monkeypatch.setitem(app.CONFIG, "hosts", list(app.CONFIG["hosts"]))
+    for name in ("CONFIG_GENERATION", "_CONFIG_STAMP", "HTTP_MAX_CONNECTIONS", "HTTP_MAX_KEEPALIVE_CONNECTIONS"):
+        monkeypatch.setattr(app, name, getattr(app, name))
+    saved = [(mapping, dict(mapping)) for mapping in (app.HOST_LOOKUP, app.HOST_METADATA, app.FLEETS, app.RELOAD_STATE)]
+    polls = []
+
+    async def refresh_snapshot(*args, **kwargs):
+        polls.append([host_cfg["name"] for host_cfg in app.CONFIG["hosts"]])
+
+    monkeypatch.setattr(app, "refresh_snapshot", refresh_snapshot)
+    yield config_path, polls
+    for mapping, contents in saved:
+        mapping.clear()
+        mapping.update(contents)
+
+
+def test_reload_reconciles_hosts_incrementally(reload_env):
+    config_path, polls = reload_env
+    config_path.write_text(_hosts_yaml(["A", "B", "C"]))
+    asyncio.run(app.reload_config())
+    generation = app.CONFIG_GENERATION
+    schedules = {name: object() for name in ("A", "B", "C")}
+    app.HOST_SCHEDULES.update(schedules)
+    polls.clear()
+
+    config_path.write_text(_hosts_yaml(["A", "B", "D"]).replace(
+        "name: B\n    url: http://127.0.0.1:9", "name: B\n    url: http://127.0.0.1:10"
+    ))
+    result = asyncio.run(app.reload_config())
+    assert (result["added"], result["removed"], result["changed"]) == (["D"], ["C"], ["B"])
+    assert result["generation"] == generation + 1
+    # Only the untouched host keeps its schedule; the rest start afresh.
+    assert app.HOST_SCHEDULES == {"A": schedules["A"]}
+    assert [host_cfg["url"] for host_cfg in app.CONFIG["hosts"]] == [
+        "http://127.0.0.1:9", "http://127.0.0.1:10", "http://127.0.0.1:9",
+    ]
+    assert set(app.HOST_METADATA) == {"A", "B", "D"}
+    assert polls == [["A", "B", "D"]]
+
+    result = asyncio.run(app.reload_config())
+    assert (result["added"], result["removed"], result["changed"]) == ([], [], [])
+    assert app.CONFIG_GENERATION == generation + 1
+    assert len(polls) == 1
+
+
+def test_fleets_share_one_process_and_are_served_separately(reload_env, monkeypatch):
+    config_path, _polls = reload_env
+    monkeypatch.setattr(app, "_sync_update_aliases", lambda entries: None)
+    config_path.write_text(
+        "fleets:\n"
+        "  - name: coaches\n    profile: coaches\n    hosts_file: coaches.yaml\n"
+        "  - name: pis\n    profile: raspberry\n    hosts_file: pis.yaml\n"
+    )
+    (config_path.parent / "coaches.yaml").write_text(_hosts_yaml(["C-1", "C-2"]))
+    (config_path.parent / "pis.yaml").write_text(_hosts_yaml(["P-1"]))
+    asyncio.run(app.reload_config())
+    assert {name: fleet["hosts"] for name, fleet in app.FLEETS.items()} == {
+        "coaches": ["C-1", "C-2"], "pis": ["P-1"],
+    }
+    assert app.HOST_METADATA["P-1"]["profile"] == "raspberry"
+    app._publish_snapshot(None, [(name, {"cpu": {"total": 5.0}}) for name in ("C-1", "C-2", "P-1")])
+
+    client = TestClient(app.APP)
+    fleets = client.get("/fleets").json()["fleets"]
+    assert [(fleet["name"], fleet["summary"].split(" ")[0]) for fleet in fleets] == [
+        ("coaches", "2/2"), ("pis", "1/1"),
+    ]
+    assert list(client.get("/fleets/pis/status").json()["hosts"]) == ["P-1"]
+    assert client.get("/fleets/nope/status").status_code == 404
+
+    # Host names stay unique across fleets.
+    (config_path.parent / "pis.yaml").write_text(_hosts_yaml(["C-1"]))
+    with pytest.raises(ValueError, match="Duplicate host name"):
+        asyncio.run(app.reload_config())
+
+
+def test_fleet_hosts_file_warns_about_process_wide_keys(tmp_path, monkeypatch, caplog):
+    (tmp_path / "fleets.yaml").write_text(
+        "fleets:\n  - name: coaches\n    profile: coaches\n    hosts_file: coaches.yaml\n"
+    )
+    (tmp_path / "coaches.yaml").write_text(
+        "store:\n  path: metrics.sqlite3\n"
+        "http:\n  max_connections: 4\n"
+        "refresh_seconds: 120\n"
+        "coach_stats:\n  ttl_seconds:\n    coach: 60\n"
+        + _hosts_yaml(["C-1"])
+    )
+    monkeypatch.setattr(app, "CONFIG_PATH", tmp_path / "fleets.yaml")
+    with caplog.at_level("WARNING", logger="fleet_dashboard"):
+        config, *_ = app.parse_config()
+    ignored = sorted(record.args[1] for record in caplog.records)
+    assert ignored == ["http", "store"]
+    host_cfg = config["hosts"][0]
+    assert host_cfg["poll_seconds"] == 120
+    assert app._coach_stats_ttls(host_cfg)["coach"] == 60
+
+
+def test_reload_resizes_the_http_pool(reload_env):
+    config_path, _polls = reload_env
+    config_path.write_text(_hosts_yaml([f"H-{index}" for index in range(20)], fetch_mode="full"))
+
+    async def reload():
+        old_client = app.get_http_client()
+        await app.reload_config()
+        new_client = app.get_http_client()
+        await app.close_http_client()
+        return old_client, new_client
+
+    old_client, new_client = asyncio.run(reload())
+    assert app.HTTP_MAX_CONNECTIONS == 20 * app.PLUGIN_CONCURRENCY + 10
+    assert old_client.is_closed
+    assert new_client is not old_client
+
+
+def _stream_parse(body, chunk_size, wanted=("cpu", "mem")):
+    parser = app.SelectiveObjectParser(wanted)
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+def test_stream_parser_keeps_only_wanted_plugins(chunk_size):
+    body = json.dumps({
+        "processlist": [{"name": 'quote " and brace } in a string', "cmdline": ["a\\\\", "{["]}] * 20,
+        "cpu": {"total": 12.5, "note": "escaped \" quote, then a } brace"},
+        "fs": [{"mnt_point": "/"}],
+        "mem": {"percent": 40.0},
+        "odd \"key\"": {"cpu": 1},
+    }).encode()
+    assert _stream_parse(body, chunk_size) == {
+        "cpu": {"total": 12.5, "note": "escaped \" quote, then a } brace"},
+        "mem": {"percent": 40.0},
+    }
+
+
+@pytest.mark.parametrize("body", [b"null", b"", b'"cpu"', b"[1, 2]", b'{"cpu": {"total": 1', b'{"cpu": 1}{"mem": 2}'])
+def test_stream_parser_rejects_bodies_that_are_not_one_object(body):
+    with pytest.raises(ValueError):
+        _stream_parse(body, 2)
+
+
+def test_waterfalls_name_the_snapshot_each_poll_landed_in():
+    payload = {"__error": "ConnectError: refused", "__fetched_at": "10:00:00"}
+    app._append_trace("Dead", app.HostTrace())
+    first = app._publish_snapshot(None, [("Dead", payload)])
+    app._append_trace("Dead", app.HostTrace())
+    second = app._publish_snapshot(first, [("Dead", {**payload, "__fetched_at": "10:05:00"})])
+    pending = app.HostTrace()
+    app._append_trace("Dead", pending)
+    traces = [trace.as_dict() for trace in app.HOST_TRACES["Dead"]]
+    # The unchanged failure keeps its host version but the poll still names its snapshot.
+    assert [trace["version"] for trace in traces] == [first.version, second.version, None]
+    assert app.render_waterfall("Dead", traces[1])[0].startswith(f"Dead · v{second.version} · ")
+    assert app.render_waterfall("Dead", traces[2])[0].startswith("Dead · no snapshot · ")
+
+
+class FakeGlances:
+    """A Glances API answering every host from one canned /all payload."""
+
+    def __init__(self, payload=None):
+        self.payload = payload or {"cpu": {"total": 12.5}, "mem": {"percent": 40.0}, "load": {"min1": 0.5}}
+        self.paths = []
+        self.down = False
+
+    def __call__(self, request):
+        self.paths.append(request.url.path)
+        if self.down:
+            raise httpx.ConnectError("refused", request=request)
+        plugin = request.url.path.rsplit("/", 1)[-1]
+        if plugin == "all":
+            return httpx.Response(200, json=self.payload)
+        if plugin in self.payload:
+            return httpx.Response(200, json=self.payload[plugin])
+        return httpx.Response(404, json={"detail": "unknown plugin"})
+
+
+def _run_with_glances(glances, work):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(glances)) as client:
+            return await work(client)
+
+    return asyncio.run(run())
+
+
+def test_failing_host_backs_off_then_is_only_probed(monkeypatch):
+    monkeypatch.setattr(app, "SCHEDULER_BACKOFF_BASE_SECONDS", 30)
+    monkeypatch.setattr(app, "SCHEDULER_BACKOFF_MAX_SECONDS", 100)
+    monkeypatch.setattr(app, "SCHEDULER_FAILURE_THRESHOLD", 2)
+    host_cfg = {"name": "Flaky", "url": "http://flaky:61208", "poll_seconds": 60}
+    glances = FakeGlances()
+    glances.down = True
+
+    async def poll(client):
+        delays = []
+        for _ in range(4):
+            started = time.monotonic()
+            await app.poll_host(client, host_cfg)
+            delays.append(round(app.HOST_SCHEDULES["Flaky"].next_poll - started))
+        return delays
+
+    assert _run_with_glances(glances, poll) == [30, 60, 100, 100]
+    # After two failures the host is only probed, never sent a full /all request.
+    assert glances.paths == ["/api/3/all", "/api/3/all", "/api/3/status", "/api/3/status"]
+    assert app.HOST_SCHEDULES["Flaky"].as_dict()["state"] == "probing"
+
+    glances.down = False
+    glances.paths.clear()
+    name, payload = _run_with_glances(glances, lambda client: app.poll_host(client, host_cfg))
+    assert glances.paths == ["/api/3/status", "/api/3/all"]
+    assert payload["cpu"] == {"total": 12.5}
+    assert app.HOST_SCHEDULES["Flaky"].as_dict()["state"] == "healthy"
+    assert app.HOST_SCHEDULES["Flaky"].next_poll - time.monotonic() == pytest.approx(60, abs=1)
+
+
+def test_coach_stats_reuse_one_ssh_master(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "COACH_STATS_CONTROL_DIR", tmp_path)
+    monkeypatch.setattr(app, "SSH_POOL_STATS", {key: 0 for key in app.SSH_POOL_STATS})
+    monkeypatch.setattr(app, "_SSH_MASTERS", {})
+    host_cfg = {
+        "name": "Coach",
+        "url": "http://coach:61208",
+        "coach_stats": {"enabled": True, "command": "coach-stats", "multiplex": True},
+    }
+    calls = []
+
+    class Process:
+        def __init__(self, returncode, stdout=b""):
+            self.returncode = returncode
+            self.stdout = stdout
+
+        async def wait(self):
+            return self.returncode
+
+        async def communicate(self):
+            return self.stdout, b""
+
+    async def create_subprocess_exec(*argv, **kwargs):
+        control_path = next(arg.split("=", 1)[1] for arg in argv if arg.startswith("ControlPath="))
+        if "-N" in argv:
+            calls.append("master")
+            open(control_path, "w").close()
+            return Process(0)
+        if "-O" in argv:
+            calls.append("check")
+            return Process(0)
+        calls.append("command")
+        assert "ControlMaster=no" in argv
+        return Process(0, b'{"coach": {"owner": "Coach 12"}}')
+
+    monkeypatch.setattr(app.asyncio, "create_subprocess_exec", create_subprocess_exec)
+
+    async def collect_twice():
+        return await app.fetch_coach_stats(host_cfg), await app.fetch_coach_stats(host_cfg)
+
+    first, second = asyncio.run(collect_twice())
+    assert calls == ["master", "command", "check", "command"]
+    assert first["__ssh"]["reused"] is False and first["__ssh"]["connect_seconds"] is not None
+    assert second["__ssh"]["reused"] is True
+    assert second["coach"] == {"owner": "Coach 12"}
+    assert app.SSH_POOL_STATS["sessions_opened"] == 1
+    assert app.SSH_POOL_STATS["sessions_reused"] == 1
+    assert len(app._SSH_MASTERS) == 1
+
+
+def test_plugin_mode_refetches_only_expired_plugins(monkeypatch):
+    monkeypatch.setattr(app, "PLUGIN_TTLS", {"cpu": 0, "mem": 0, "fs": 300})
+    monkeypatch.setattr(app, "PLUGIN_CACHE", {})
+    glances = FakeGlances({"cpu": {"total": 5.0}, "mem": {"percent": 20.0}, "fs": [{"mnt_point": "/"}]})
+    host_cfg = {"name": "Pi", "url": "http://pi:61208"}
+
+    async def fetch_twice(client):
+        return await app.fetch_plugins(client, host_cfg), await app.fetch_plugins(client, host_cfg)
+
+    first, second = _run_with_glances(glances, fetch_twice)
+    assert first["__plugins_fetched"] == ["cpu", "fs", "mem"]
+    assert second["__plugins_fetched"] == ["cpu", "mem"]
+    assert second["fs"] == [{"mnt_point": "/"}]
+    assert sorted(glances.paths) == ["/api/3/cpu", "/api/3/cpu", "/api/3/fs", "/api/3/mem", "/api/3/mem"]
+
+
+def test_host_without_plugin_endpoints_falls_back_to_all(monkeypatch):
+    monkeypatch.setattr(app, "PLUGIN_TTLS", {"cpu": 0, "mem": 0})
+    monkeypatch.setattr(app, "PLUGIN_CACHE", {})
+    monkeypatch.setattr(app, "_FULL_FETCH_HOSTS", set())
+    host_cfg = {"name": "Old", "url": "http://old:61208", "fetch_mode": "plugins"}
+    paths = []
+
+    def old_glances(request):
+        paths.append(request.url.path)
+        if request.url.path.endswith("/all"):
+            return httpx.Response(200, json={"cpu": {"total": 5.0}})
+        return httpx.Response(404)
+
+    name, payload = _run_with_glances(old_glances, lambda client: app.fetch_host(client, host_cfg))
+    assert sorted(paths) == ["/api/3/all", "/api/3/cpu", "/api/3/mem"]
+    assert payload["__fetch_mode"] == "full"
+    assert payload["cpu"] == {"total": 5.0}
+    assert app._fetch_mode(host_cfg) == "full"
+
+
+def test_history_ring_keeps_the_newest_samples_and_buckets_them():
+    history = app.HostHistory(depth=4)
+    for second, cpu in enumerate([10.0, 20.0, None, 40.0, 50.0, 60.0]):
+        history.append(1000.0 + second, {"cpu": cpu})
+    assert history.query("cpu") == {"t": [1002.0, 1003.0, 1004.0, 1005.0], "value": [None, 40.0, 50.0, 60.0]}
+    assert history.query("cpu", since=1004.0)["value"] == [50.0, 60.0]
+    buckets = history.query("cpu", bucket_seconds=2)
+    assert buckets["t"] == [1002.0, 1004.0]
+    assert buckets["avg"] == [40.0, 55.0]
+    assert buckets["count"] == [1, 2]
+    assert (buckets["min"], buckets["max"]) == ([40.0, 50.0], [40.0, 60.0])
+
+
+def test_store_rolls_samples_up_into_tiers(tmp_path):
+    tiers = [("raw", 0, 4 * 3600), ("5m", 300, 86400), ("1h", 3600, 30 * 86400)]
+    store = app.MetricsStore(tmp_path / "metrics.sqlite3", tiers)
+    now = time.time()
+    hour = (now // 3600 - 1) * 3600
+    store.write([("Pi", "cpu", hour + 10, 10.0), ("Pi", "cpu", hour + 20, 30.0), ("Pi", "cpu", hour + 400, 50.0)])
+    try:
+        assert store.query("Pi", "cpu", hour, now, "raw")["avg"] == [10.0, 30.0, 50.0]
+        five = store.query("Pi", "cpu", hour, now, "5m")
+        assert five["t"] == [hour, hour + 300]
+        assert (five["avg"], five["min"], five["max"], five["count"]) == ([20.0, 50.0], [10.0, 50.0], [30.0, 50.0], [2, 1])
+        hourly = store.query("Pi", "cpu", hour, now, "1h")
+        assert (hourly["avg"], hourly["count"]) == ([30.0], [3])
+
+        assert store.pick_tier(now - 1800, now) == "raw"
+        assert store.pick_tier(now - 5 * 3600, now) == "5m"
+        assert store.pick_tier(now - 10 * 86400, now) == "1h"
+        assert store.pick_tier(now - 90 * 86400, now) == "1h"
+
+        # Each tier is pruned to its own retention.
+        store.prune(hour + 4 * 3600 + 500)
+        assert store.query("Pi", "cpu", hour, now, "raw")["avg"] == []
+        assert store.query("Pi", "cpu", hour, now, "5m")["count"] == [2, 1]
+    finally:
+        store.close()
+
+
+def test_events_send_only_hosts_changed_since_a_version():
+    first = app._publish_snapshot(None, [
+        ("Live", {"cpu": {"total": 1.0}, "__fetched_at": "10:00:00"}),
+        ("Dead", {"__error": "refused", "__fetched_at": "10:00:00"}),
+    ])
+    second = app._publish_snapshot(first, [("Live", {"cpu": {"total": 2.0}, "__fetched_at": "10:05:00"})])
+    events = list(app._snapshot_events(second, first.version))
+    assert [event.split("\n", 1)[0] for event in events] == ["event: host", "event: meta"]
+    host = json.loads(events[0].split("data: ", 1)[1])
+    assert (host["name"], host["version"], host["ok"]) == ("Live", second.version, True)
+    assert f"id: {second.version}" in events[1]
+    # A client that has seen nothing gets every host.
+    assert len(list(app._snapshot_events(second, 0))) == 3
+
+
+def test_status_answers_etags_and_since_deltas():
+    first = app._publish_snapshot(None, [
+        ("Live", {"cpu": {"total": 1.0}}),
+        ("Dead", {"__error": "refused"}),
+    ])
+    second = app._publish_snapshot(first, [("Live", {"cpu": {"total": 2.0}})])
+    client = TestClient(app.APP)
+    response = client.get("/status")
+    assert response.headers["ETag"] == f'W/"{second.version}"'
+    assert set(response.json()["hosts"]) == {"Live", "Dead"}
+
+    assert client.get("/status", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+    assert client.get("/status", headers={"If-None-Match": f'W/"{first.version}"'}).status_code == 200
+
+    delta = client.get("/status", params={"since": first.version}).json()
+    assert delta["since"] == first.version
+    assert list(delta["hosts"]) == ["Live"]
+    # A version from before a restart is answered in full.
+    full = client.get("/status", params={"since": second.version + 5}).json()
+    assert full["since"] is None and set(full["hosts"]) == {"Live", "Dead"}
+
+
+def test_json_bodies_are_encoded_and_compressed_once_per_version(monkeypatch):
+    monkeypatch.setattr(app, "brotli", None)
+    monkeypatch.setattr(app, "COMPRESSION_MIN_BYTES", 64)
+    snapshot = app._publish_snapshot(None, [("Live", {"cpu": {"total": 1.0}})])
+    builds = []
+
+    def build():
+        builds.append(1)
+        return {"rows": ["x" * 10] * 20}
+
+    async def serve(accept_encoding):
+        return await app.cached_json_response(snapshot, ("test",), build, accept_encoding, {})
+
+    zipped = asyncio.run(serve("br, gzip"))
+    plain = asyncio.run(serve("gzip;q=0"))
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(zipped.body)) == json.loads(plain.body)
+    assert "Content-Encoding" not in plain.headers
+    assert plain.headers["Vary"] == "Accept-Encoding"
+    assert builds == [1]
+
+    small = asyncio.run(app.cached_json_response(snapshot, ("small",), lambda: {}, "gzip", {}))
+    assert small.body == b"{}" and "Content-Encoding" not in small.headers
+
+
+def test_status_projects_fields_hosts_and_plugins():
+    app._publish_snapshot(None, [
+        ("Live", {"cpu": {"total": 1.0}, "mem": {"percent": 40.0}}),
+        ("Dead", {"__error": "refused"}),
+    ])
+    client = TestClient(app.APP)
+    body = client.get("/status", params={"fields": "payload", "hosts": "live", "plugins": "cpu,sensors"}).json()
+    assert body["hosts"] == {"Live": {"payload": {"cpu": {"total": 1.0}}}}
+    full = client.get("/status").json()["hosts"]["Live"]
+    assert set(full) == set(app.STATUS_SECTIONS)
+    response = client.get("/status", params={"fields": "payload,bogus"})
+    assert response.status_code == 400
+    assert "bogus" in response.json()["detail"]
+
+
+def test_views_render_once_per_snapshot_version():
+    first = app._publish_snapshot(None, [("Live", {"cpu": {"total": 1.0}})])
+    renders = []
+
+    def render(snapshot):
+        renders.append(snapshot.version)
+        return f"v{snapshot.version}"
+
+    assert app.cached_render("test", first, render) == app.cached_render("test", first, render)
+    second = app._publish_snapshot(first, [("Live", {"cpu": {"total": 2.0}})])
+    assert app.cached_render("test", second, render) == f"v{second.version}"
+    assert renders == [first.version, second.version]
+
+
+def test_metrics_are_extracted_once_into_typed_fields():
+    metrics = app.extract_metrics({
+        "cpu": {"total": 12.5},
+        "mem": {"percent": 40.0, "used": 1, "total": 4},
+        "fs": [{"percent": 20}, {"percent": 40}],
+        "__coach_stats": {"coach": {"owner": "Sam", "number": 7}, "updates": {"apt": "3"}},
+    })
+    assert (metrics.cpu_percent, metrics.mem_percent, metrics.disk_percent) == (12.5, 40.0, 30.0)
+    assert metrics.updates_apt_pending == 3
+    assert metrics.get("coach_owner") == "Sam" and metrics.get("nonsense", "n/a") == "n/a"
+
+    failed = app.extract_metrics({"__error": "refused", "__coach_stats": {"coach": {"owner": "Sam"}}})
+    assert failed.failed
+    assert failed.as_dict() == {
+        "coach_owner": "Sam", "coach_number": None, "coach_year": None, "coach_collected_at": None,
+    }
+
+
+@pytest.mark.parametrize("backend", ["python", "numpy"])
+def test_fleet_summary_percentiles_and_offenders(monkeypatch, backend):
+    if backend == "numpy":
+        monkeypatch.setattr(app, "np", pytest.importorskip("numpy"))
+    else:
+        monkeypatch.setattr(app, "np", None)
+    monkeypatch.setattr(app, "FLEET_THRESHOLDS", {"cpu": 90.0, "wifi": -80.0})
+    monkeypatch.setattr(app, "FLEET_TOP_N", 2)
+    metrics = {
+        f"pi-{n}": app.HostMetrics(cpu_percent=cpu, wifi_signal=wifi)
+        for n, (cpu, wifi) in enumerate([(10, -50), (20, -85), (30, None), (95, -60)])
+    }
+    metrics["pi-down"] = app.HostMetrics(failed=True)
+    summary = app.summarize_fleet(sorted(metrics), metrics)
+    assert summary["hosts"] == {"total": 5, "online": 4, "offline": 1}
+    cpu = summary["metrics"]["cpu"]
+    assert (cpu["count"], cpu["mean"], cpu["p50"]) == (4, 38.75, 25.0)
+    assert cpu["p95"] == pytest.approx(85.25)
+    assert [top["host"] for top in cpu["top"]] == ["pi-3", "pi-2"]
+    assert cpu["over_threshold"] == ["pi-3"]
+    # Weak signal is the low end.
+    wifi = summary["metrics"]["wifi"]
+    assert wifi["count"] == 3 and wifi["over_threshold"] == ["pi-1"]
+    assert summary["metrics"]["disk"] == {"count": 0}
+    assert summary["line"].startswith("4/5 online · CPU avg 39% (p95 85%)")
+
+
+def test_metrics_endpoint_exposes_hosts_and_histograms(monkeypatch):
+    snapshot = app._publish_snapshot(None, [
+        ("Live", {"cpu": {"total": 12.5}, "mem": {"percent": 40.0}}),
+        ("Dead", {"__error": "refused"}),
+    ])
+    monkeypatch.setitem(app.ERROR_COUNTS, ("Dead", "glances", "connect"), 2)
+    body = TestClient(app.APP).get("/metrics").text
+    live = f'host="Live",fleet="{app.HOST_METADATA["Live"]["fleet"]}"'
+    assert f"fleet_host_up{{{live}}} 1" in body
+    assert "fleet_host_up{host=\"Dead\"" in body and "fleet_host_cpu_percent{host=\"Dead\"" not in body
+    assert f"fleet_host_cpu_percent{{{live}}} 12.5" in body
+    assert f"fleet_snapshot_version {snapshot.version}" in body
+    assert 'fleet_errors_total{host="Dead",source="glances",type="connect"} 2' in body
+
+    histogram = app.Histogram("test_seconds", "Test.", ("host",), buckets=(0.1, 1))
+    histogram.observe(0.05, 'a"b')
+    histogram.observe(5, 'a"b')
+    assert histogram.expose()[2:] == [
+        'test_seconds_bucket{host="a\\"b",le="0.1"} 1',
+        'test_seconds_bucket{host="a\\"b",le="1"} 1',
+        'test_seconds_bucket{host="a\\"b",le="+Inf"} 2',
+        'test_seconds_count{host="a\\"b"} 2',
+        'test_seconds_sum{host="a\\"b"} 5.05',
+    ]
+
+
+class FakeShard:
+    def __init__(self, index, fail=False):
+        self.index = index
+        self.fail = fail
+        self.counters = {}
+        self.polled = []
+
+    async def call(self, command, names):
+        self.polled.append(names)
+        if self.fail:
+            raise ConnectionError(f"shard worker {self.index} exited")
+        return {
+            "records": [
+                (name, {"cpu": {"total": 1.0}}, app.HostMetrics(cpu_percent=1.0), f"schedule {name}", None)
+                for name in names
+            ],
+            "counters": {
+                "errors": {(names[0], "glances", "timeout"): 1},
+                "ssh": {"sessions_opened": 1},
+                "http": {"requests": len(names), "hosts": {}},
+                "fetch": {},
+                "coach_stats": {},
+            },
+        }
+
+
+def test_sharded_polls_go_to_the_owning_worker(monkeypatch):
+    monkeypatch.setattr(app, "SHARD_WORKERS", 3)
+    names = [f"pi-{index}" for index in range(30)]
+    owners = {name: app.shard_index(name) for name in names}
+    assert set(owners.values()) == {0, 1, 2}
+
+    failing = 1
+    workers = [FakeShard(index, fail=index == failing) for index in range(3)]
+    monkeypatch.setattr(app, "SHARDS", workers)
+    monkeypatch.setattr(app, "_ensure_shard_workers", lambda: workers)
+    for name in ("ERROR_COUNTS", "SSH_POOL_STATS"):
+        monkeypatch.setattr(app, name, {})
+    monkeypatch.setattr(app, "HTTP_POOL_STATS", {"hosts": {}})
+    monkeypatch.setattr(app, "_PRECOMPUTED_METRICS", {})
+    results = asyncio.run(app._gather_sharded([{"name": name, "url": "http://127.0.0.1:9"} for name in names]))
+
+    assert [name for name, _ in results] == names
+    for worker in workers:
+        assert sorted(sum(worker.polled, [])) == sorted(name for name in names if owners[name] == worker.index)
+    for name, payload in results:
+        if owners[name] == failing:
+            assert "shard worker" in payload["__error"]
+        else:
+            assert app.HOST_SCHEDULES[name] == f"schedule {name}"
+            assert app._PRECOMPUTED_METRICS[name].cpu_percent == 1.0
+    # Counters are the sum over the workers that answered.
+    assert app.SSH_POOL_STATS["sessions_opened"] == 2
+    assert len(app.ERROR_COUNTS) == 2
+
+
+def test_concurrent_readers_share_one_poll(monkeypatch):
+    fetches = []
+
+    async def fetch_host(client, host_cfg):
+        fetches.append(host_cfg["name"])
+        await asyncio.sleep(0.01)
+        return host_cfg["name"], {"cpu": {"total": 1.0}, "__fetched_at": app.current_timestamp()}
+
+    monkeypatch.setattr(app, "fetch_host", fetch_host)
+
+    async def read_concurrently():
+        snapshots = await asyncio.gather(*(app.get_snapshot() for _ in range(5)))
+        await app.close_http_client()
+        return snapshots
+
+    snapshots = asyncio.run(read_concurrently())
+    assert {snapshot.version for snapshot in snapshots} == {1}
+    assert sorted(fetches) == ["Dead", "Live"]
+    # Endpoints read the cached snapshot instead of polling again.
+    client = TestClient(app.APP)
+    assert client.get("/status").json()["version"] == 1
+    assert client.get("/").status_code == 200
+    assert len(fetches) == 2
+
+
+
+def test_http_client_is_shared_until_closed(monkeypatch):
+    monkeypatch.setattr(app, "HTTP_CONFIG", {})
+
+    async def clients():
+        first = app.get_http_client()
+        again = app.get_http_client()
+        await app.close_http_client()
+        replacement = app.get_http_client()
+        await app.close_http_client()
+        return first, again, replacement
+
+    first, again, replacement = asyncio.run(clients())
+    assert first is again
+    assert first.is_closed and replacement is not first
+    assert app.http_pool_limits(100) == (100 * app.PLUGIN_CONCURRENCY + 10,) * 2